@@ -0,0 +1,8 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    Benchmarks for the confluo service. Run them with ``python -m benchmarks``.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
@@ -0,0 +1,98 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    Run all benchmarks and compare the results to the baseline recorded on this machine.
+    Without a baseline the results are only printed.
+
+        python -m benchmarks [--save] [--baseline FILE] [--quick]
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from . import bench_codecs, bench_routing, bench_service
+
+
+#: Holds the path of the default baseline file.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+#: Holds the relative change which is reported as regression.
+TOLERANCE = 0.1
+
+
+def run_all(quick=False):
+    """Run all benchmarks.
+
+    :param bool quick: flag if fewer operations are run.
+
+    :rtype: list
+    """
+    scale = 10 if quick else 1
+    measurements = []
+    measurements.extend(bench_codecs.run(number=5000 // scale))
+    measurements.extend(bench_routing.run(number=20000 // scale))
+    measurements.extend(bench_service.run(number=2000 // scale))
+    return measurements
+
+
+def compare(measurements, baseline):
+    """Print the measurements and their change compared to the baseline.
+
+    :param list measurements: the measurements of this run.
+    :param dict baseline: the baseline values by measurement name.
+
+    :returns: the names of the regressed measurements.
+    :rtype: list
+    """
+    regressions = []
+    for measurement in measurements:
+        line = "{0:<45} {1:>14.2f} {2:<6}".format(measurement.name, measurement.value, measurement.unit)
+        base = baseline.get(measurement.name)
+        if base:
+            change = (measurement.value - base) / base
+            if measurement.higher_is_better:
+                change = -change
+            line += " {0:>+8.1%}".format(change)
+            if change > TOLERANCE:
+                line += "  REGRESSION"
+                regressions.append(measurement.name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the confluo benchmarks.")
+    parser.add_argument("--save", action="store_true", help="record the results as new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="the baseline file to compare against")
+    parser.add_argument("--quick", action="store_true", help="run fewer operations")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    elif not args.save:
+        # the timings depend on the machine, thus no baseline is shipped.
+        print("No baseline at {0}. Record one on this machine with --save.".format(args.baseline))
+
+    measurements = run_all(args.quick)
+    regressions = compare(measurements, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({m.name: m.value for m in measurements}, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("Saved baseline to {0}".format(args.baseline))
+    elif regressions:
+        print("{0} measurements regressed by more than {1:.0%}.".format(len(regressions), TOLERANCE))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
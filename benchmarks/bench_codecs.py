@@ -0,0 +1,50 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the micro-benchmarks of the message models and codecs.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+from confluo.models import Command
+from confluo.codecs import CODECS, OrjsonCodec, orjson
+
+from .utils import Measurement, per_op
+
+
+#: Holds the body of the benchmarked commands.
+BODY = {
+    "user": {"id": 4711, "name": "Bruce Wayne", "roles": ["admin", "hero"]},
+    "items": [{"sku": "sku-{0}".format(i), "quantity": i, "price": i * 1.5} for i in range(20)],
+}
+
+
+def run(number=5000):
+    """Run the codec benchmarks.
+
+    :param int number: the number of operations per run.
+
+    :rtype: list
+    """
+    command = Command("/orders/create", {"dry": False}, BODY, {"trace": "abc"})
+    measurements = [
+        Measurement("codec.command_str", per_op(lambda: str(command), number), "us/op", False),
+    ]
+
+    codecs = list(CODECS.values())
+    if orjson is not None:
+        # the opt-in orjson codec is not registered.
+        codecs.append(OrjsonCodec())
+    for codec in sorted(codecs, key=lambda c: (c.content_type, type(c).__name__)):
+        name = type(codec).__name__
+        payload = command.dumps(codec)
+        split_payload, envelope_size = command.dumps_split(codec)
+        measurements.extend([
+            Measurement("codec.{0}.command_dumps".format(name), per_op(lambda: command.dumps(codec), number), "us/op", False),
+            Measurement("codec.{0}.command_loads".format(name), per_op(lambda: Command.loads(payload, codec), number), "us/op", False),
+            Measurement("codec.{0}.command_loads_lazy".format(name),
+                        per_op(lambda: Command.loads(split_payload, codec, envelope_size), number), "us/op", False),
+            Measurement("codec.{0}.payload_size".format(name), len(payload), "bytes", False),
+        ])
+    return measurements
@@ -0,0 +1,47 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the micro-benchmarks of the command and event routers.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+from confluo.models import Route
+from confluo.routing import CommandRouter, TopicRouter
+
+from .utils import Measurement, per_op
+
+
+async def _handler(*args, **kwargs):
+    pass
+
+
+def run(number=20000, routes=500):
+    """Run the routing benchmarks.
+
+    :param int number: the number of lookups per run.
+    :param int routes: the number of registered routes of each router.
+
+    :rtype: list
+    """
+    commands = CommandRouter()
+    events = TopicRouter()
+    for i in range(routes):
+        commands.add("/resource{0}/list".format(i), Route("", _handler))
+        commands.add("/resource{0}/{{id:int}}/items/{{item}}".format(i), Route("", _handler))
+        events.add("/resource{0}/created".format(i), Route("", _handler))
+        events.add("/resource{0}/*/updated".format(i), Route("", _handler))
+    events.add("/resource{0}/#".format(routes - 1), Route("", _handler))
+
+    static_path = "/resource{0}/list".format(routes - 1)
+    template_path = "/resource{0}/42/items/abc".format(routes - 1)
+    event_path = "/resource{0}/created".format(routes - 1)
+    wildcard_path = "/resource{0}/42/updated".format(routes - 1)
+    return [
+        Measurement("routing.command_static", per_op(lambda: commands.match(static_path), number), "us/op", False),
+        Measurement("routing.command_template", per_op(lambda: commands.match(template_path), number), "us/op", False),
+        Measurement("routing.command_miss", per_op(lambda: commands.match("/unknown/path"), number), "us/op", False),
+        Measurement("routing.event_exact", per_op(lambda: events.match(event_path), number), "us/op", False),
+        Measurement("routing.event_wildcard", per_op(lambda: events.match(wildcard_path), number), "us/op", False),
+    ]
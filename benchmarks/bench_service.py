@@ -0,0 +1,107 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the end-to-end benchmarks of services connected to an in-memory broker.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import time
+import asyncio
+import logging
+import tracemalloc
+
+from confluo import Service
+
+from . import memamqp
+from .utils import Measurement, percentile
+
+
+async def _call_latency(caller, number):
+    """Measure the round-trip latency of sequential calls."""
+    latencies = []
+    for i in range(number):
+        started = time.perf_counter()
+        await caller.call("Bench-Callee", "/echo", {"i": i})
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return [
+        Measurement("service.call_p50", percentile(latencies, 0.5), "us", False),
+        Measurement("service.call_p99", percentile(latencies, 0.99), "us", False),
+    ]
+
+
+async def _publish_throughput(publisher, subscribers, received, number):
+    """Measure the throughput of events published to all subscribers."""
+    expected = number * len(subscribers)
+    started = time.perf_counter()
+    for i in range(number):
+        await publisher.publish("/bench/fanout", {"i": i})
+    while received[0] < expected:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    return [Measurement("service.publish_fanout", expected / elapsed, "msg/s", True)]
+
+
+async def _transaction_memory(caller, number):
+    """Measure the memory held by every in-flight call."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    # nobody consumes the commands, thus all calls stay in-flight.
+    calls = [asyncio.ensure_future(caller.call("Bench-Nobody", "/void", {"i": i}, timeout=60)) for i in range(number)]
+    await asyncio.sleep(0)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    for call in calls:
+        call.cancel()
+    await asyncio.gather(*calls, return_exceptions=True)
+    return [Measurement("service.inflight_call_memory", size / number, "bytes", False)]
+
+
+async def _run(number, subscribers):
+    memamqp.install()
+    callee = Service("Bench-Callee")
+    caller = Service("Bench-Caller")
+    received = [0]
+
+    @callee.route("/echo")
+    async def echo(path, query, headers, body):
+        return body
+
+    subscriber_services = [Service("Bench-Subscriber-{0}".format(i)) for i in range(subscribers)]
+    for subscriber in subscriber_services:
+        @subscriber.subscribe("/bench/#")
+        async def on_event(path, headers, body):
+            received[0] += 1
+
+    services = [callee, caller] + subscriber_services
+    for service in services:
+        await service.connect()
+
+    measurements = []
+    measurements.extend(await _call_latency(caller, number))
+    measurements.extend(await _publish_throughput(caller, subscriber_services, received, number))
+    measurements.extend(await _transaction_memory(caller, number))
+
+    for service in services:
+        await service.shutdown()
+    return measurements
+
+
+def run(number=2000, subscribers=3):
+    """Run the end-to-end benchmarks.
+
+    :param int number: the number of calls and published events.
+    :param int subscribers: the number of services subscribed to the published events.
+
+    :rtype: list
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(_run(number, subscribers))
+    finally:
+        loop.close()
@@ -0,0 +1,210 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains an in-memory stand-in for the slice of aioamqp used by the service.
+    It routes messages through direct and topic exchanges without a network
+    and awaits the consumer callbacks one after another per connection like aioamqp.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import aioamqp
+
+from confluo.declarations import declarations
+
+
+#: Holds the name of the RabbitMQ direct reply-to pseudo-queue.
+DIRECT_REPLY_TO_QUEUE = "amq.rabbitmq.reply-to"
+
+#: Holds all AMQP basic properties passed to the consumers.
+PROPERTIES = (
+    "content_type", "content_encoding", "headers", "delivery_mode", "priority",
+    "correlation_id", "reply_to", "expiration", "message_id", "timestamp",
+    "type", "user_id", "app_id", "cluster_id",
+)
+
+
+def topic_matches(pattern, routing_key):
+    """Check if an AMQP topic pattern matches a routing key.
+
+    :param str pattern: the binding pattern with ``*`` and ``#`` wildcards.
+    :param str routing_key: the routing key of the message.
+
+    :rtype: bool
+    """
+    def match(words, keys):
+        if not words:
+            return not keys
+        if words[0] == "#":
+            return any(match(words[1:], keys[i:]) for i in range(len(keys) + 1))
+        if not keys:
+            return False
+        return words[0] in ("*", keys[0]) and match(words[1:], keys[1:])
+    return match(pattern.split("."), routing_key.split("."))
+
+
+class MemoryBroker:
+    """Represents an in-memory AMQP broker."""
+    def __init__(self):
+        #: Holds the exchange types by exchange name.
+        self.exchanges = {}
+
+        #: Holds the bindings as tuples of queue name, exchange name and routing key.
+        self.bindings = []
+
+        #: Holds the consumers by queue name.
+        self.consumers = {}
+
+        #: Holds the generator of delivery tags.
+        self.delivery_tags = itertools.count(1)
+
+        #: Holds the number of published messages.
+        self.published = 0
+
+    def route(self, exchange_name, routing_key):
+        """Get the names of the queues a message is routed to.
+
+        :param str exchange_name: the name of the exchange the message is published to.
+        :param str routing_key: the routing key of the message.
+
+        :rtype: list
+        """
+        if not exchange_name:
+            return [routing_key]
+
+        is_topic = self.exchanges.get(exchange_name) == "topic"
+        queues = []
+        for queue_name, bound_exchange_name, binding_key in self.bindings:
+            if bound_exchange_name != exchange_name or queue_name in queues:
+                continue
+            if binding_key == routing_key or (is_topic and topic_matches(binding_key, routing_key)):
+                queues.append(queue_name)
+        return queues
+
+    def deliver(self, channel, payload, exchange_name, routing_key, properties):
+        """Deliver a published message to the consumers of all routed queues.
+
+        :param MemoryChannel channel: the channel the message is published on.
+        :param bytes payload: the AMQP payload.
+        :param str exchange_name: the name of the exchange.
+        :param str routing_key: the routing key of the message.
+        :param dict properties: the AMQP properties of the message.
+        """
+        self.published += 1
+        properties = dict(properties or {})
+        if properties.get("reply_to") == DIRECT_REPLY_TO_QUEUE:
+            properties["reply_to"] = "{0}.{1}".format(DIRECT_REPLY_TO_QUEUE, id(channel))
+
+        amqp_properties = SimpleNamespace(**{name: properties.get(name) for name in PROPERTIES})
+        for queue_name in self.route(exchange_name, routing_key):
+            consumers = self.consumers.get(queue_name)
+            if not consumers:
+                continue
+
+            # the consumers of a queue receive the messages in turn.
+            consumer_channel, callback = consumers[0]
+            consumers.append(consumers.pop(0))
+            envelope = SimpleNamespace(consumer_tag="ctag", delivery_tag=next(self.delivery_tags),
+                                       exchange_name=exchange_name, routing_key=routing_key, is_redeliver=False)
+            consumer_channel.protocol.enqueue(callback, consumer_channel, bytes(payload), envelope, amqp_properties)
+
+
+class MemoryChannel:
+    """Represents a channel on a ``MemoryProtocol``."""
+    def __init__(self, broker, protocol):
+        self.broker = broker
+        self.protocol = protocol
+
+    async def exchange_declare(self, exchange_name, type_name, **kwargs):
+        self.broker.exchanges[exchange_name] = type_name
+
+    async def queue_declare(self, queue_name="", **kwargs):
+        self.broker.consumers.setdefault(queue_name, [])
+        return {"queue": queue_name, "message_count": 0, "consumer_count": 0}
+
+    async def queue_bind(self, queue_name, exchange_name, routing_key, **kwargs):
+        self.broker.bindings.append((queue_name, exchange_name, routing_key))
+
+    async def basic_qos(self, **kwargs):
+        pass
+
+    async def basic_consume(self, callback, queue_name="", **kwargs):
+        if queue_name == DIRECT_REPLY_TO_QUEUE:
+            queue_name = "{0}.{1}".format(DIRECT_REPLY_TO_QUEUE, id(self))
+        self.broker.consumers.setdefault(queue_name, []).append((self, callback))
+        return {"consumer_tag": "ctag"}
+
+    async def basic_client_ack(self, delivery_tag, multiple=False):
+        pass
+
+    async def basic_client_nack(self, delivery_tag, multiple=False, requeue=True):
+        pass
+
+    async def confirm_select(self, **kwargs):
+        pass
+
+    async def basic_publish(self, payload, exchange_name, routing_key, properties=None, **kwargs):
+        self.broker.deliver(self, payload, exchange_name, routing_key, properties)
+
+    async def publish(self, payload, exchange_name, routing_key, properties=None, **kwargs):
+        self.broker.deliver(self, payload, exchange_name, routing_key, properties)
+
+
+class MemoryProtocol:
+    """Represents a connection to a ``MemoryBroker``.
+
+    The consumer callbacks of a connection are awaited one after
+    another by a reader task just like aioamqp does.
+    """
+    def __init__(self, broker):
+        self.broker = broker
+        self.inbox = asyncio.Queue()
+        self.reader = None
+
+    def enqueue(self, callback, *args):
+        if self.reader is None:
+            self.reader = asyncio.ensure_future(self._read())
+        self.inbox.put_nowait((callback, args))
+
+    async def _read(self):
+        while True:
+            callback, args = await self.inbox.get()
+            await callback(*args)
+
+    async def channel(self, **kwargs):
+        return MemoryChannel(self.broker, self)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+
+
+class MemoryTransport:
+    """Represents the transport of a ``MemoryProtocol``."""
+    def close(self):
+        pass
+
+
+def install(broker=None):
+    """Replace ``aioamqp.connect`` with a connect to an in-memory broker.
+
+    :param MemoryBroker broker: the broker to connect to. If no broker is given a new one is created.
+
+    :returns: the broker the services connect to.
+    :rtype: MemoryBroker
+    """
+    broker = broker or MemoryBroker()
+    # a new broker knows none of the declarations remembered by this process.
+    declarations.declared.clear()
+
+    async def connect(host="localhost", *args, **kwargs):
+        return MemoryTransport(), MemoryProtocol(broker)
+
+    aioamqp.connect = connect
+    return broker
@@ -0,0 +1,47 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the helpers shared by all benchmarks.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import time
+from collections import namedtuple
+
+
+#: Represents a single benchmark result.
+Measurement = namedtuple("Measurement", ["name", "value", "unit", "higher_is_better"])
+
+
+def per_op(func, number, repeat=5):
+    """Measure the time of a function call.
+
+    :param callable func: the function to measure.
+    :param int number: the number of calls per run.
+    :param int repeat: the number of runs of which the fastest is taken.
+
+    :returns: the time in microseconds per call.
+    :rtype: float
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / number * 1e6
+
+
+def percentile(values, fraction):
+    """Get the percentile of the given values.
+
+    :param list values: the values.
+    :param float fraction: the percentile as fraction between 0 and 1.
+
+    :rtype: float
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -8,6 +8,8 @@
 __VERSION__ = "0.0.3"
 
 from .core import Service
+from .local import LocalTransport
+from .deadlines import current_deadline, remaining_time
 
 
-__all__ = ["Service"]
+__all__ = ["Service", "LocalTransport", "current_deadline", "remaining_time"]
@@ -0,0 +1,177 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the acknowledger which coalesces message acknowledgements.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from .errors import ServiceError
+
+
+#: Holds all available acknowledgement modes.
+#:  - ``auto``: the broker does not wait for acknowledgements at all.
+#:  - ``before``: a message is acknowledged before its handler is called.
+#:  - ``after``: a message is acknowledged after its handler is finished.
+ACK_MODES = ("auto", "before", "after")
+
+
+def verify_ack_mode(ack_mode):
+    """Verify that the given acknowledgement mode is valid.
+
+    :param str ack_mode: the acknowledgement mode to verify.
+
+    :raises ServiceError: if the acknowledgement mode is unknown.
+    """
+    if ack_mode is not None and ack_mode not in ACK_MODES:
+        raise ServiceError("Unknown ack mode '{0}'. Use one of {1}.".format(ack_mode, ", ".join(ACK_MODES)))
+
+
+class Acknowledger:
+    """Coalesces the acknowledgements of the messages received on a channel.
+
+    The finished messages are acknowledged as soon as the batch size
+    is reached or the interval has passed. All finished messages delivered
+    before the first unfinished message are acknowledged with a single
+    ``multiple`` acknowledgement, the others one by one.
+
+    :param channel: the channel the messages are received on.
+    :param asyncio.BaseEventLoop loop: the event loop to schedule the flush in.
+    :param int batch_size: the number of finished messages which triggers a flush.
+    :param float interval: the maximum time in seconds an acknowledgement is delayed.
+    """
+    def __init__(self, channel, loop, batch_size=32, interval=0.05):
+        #: Holds the channel the messages are received on.
+        self.channel = channel
+
+        #: Holds the asyncio loop
+        self.loop = loop
+
+        #: Holds the number of finished messages which triggers a flush.
+        self.batch_size = batch_size
+
+        #: Holds the maximum time an acknowledgement is delayed.
+        self.interval = interval
+
+        #: Holds the flag if a message is finished by delivery tag in delivery order.
+        self.unacked = {}
+
+        #: Holds the number of finished messages which are not acknowledged yet.
+        self.finished = 0
+
+        #: Holds the timer to flush the acknowledgements.
+        self.timer = None
+
+        #: Holds the functions to call once the acknowledgement of a message is sent by delivery tag.
+        self.callbacks = {}
+
+        #: Holds the flag if the tracked messages were discarded with their channel.
+        self.discarded = False
+
+        #: Holds the lock which serializes the flushes.
+        self.lock = asyncio.Lock()
+
+    def track(self, delivery_tag):
+        """Track a received message which has to be acknowledged.
+
+        :param int delivery_tag: the delivery tag of the message.
+        """
+        self.unacked[delivery_tag] = False
+
+    async def ack(self, delivery_tag):
+        """Mark a tracked message as finished.
+
+        :param int delivery_tag: the delivery tag of the message.
+        """
+        if self.unacked.get(delivery_tag) is not False:
+            return
+
+        self.unacked[delivery_tag] = True
+        self.finished += 1
+        if self.finished >= self.batch_size:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(self.interval, self._on_timer)
+
+    def after_ack(self, delivery_tag, callback):
+        """Call a function once the acknowledgement of a message is sent.
+
+        The function is called immediately if the acknowledgement was already sent
+        and never if the message is discarded, because the broker redelivers it.
+
+        :param int delivery_tag: the delivery tag of the message.
+        :param callable callback: the function to call without arguments.
+        """
+        if self.discarded:
+            return
+
+        if delivery_tag in self.unacked:
+            self.callbacks.setdefault(delivery_tag, []).append(callback)
+        else:
+            callback()
+
+    def discard(self):
+        """Forget all tracked messages because their channel is closed.
+
+        The broker redelivers the messages which were not acknowledged.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.unacked.clear()
+        self.callbacks.clear()
+        self.finished = 0
+        self.discarded = True
+
+    def _on_timer(self):
+        """Flush the acknowledgements after the interval has passed."""
+        self.timer = None
+        self.loop.create_task(self.flush())
+
+    async def flush(self):
+        """Acknowledge all finished messages."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        # a flush which is still sending must finish before the next one collects the finished messages,
+        # otherwise a multiple acknowledgement would cover single acknowledgements which are not sent yet.
+        async with self.lock:
+            if not self.finished:
+                return
+
+            multiple_tag = None
+            single_tags = []
+            contiguous = True
+            for delivery_tag, finished in self.unacked.items():
+                if not finished:
+                    contiguous = False
+                elif contiguous:
+                    multiple_tag = delivery_tag
+                else:
+                    single_tags.append(delivery_tag)
+
+            # forget the acknowledged messages before sending so that the next flush does not ack them twice.
+            acked_tags = []
+            if multiple_tag is not None:
+                for delivery_tag in list(self.unacked):
+                    del self.unacked[delivery_tag]
+                    acked_tags.append(delivery_tag)
+                    if delivery_tag == multiple_tag:
+                        break
+            for delivery_tag in single_tags:
+                del self.unacked[delivery_tag]
+            acked_tags.extend(single_tags)
+            self.finished = 0
+            callbacks = [callback for delivery_tag in acked_tags for callback in self.callbacks.pop(delivery_tag, ())]
+
+            if multiple_tag is not None:
+                await self.channel.basic_client_ack(delivery_tag=multiple_tag, multiple=True)
+            for delivery_tag in single_tags:
+                await self.channel.basic_client_ack(delivery_tag=delivery_tag)
+
+            for callback in callbacks:
+                callback()
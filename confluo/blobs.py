@@ -0,0 +1,161 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the blob stores large message bodies are offloaded to.
+
+    A message whose serialized body exceeds the threshold of a service
+    only carries the envelope and a reference to the body in the blob store.
+    The receiver reads the body from the blob store on first access.
+    The blobs of commands are deleted once they are handled and acknowledged,
+    the blobs of responses once they are read and all other blobs are collected
+    after their time to live.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import re
+import time
+import mmap
+import uuid
+
+from .errors import ServiceError
+
+
+#: Holds the name of the AMQP header which contains the reference to an offloaded body.
+BLOB_HEADER = "x-confluo-blob"
+
+#: Holds the pattern of a valid blob reference of a directory blob store.
+_REFERENCE_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class BlobStore:
+    """Base class of all stores for offloaded message bodies.
+
+    :param float ttl: the time in seconds a blob is kept if it is not deleted.
+    """
+    def __init__(self, ttl=300.0):
+        #: Holds the time a blob is kept if it is not deleted.
+        self.ttl = ttl
+
+    def put(self, data):
+        """Store a blob.
+
+        :param data: the bytes-like data of the blob.
+
+        :returns: the reference to the stored blob.
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    def get(self, reference):
+        """Read a stored blob.
+
+        :param str reference: the reference to the blob.
+
+        :returns: the bytes-like data of the blob.
+
+        :raises ServiceError: if the blob does not exist.
+        """
+        raise NotImplementedError()
+
+    def delete(self, reference):
+        """Delete a stored blob if it still exists.
+
+        :param str reference: the reference to the blob.
+        """
+        raise NotImplementedError()
+
+
+class DirectoryBlobStore(BlobStore):
+    """Stores blobs as files in a directory shared by all services.
+
+    The blobs are read via memory mapping, thus they are not copied
+    until the body is deserialized. The expiry of a blob is stored as
+    its modification time and expired blobs are collected by the writers.
+
+    :param str path: the path of the directory. It is created if it does not exist.
+    :param float ttl: the time in seconds a blob is kept if it is not deleted.
+    :param float collect_interval: the minimum time in seconds between two collections
+                                   of expired blobs. Defaults to half the time to live.
+    """
+    def __init__(self, path, ttl=300.0, collect_interval=None):
+        super().__init__(ttl)
+
+        #: Holds the path of the directory.
+        self.path = path
+
+        #: Holds the minimum time between two collections of expired blobs.
+        self.collect_interval = collect_interval if collect_interval is not None else ttl / 2
+
+        #: Holds the time of the last collection of expired blobs.
+        self.collected_at = time.time()
+
+        os.makedirs(path, exist_ok=True)
+
+    def _blob_path(self, reference):
+        """Get the path of the file of a blob.
+
+        :param str reference: the reference to the blob.
+
+        :rtype: str
+
+        :raises ServiceError: if the reference is invalid.
+        """
+        if not isinstance(reference, str) or not _REFERENCE_PATTERN.match(reference):
+            raise ServiceError("Invalid blob reference '{0}'.".format(reference))
+        return os.path.join(self.path, reference)
+
+    def put(self, data):
+        reference = uuid.uuid4().hex
+        path = self._blob_path(reference)
+        # the blob only becomes visible under its reference once it is complete.
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as blob_file:
+            blob_file.write(data)
+        expires_at = time.time() + self.ttl
+        os.utime(temporary_path, (expires_at, expires_at))
+        os.replace(temporary_path, path)
+
+        if time.time() - self.collected_at >= self.collect_interval:
+            self.collect()
+        return reference
+
+    def get(self, reference):
+        try:
+            with open(self._blob_path(reference), "rb") as blob_file:
+                size = os.fstat(blob_file.fileno()).st_size
+                if not size:
+                    return b""
+                # the mapping stays valid after the file is closed or deleted.
+                return memoryview(mmap.mmap(blob_file.fileno(), size, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            raise ServiceError("Blob '{0}' does not exist or has expired.".format(reference))
+
+    def delete(self, reference):
+        try:
+            os.remove(self._blob_path(reference))
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        """Delete all expired blobs.
+
+        :returns: the number of deleted blobs.
+        :rtype: int
+        """
+        now = self.collected_at = time.time()
+        deleted = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                # an unfinished blob is only collected if its writer died.
+                expires_at = now - self.ttl if entry.name.endswith(".tmp") else now
+                try:
+                    if entry.is_file() and entry.stat().st_mtime <= expires_at:
+                        os.remove(entry.path)
+                        deleted += 1
+                except FileNotFoundError:
+                    # the blob was deleted concurrently.
+                    pass
+        return deleted
@@ -0,0 +1,101 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the caller-side cache for command responses.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+from collections import OrderedDict
+
+
+#: Holds the name of the response header which sets the time in seconds a response may be cached.
+MAX_AGE_HEADER = "x-confluo-max-age"
+
+
+class ResponseCache:
+    """Represents a bounded LRU cache for command responses.
+
+    A response is only cached if it has a max-age header
+    or a time to live is configured for the path of its command.
+    The max-age header takes precedence over the configured time to live.
+
+    :param asyncio.BaseEventLoop loop: the event loop to take the time from.
+    :param int maxsize: the maximum number of cached responses.
+    :param dict ttls: the time to live in seconds by command path.
+    """
+    def __init__(self, loop, maxsize=1024, ttls=None):
+        #: Holds the asyncio loop
+        self.loop = loop
+
+        #: Holds the maximum number of cached responses.
+        self.maxsize = maxsize
+
+        #: Holds the time to live by command path.
+        self.ttls = ttls or {}
+
+        #: Holds the cached responses and their expiry time by key in LRU order.
+        self.entries = OrderedDict()
+
+        #: Holds the number of cache hits.
+        self.hits = 0
+
+        #: Holds the number of cache misses.
+        self.misses = 0
+
+        #: Holds the number of evicted responses.
+        self.evictions = 0
+
+    def get(self, key):
+        """Get the cached response for the given key.
+
+        :param str key: the key of the command.
+
+        :returns: the cached response or ``None``.
+        :rtype: Response
+        """
+        try:
+            response, expires = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expires <= self.loop.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, path, response):
+        """Cache the response of a command if it is cacheable.
+
+        Only successful responses are cached.
+
+        :param str key: the key of the command.
+        :param str path: the path of the command.
+        :param Response response: the received response.
+        """
+        if not 200 <= response.status_code < 300:
+            return
+
+        max_age = response.headers.get(MAX_AGE_HEADER) if response.headers else None
+        ttl = max_age if max_age is not None else self.ttls.get(path)
+        if not ttl or ttl <= 0:
+            return
+
+        self.entries[key] = (response, self.loop.time() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all cached responses."""
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
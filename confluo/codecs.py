@@ -0,0 +1,152 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the codecs used to serialize the messages.
+    The codecs in this module are:
+        - JSONCodec
+        - OrjsonCodec (requires ``orjson``)
+        - MsgpackCodec (requires ``msgpack``)
+
+    Every codec is identified by the content type it produces.
+    The content type is sent in the AMQP ``content_type`` property
+    of every message so that the receiver is able to pick the matching codec.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from .errors import ServiceError
+
+
+class Codec:
+    """Base class for all codecs.
+
+    A codec converts the data of a message to an AMQP payload and back.
+    """
+    #: Holds the content type this codec produces.
+    content_type = None
+
+    def dumps(self, data):
+        """Serialize the given data to an AMQP payload.
+
+        :param data: the data to serialize.
+
+        :returns: the AMQP payload
+        :rtype: bytes
+        """
+        raise NotImplementedError()
+
+    def loads(self, payload):
+        """Deserialize the given AMQP payload.
+
+        :param payload: the received payload as ``bytes`` or ``memoryview``.
+
+        :returns: the deserialized data
+        """
+        raise NotImplementedError()
+
+
+class JSONCodec(Codec):
+    """Codec using the JSON implementation of the standard library."""
+    content_type = "application/json"
+
+    def dumps(self, data):
+        return json.dumps(data).encode("utf-8")
+
+    def loads(self, payload):
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        return json.loads(payload)
+
+
+class OrjsonCodec(Codec):
+    """Codec using the ``orjson`` JSON implementation.
+
+    It produces the same content type as the ``JSONCodec``
+    and is thus interchangeable with it. Data ``orjson`` is not able
+    to serialize, like non-string keys or integers beyond 64 bit,
+    is serialized with the JSON implementation of the standard library.
+    It is not registered by default because ``orjson`` deserializes
+    integers beyond 64 bit as floats.
+    """
+    content_type = "application/json"
+
+    def __init__(self):
+        if orjson is None:
+            raise ServiceError("The 'orjson' package is required for the OrjsonCodec.")
+
+    def dumps(self, data):
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            return json.dumps(data).encode("utf-8")
+
+    def loads(self, payload):
+        return orjson.loads(payload)
+
+
+class MsgpackCodec(Codec):
+    """Codec using the ``msgpack`` binary format."""
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ServiceError("The 'msgpack' package is required for the MsgpackCodec.")
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+#: Holds all registered codecs by their content type.
+CODECS = {}
+
+#: Holds the content type which is assumed if a message has none.
+DEFAULT_CONTENT_TYPE = JSONCodec.content_type
+
+
+def register_codec(codec):
+    """Register a codec for its content type.
+
+    An already registered codec for the same content type is replaced.
+
+    :param Codec codec: the codec to register.
+    """
+    CODECS[codec.content_type] = codec
+
+
+def get_codec(content_type=None):
+    """Get the registered codec for the given content type.
+
+    :param str content_type: the content type of the codec.
+                             If no content type is given the default JSON codec is returned.
+
+    :returns: the codec for the content type
+    :rtype: Codec
+
+    :raises ServiceError: if no codec is registered for the content type.
+    """
+    try:
+        return CODECS[content_type or DEFAULT_CONTENT_TYPE]
+    except KeyError:
+        raise ServiceError("No codec registered for content type '{0}'.".format(content_type))
+
+
+# register the JSON codec of the standard library and all other available codecs.
+register_codec(JSONCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
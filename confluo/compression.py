@@ -0,0 +1,245 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the compressors used to compress the payloads.
+    The compressors in this module are:
+        - ZlibCompressor
+        - Lz4Compressor (requires ``lz4``)
+        - ZstdCompressor (requires ``zstandard``)
+
+    Every compressor is identified by the encoding it produces.
+    The encoding is sent in the AMQP ``content_encoding`` property
+    of every compressed message so that the receiver is able to decompress it.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from .errors import ServiceError
+
+
+#: Holds the name of the AMQP header which contains the encodings a caller accepts for its responses.
+ACCEPT_ENCODING_HEADER = "x-confluo-accept-encoding"
+
+
+class Compressor:
+    """Base class for all compressors."""
+    #: Holds the encoding this compressor produces.
+    encoding = None
+
+    def compress(self, data):
+        """Compress the given AMQP payload.
+
+        :param bytes data: the payload to compress.
+
+        :returns: the compressed payload
+        :rtype: bytes
+        """
+        raise NotImplementedError()
+
+    def decompress(self, data, max_size=None):
+        """Decompress the given AMQP payload.
+
+        :param bytes data: the compressed payload.
+        :param int max_size: the maximum size of the decompressed payload in bytes.
+                             If no maximum size is given the size is not limited.
+
+        :returns: the decompressed payload
+        :rtype: bytes
+
+        :raises ServiceError: if the decompressed payload exceeds the maximum size.
+        """
+        raise NotImplementedError()
+
+
+class ZlibCompressor(Compressor):
+    """Compressor using the ``zlib`` module of the standard library.
+
+    :param int level: the compression level from 1 (fastest) to 9 (smallest).
+    """
+    encoding = "deflate"
+
+    def __init__(self, level=6):
+        #: Holds the compression level.
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return zlib.decompress(data)
+        decompressor = zlib.decompressobj()
+        return _verify_size(decompressor.decompress(data, max_size + 1), max_size, decompressor.eof)
+
+
+class Lz4Compressor(Compressor):
+    """Compressor using the ``lz4`` frame format."""
+    encoding = "lz4"
+
+    def __init__(self):
+        if lz4 is None:
+            raise ServiceError("The 'lz4' package is required for the Lz4Compressor.")
+
+    def compress(self, data):
+        return lz4.frame.compress(data)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return lz4.frame.decompress(data)
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        return _verify_size(decompressor.decompress(data, max_length=max_size + 1), max_size, decompressor.eof)
+
+
+class ZstdCompressor(Compressor):
+    """Compressor using the ``zstandard`` format.
+
+    :param int level: the compression level.
+    """
+    encoding = "zstd"
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ServiceError("The 'zstandard' package is required for the ZstdCompressor.")
+
+        #: Holds the compression level.
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            # the frames contain their content size, thus no maximum output size is required.
+            return zstandard.ZstdDecompressor().decompress(data)
+
+        # the content size in the frame is not trusted, thus the payload is read up to the maximum size.
+        chunks = []
+        size = 0
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            while size <= max_size:
+                chunk = reader.read(max_size + 1 - size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        payload = _verify_size(b"".join(chunks), max_size)
+        # the reader silently stops at the end of a truncated payload.
+        return _verify_size(payload, max_size, self._complete(data, len(payload)))
+
+    @staticmethod
+    def _complete(data, size):
+        """Check if a zstd frame was decompressed completely.
+
+        The decompressed size is compared with the content size in the frame.
+        A frame without content size is decompressed again to check if it
+        reaches its end. This is bounded since its decompressed size is already verified.
+
+        :param bytes data: the compressed payload.
+        :param int size: the size of the decompressed payload.
+
+        :rtype: bool
+        """
+        content_size = zstandard.get_frame_parameters(data).content_size
+        if content_size != zstandard.CONTENTSIZE_UNKNOWN:
+            return content_size == size
+
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        decompressor.decompress(data)
+        return decompressor.eof
+
+
+def _verify_size(data, max_size, complete=True):
+    """Verify that a decompressed payload does not exceed the maximum size.
+
+    :param bytes data: the decompressed payload.
+    :param int max_size: the maximum size in bytes.
+    :param bool complete: flag if the decompressor reached the end of the compressed stream.
+
+    :returns: the decompressed payload
+    :rtype: bytes
+
+    :raises ServiceError: if the payload exceeds the maximum size or the compressed stream is truncated.
+    """
+    if len(data) > max_size:
+        raise ServiceError("The decompressed payload exceeds the maximum size of {0} bytes.".format(max_size))
+    if not complete:
+        raise ServiceError("The compressed payload is truncated.")
+    return data
+
+
+#: Holds all registered compressors by their encoding.
+COMPRESSORS = {}
+
+#: Holds the encoding of the preferred available compressor.
+DEFAULT_ENCODING = ZlibCompressor.encoding
+
+
+def register_compressor(compressor):
+    """Register a compressor for its encoding.
+
+    An already registered compressor for the same encoding is replaced.
+
+    :param Compressor compressor: the compressor to register.
+    """
+    COMPRESSORS[compressor.encoding] = compressor
+
+
+def get_compressor(encoding=None):
+    """Get the registered compressor for the given encoding.
+
+    :param str encoding: the encoding of the compressor.
+                         If no encoding is given the preferred available compressor is returned.
+
+    :returns: the compressor for the encoding
+    :rtype: Compressor
+
+    :raises ServiceError: if no compressor is registered for the encoding.
+    """
+    try:
+        return COMPRESSORS[encoding or DEFAULT_ENCODING]
+    except KeyError:
+        raise ServiceError("No compressor registered for encoding '{0}'.".format(encoding))
+
+
+def negotiate_compressor(compressor, accept_encoding):
+    """Get the compressor for a response to a caller accepting the given encodings.
+
+    :param Compressor compressor: the preferred compressor of the responding service.
+    :param str accept_encoding: the comma-separated encodings the caller accepts or ``None``.
+
+    :returns: the preferred compressor if the caller accepts it, otherwise
+              the zlib compressor if the caller accepts it or ``None``.
+    :rtype: Compressor
+    """
+    if compressor is None or not accept_encoding:
+        return None
+
+    accepted = accept_encoding.split(",")
+    if compressor.encoding in accepted:
+        return compressor
+    if ZlibCompressor.encoding in accepted:
+        return COMPRESSORS[ZlibCompressor.encoding]
+    return None
+
+
+# register zlib and all available faster compressors. zstd is preferred for its better ratio.
+register_compressor(ZlibCompressor())
+if lz4 is not None:
+    register_compressor(Lz4Compressor())
+    DEFAULT_ENCODING = Lz4Compressor.encoding
+if zstandard is not None:
+    register_compressor(ZstdCompressor())
+    DEFAULT_ENCODING = ZstdCompressor.encoding
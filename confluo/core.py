@@ -7,15 +7,41 @@
     :license: MIT, see LICENSE for details
 """
 
+import os
 import json
+import time
 import uuid
+import weakref
 import asyncio
+import functools
 import aioamqp
 import logging
 
-from .models import Command, Response, Event, CommandTransaction
+from .models import Command, Response, Event, Route, ENVELOPE_SIZE_HEADER
 from .errors import ServiceError
-from .helpers import path_to_routing_key
+from .codecs import Codec, get_codec
+from .helpers import path_to_routing_key, command_key
+from .routing import TopicRouter, CommandRouter
+from .pool import ChannelPool
+from .transactions import TransactionTable
+from .acks import Acknowledger, verify_ack_mode
+from .cache import ResponseCache, MAX_AGE_HEADER
+from .metrics import Metrics
+from .supervisor import Supervisor
+from .publisher import BatchPublisher
+from .declarations import declarations
+from .spool import Spool
+from .blobs import DirectoryBlobStore, BLOB_HEADER
+from .compression import (Compressor, ZlibCompressor, COMPRESSORS, ACCEPT_ENCODING_HEADER, get_compressor,
+                          negotiate_compressor)
+from .priority import PrioritySemaphore, SENT_AT_HEADER
+from .deadlines import DEADLINE_HEADER, deadline_scope, effective_timeout, is_expired, add_deadline
+from .streams import (StreamCredit, ResponseStream, STREAM_HEADER, STREAM_END_HEADER,
+                      STREAM_WINDOW_HEADER, STREAM_CREDIT_HEADER)
+
+
+#: Holds the name of the RabbitMQ direct reply-to pseudo-queue.
+DIRECT_REPLY_TO_QUEUE = "amq.rabbitmq.reply-to"
 
 
 class Service:
@@ -27,8 +53,92 @@ class Service:
                                        is used.
     :param logging.Logger logger: the logger instance to use for this service.
                                   If no logger is given a new ``logging.getLogger()`` is created.
+    :param int concurrency: the maximum number of command and event handlers which
+                            run concurrently as independent tasks.
+                            If no concurrency is given the handlers are awaited one after another.
+    :param int prefetch_count: the number of unacknowledged messages the broker delivers
+                               to a consumer. If no prefetch count is given the ``concurrency``
+                               is used.
+    :param codec: the codec or the content type of a registered codec used to serialize
+                  the sent messages. If no codec is given the default JSON codec is used.
+                  Received messages are always deserialized with the codec matching their content type.
+    :param bool lazy_body: flag if the body of sent messages is serialized separately from the envelope.
+                           The receiver then only deserializes the body on first access.
+    :param bool shared_connection: flag if the command, response and event consumers
+                                   share a single AMQP connection with dedicated channels.
+                                   It requires a ``concurrency`` so that the handlers do not
+                                   block the responses of their own calls and the ``after`` ack mode.
+    :param int publisher_channels: the number of pooled channels used to send commands and events.
+                                   If no number is given all commands are sent on the command channel
+                                   and all events on the event channel.
+    :param bool direct_reply_to: flag if responses are received via the RabbitMQ direct reply-to
+                                 pseudo-queue instead of a response queue per service.
+    :param str ack_mode: the default acknowledgement mode of the routes. Either ``auto`` to not
+                         acknowledge messages at all, ``before`` to acknowledge a message before
+                         or ``after`` to acknowledge a message after its handler runs.
+                         If no mode is given ``after`` is used if a prefetch count is set
+                         and ``auto`` otherwise.
+    :param int ack_batch_size: the number of finished messages after which the acknowledgements
+                               are sent at once. It is limited to half of the prefetch count.
+    :param float ack_interval: the maximum time in seconds an acknowledgement is delayed.
+    :param int response_cache_size: the maximum number of cached command responses.
+                                    If no size is given the responses are not cached.
+    :param dict response_cache_ttls: the time in seconds the responses are cached by command path.
+                                     Responses with a max-age header are cached for the given max-age.
+                                     A response is only returned for a call with the same headers.
+    :param bool coalesce_calls: flag if identical concurrent calls share a single command and response.
+                                The coalesced calls share the timeout of the first call.
+    :param LocalTransport local_transport: the in-process transport to deliver commands and events
+                                           to services on the same event loop without a broker.
+    :param bool metrics: flag if handler latencies, message counts and serialization times are recorded.
+    :param int publish_batch_size: the number of buffered events which are sent at once with publisher confirms.
+                                   If no batch size is given every event is sent immediately without confirms.
+    :param float publish_batch_delay: the maximum time in seconds an event is buffered.
+    :param int publish_window: the maximum number of events waiting for a broker confirm.
+                               Publishing waits if the window is full.
+    :param int stream_window: the number of streamed response frames which are sent
+                              to this service before it consumed them.
+    :param int max_priority: the highest priority of the commands. If given the command queue
+                             is declared as priority queue and commands waiting for a free handler
+                             slot are served by priority with weighted fairness.
+                             With a ``concurrency`` it requires the ``after`` ack mode.
+    :param bool reconnect: flag if the service reconnects to the broker once a connection is lost.
+    :param float reconnect_delay: the time in seconds to wait before the first reconnect attempt.
+                                  The delay doubles with every failed attempt.
+    :param float reconnect_max_delay: the maximum time in seconds between two reconnect attempts.
+    :param int spool_size: the maximum number of outbound messages held in memory while reconnecting.
+                           If no size is given sending fails while reconnecting.
+    :param str spool_policy: the policy if the spool is full. Either ``drop-oldest``,
+                             ``drop-newest`` or ``error``.
+    :param str spool_path: the path of a memory-mapped ring file the spool overflows to.
+    :param int spool_file_size: the size of the ring file in bytes.
+    :param blob_store: the blob store or the path of a directory shared by all services the bodies
+                       of large sent messages are offloaded to. Received offloaded bodies are read from it.
+                       If no blob store is given the bodies are always sent inline.
+    :param int blob_threshold: the size in bytes of a serialized body above which it is offloaded.
+    :param compression: the compressor or the encoding of a registered compressor used to compress
+                        the sent payloads. ``True`` compresses the commands and events with zlib
+                        and the responses with the preferred available compressor the caller accepts.
+                        If no compression is given the payloads are sent uncompressed.
+                        Received payloads are always decompressed with the compressor matching their content encoding.
+    :param int compression_threshold: the size in bytes of a payload above which it is compressed.
+    :param int max_decompressed_size: the maximum size in bytes of a received payload after its decompression.
+                                      A larger payload is dropped. ``None`` does not limit the size.
     """
-    def __init__(self, name, loop=None, logger=None):
+    def __init__(self, name, loop=None, logger=None, concurrency=None, prefetch_count=None, codec=None,
+                 lazy_body=False, shared_connection=False, publisher_channels=None, direct_reply_to=False,
+                 ack_mode=None, ack_batch_size=32, ack_interval=0.05, response_cache_size=None,
+                 response_cache_ttls=None, coalesce_calls=False, local_transport=None, metrics=False,
+                 publish_batch_size=None, publish_batch_delay=0.005, publish_window=1000, stream_window=16,
+                 max_priority=None, reconnect=False, reconnect_delay=0.5, reconnect_max_delay=30.0,
+                 spool_size=None, spool_policy="drop-oldest", spool_path=None, spool_file_size=64 * 1024 * 1024,
+                 blob_store=None, blob_threshold=1024 * 1024, compression=None, compression_threshold=1024,
+                 max_decompressed_size=64 * 1024 * 1024):
+        verify_ack_mode(ack_mode)
+        if shared_connection and not concurrency:
+            # the handlers awaited inline by the connection reader would block the responses of nested calls.
+            raise ServiceError("A shared connection requires a concurrency to run the handlers as tasks.")
+
         #: Holds the name of this confluo service.
         self.name = name
 
@@ -47,8 +157,14 @@ class Service:
         #: Holds the name of the command queue
         self.command_queue_name = "{0}".format(self.name)
 
+        #: Holds the flag if responses are received via direct reply-to.
+        self.direct_reply_to = direct_reply_to
+
         #: Holds the name of the response queue
-        self.response_queue_name = "{0}-responses-{1}".format(self.name, str(uuid.uuid4()))
+        if self.direct_reply_to:
+            self.response_queue_name = DIRECT_REPLY_TO_QUEUE
+        else:
+            self.response_queue_name = "{0}-responses-{1}".format(self.name, str(uuid.uuid4()))
 
         #: Holds the name of the event queue
         self.event_queue_name = "{0}-events".format(self.name)
@@ -73,13 +189,223 @@ class Service:
         self.event_channel = None
 
         #: Holds all registered command handlers.
-        self.command_routes = {}
+        self.command_routes = CommandRouter()
 
         #: Holds all registered event handlers.
-        self.event_routes = {}
+        self.event_routes = TopicRouter()
 
         #: Holds all command/response transactions.
-        self.command_transactions = {}
+        self.command_transactions = TransactionTable(self.loop)
+
+        #: Holds the maximum number of concurrently running handlers.
+        self.concurrency = concurrency
+
+        #: Holds the AMQP prefetch count for the command and event consumers.
+        self.prefetch_count = prefetch_count or concurrency
+
+        #: Holds the default acknowledgement mode of the routes.
+        self.ack_mode = ack_mode or ("after" if self.prefetch_count else "auto")
+
+        #: Holds the number of finished messages after which the acknowledgements are sent.
+        self.ack_batch_size = ack_batch_size
+
+        #: Holds the maximum time an acknowledgement is delayed.
+        self.ack_interval = ack_interval
+
+        #: Holds the acknowledgers of the command and event consumers.
+        self.command_acker = None
+        self.event_acker = None
+
+        #: Holds the highest priority of the commands.
+        self.max_priority = max_priority
+
+        #: Holds the semaphore limiting the concurrently running handlers once it is created.
+        self._handler_semaphore = None
+
+        #: Holds all currently running handler tasks.
+        self.handler_tasks = set()
+
+        #: Holds the codec used to serialize sent messages.
+        self.codec = codec if isinstance(codec, Codec) else get_codec(codec)
+
+        #: Holds the flag if the body of sent messages is serialized separately.
+        self.lazy_body = lazy_body
+
+        #: Holds the flag if all consumers share a single AMQP connection.
+        self.shared_connection = shared_connection
+
+        self._verify_queued_ack(self.ack_mode)
+
+        #: Holds the pool of channels to send commands and events.
+        self.publisher_pool = ChannelPool(publisher_channels) if publisher_channels else None
+
+        #: Holds the durable exchanges, queues and bindings declared by this process.
+        self.declarations = declarations
+
+        #: Holds the cache of received command responses.
+        if response_cache_size:
+            self.response_cache = ResponseCache(self.loop, response_cache_size, response_cache_ttls)
+        else:
+            self.response_cache = None
+
+        #: Holds the flag if identical concurrent calls are coalesced.
+        self.coalesce_calls = coalesce_calls
+
+        #: Holds the tasks of the in-flight coalesced calls by their command key including headers and priority.
+        self.inflight_calls = {}
+
+        #: Holds the in-process transport to co-located services.
+        self.local_transport = local_transport
+
+        #: Holds the number of buffered events which are sent at once.
+        self.publish_batch_size = publish_batch_size
+
+        #: Holds the maximum time an event is buffered.
+        self.publish_batch_delay = publish_batch_delay
+
+        #: Holds the maximum number of unconfirmed events.
+        self.publish_window = publish_window
+
+        #: Holds the buffered event publisher.
+        self.event_publisher = None
+
+        #: Holds the number of streamed response frames sent before they are consumed.
+        self.stream_window = stream_window
+
+        #: Holds the streamed responses this service consumes by correlation id.
+        #: An abandoned stream is garbage collected, thus the streams are referenced weakly.
+        self.response_streams = weakref.WeakValueDictionary()
+
+        #: Holds the credits of the responses this service streams by correlation id.
+        self.stream_credits = {}
+
+        #: Holds the broker this service is connected to.
+        self.broker = None
+
+        #: Holds the flag if the service reconnects to the broker.
+        self.reconnect = reconnect
+
+        #: Holds the time to wait before the first reconnect attempt.
+        self.reconnect_delay = reconnect_delay
+
+        #: Holds the maximum time between two reconnect attempts.
+        self.reconnect_max_delay = reconnect_max_delay
+
+        #: Holds the task reconnecting to the broker.
+        self.reconnect_task = None
+
+        #: Holds the number of the current connections to ignore errors of closed connections.
+        self.connection_generation = 0
+
+        #: Holds the number of lost connections.
+        self.connection_losses = 0
+
+        #: Holds the flag if the service is shutting down.
+        self.closing = False
+
+        #: Holds the outbound messages sent while reconnecting.
+        self.spool = Spool(spool_size, spool_policy, spool_path, spool_file_size) if spool_size is not None else None
+
+        #: Holds the blob store the bodies of large messages are offloaded to.
+        self.blob_store = DirectoryBlobStore(blob_store) if isinstance(blob_store, str) else blob_store
+
+        #: Holds the size of a serialized body above which it is offloaded.
+        self.blob_threshold = blob_threshold
+
+        #: Holds the preferred compressor used to compress the responses to callers accepting it.
+        if not compression:
+            self.compressor = None
+        elif isinstance(compression, Compressor):
+            self.compressor = compression
+        else:
+            self.compressor = get_compressor(compression if isinstance(compression, str) else None)
+
+        #: Holds the compressor used to compress sent commands and events.
+        #: Their receivers are unknown, thus only zlib is used unless a compressor is configured explicitly.
+        if compression is True:
+            self.message_compressor = get_compressor(ZlibCompressor.encoding)
+        else:
+            self.message_compressor = self.compressor
+
+        #: Holds the size of a payload above which it is compressed.
+        self.compression_threshold = compression_threshold
+
+        #: Holds the maximum size of a received payload after its decompression.
+        self.max_decompressed_size = max_decompressed_size
+
+        #: Holds the encodings of the compressed responses this service accepts.
+        self.accept_encoding = ",".join(COMPRESSORS)
+
+        #: Holds the recorded metrics.
+        self.metrics = self._create_metrics() if metrics else None
+
+    def _verify_queued_ack(self, ack_mode, path=None):
+        """Verify that the messages waiting for a free handler slot are limited by the prefetch count.
+
+        With priority lanes or a shared connection the messages wait for a free handler slot
+        in their own task. The prefetch count only limits these tasks if the messages
+        are acknowledged after their handlers.
+
+        :param str ack_mode: the acknowledgement mode of the service or a route. ``None`` is the mode of the service.
+        :param str path: the path of the route or ``None`` for the service.
+
+        :raises ServiceError: if the messages would not be limited.
+        """
+        if ack_mode is None or ack_mode == "after" or not self.concurrency:
+            return
+        if self.max_priority is not None or self.shared_connection:
+            raise ServiceError("Priority lanes or a shared connection require the 'after' ack mode{0} so that "
+                               "the prefetch count limits the messages waiting for a handler.".format(
+                                   " for path '{0}'".format(path) if path else ""))
+
+    def _create_metrics(self):
+        """Create the metrics of this service.
+
+        :rtype: Metrics
+        """
+        metrics = Metrics(labels={"service": self.name})
+        metrics.collect("confluo_inflight_calls", "gauge", "Number of calls waiting for a response.",
+                        lambda: len(self.command_transactions))
+        metrics.collect("confluo_oldest_inflight_call_age_seconds", "gauge", "Age of the oldest call waiting for a response.",
+                        lambda: self.command_transactions.oldest_age() or 0)
+        metrics.collect("confluo_call_timeouts_total", "counter", "Number of calls which timed out.",
+                        lambda: self.command_transactions.expired)
+        metrics.collect("confluo_running_handlers", "gauge", "Number of handlers running as independent tasks.",
+                        lambda: len(self.handler_tasks))
+        if self.response_cache is not None:
+            metrics.collect("confluo_response_cache_hits_total", "counter", "Number of calls answered from the response cache.",
+                            lambda: self.response_cache.hits)
+            metrics.collect("confluo_response_cache_misses_total", "counter", "Number of calls not found in the response cache.",
+                            lambda: self.response_cache.misses)
+            metrics.collect("confluo_response_cache_evictions_total", "counter", "Number of responses evicted from the response cache.",
+                            lambda: self.response_cache.evictions)
+        if self.reconnect:
+            metrics.collect("confluo_connection_losses_total", "counter", "Number of lost broker connections.",
+                            lambda: self.connection_losses)
+        if self.spool is not None:
+            metrics.collect("confluo_spooled_messages", "gauge", "Number of outbound messages waiting for a reconnect.",
+                            lambda: len(self.spool))
+            metrics.collect("confluo_spool_dropped_total", "counter", "Number of outbound messages dropped by the spool.",
+                            lambda: self.spool.dropped)
+        return metrics
+
+    @property
+    def handler_semaphore(self):
+        """Get the semaphore limiting the concurrently running handlers.
+
+        The semaphore is created on first use, thus it belongs to the event
+        loop running the handlers and not to the loop of a supervisor which
+        forks the workers.
+
+        :returns: the semaphore or ``None`` if the concurrency is unlimited.
+        :rtype: asyncio.Semaphore
+        """
+        if self._handler_semaphore is None and self.concurrency:
+            if self.max_priority is None:
+                self._handler_semaphore = asyncio.Semaphore(self.concurrency)
+            else:
+                self._handler_semaphore = PrioritySemaphore(self.concurrency)
+        return self._handler_semaphore
 
     async def connect(self, broker="localhost"):
         """Connects to the given broker.
@@ -89,45 +415,399 @@ class Service:
 
         :param str broker: the ip address or hostname of the broker to use.
                            This must be an AMQP broker like RabbitMQ.
+                           If no broker is given the service only communicates
+                           via its local transport.
+
+        If the service reconnects the same setup is done again once a connection is lost.
+        """
+        if self.local_transport is not None:
+            self.local_transport.register(self)
+            self.logger.debug("Registered on local transport %s.", self.local_transport.id)
+
+        if broker is None:
+            if self.local_transport is None:
+                raise ServiceError("A broker is required without a local transport.")
+            return
+
+        self.broker = broker
+        self.closing = False
+        if self.spool is not None:
+            self.spool.open()
+        await self._connect_broker(broker)
+
+    async def _connect_broker(self, broker):
+        """Open the connections to the broker and setup all channels and queues.
+
+        :param str broker: the broker to connect to.
+        """
+        self.connection_generation += 1
+        if self.shared_connection:
+            # all consumers use dedicated channels on a single connection.
+            (transport, protocol), = await self._open_connections(broker, 1)
+            self.command_transport = self.response_transport = self.event_transport = transport
+            self.command_protocol = self.response_protocol = self.event_protocol = protocol
+        else:
+            # the consumer callbacks are awaited by the reader of their connection, thus the responses
+            # are received on their own connection so that running command handlers do not block them.
+            (self.command_transport, self.command_protocol), (self.response_transport, self.response_protocol), \
+                (self.event_transport, self.event_protocol) = await self._open_connections(broker, 3)
+
+        # the command, response and event paths are setup on their own channels at the same time.
+        setups = [self._setup_commands(broker), self._setup_responses(broker), self._setup_events(broker)]
+        if self.publisher_pool is not None:
+            setups.append(self.publisher_pool.open(self.command_protocol))
+        try:
+            await asyncio.gather(*setups)
+        except Exception:
+            # the broker may have lost the remembered declarations.
+            self.declarations.forget(broker)
+            # the errors of the connections closed here must not start reconnecting.
+            self.connection_generation += 1
+            await self._close_connections()
+            raise
+
+        if self.publisher_pool is not None:
+            self.logger.debug("Opened %d publisher channels.", self.publisher_pool.size)
+
+    async def _open_connections(self, broker, count):
+        """Open connections to the broker at the same time.
+
+        :param str broker: the broker to connect to.
+        :param int count: the number of connections to open.
+
+        :returns: the transports and protocols of the connections.
+        :rtype: list
+        """
+        kwargs = {}
+        if self.reconnect:
+            kwargs["on_error"] = functools.partial(self._on_connection_error, self.connection_generation)
+        connections = await asyncio.gather(*[aioamqp.connect(broker, **kwargs) for _ in range(count)],
+                                           return_exceptions=True)
+        errors = [connection for connection in connections if isinstance(connection, BaseException)]
+        if errors:
+            # do not leak the connections which were opened. Their errors must not start reconnecting.
+            self.connection_generation += 1
+            for connection in connections:
+                if not isinstance(connection, BaseException):
+                    transport, protocol = connection
+                    try:
+                        await protocol.close()
+                    except Exception as e:
+                        self.logger.debug("Failed to close protocol: %s", e)
+                    transport.close()
+            raise errors[0]
+        return connections
+
+    def _on_connection_error(self, generation, exception):
+        """Start reconnecting once a connection to the broker is lost.
+
+        :param int generation: the number of the connections the error occurred on.
+        :param Exception exception: the error of the connection.
+        """
+        if self.closing or generation != self.connection_generation or self.reconnect_task is not None:
+            return
+
+        self.logger.warning("Lost connection to broker '%s': %s", self.broker, exception)
+        self.connection_losses += 1
+        self._connection_lost()
+        self.reconnect_task = self.loop.create_task(self._reconnect())
+
+    def _connection_lost(self):
+        """Release everything which depends on the lost connections.
+
+        The responses of the sent commands are lost with the connections,
+        thus the waiting calls fail immediately. The received messages which
+        are not acknowledged yet are redelivered by the broker.
+        """
+        error = ServiceError("Connection to broker '{0}' lost.".format(self.broker))
+        self.command_transactions.fail(error)
+        for stream in list(self.response_streams.values()):
+            stream.feed(Response(stream.path, str(error), 503), end=True)
+        for credit in list(self.stream_credits.values()):
+            credit.grant(0)
+        for acker in (self.command_acker, self.event_acker):
+            if acker is not None:
+                acker.discard()
+
+        if self.event_publisher is not None:
+            messages = self.event_publisher.abort(error)
+            self.event_publisher = None
+            if messages and self.spool is not None:
+                self._spool("event", self.event_exchange_name, messages, True)
+            elif messages:
+                self.logger.warning("Dropped %d buffered events.", len(messages))
+
+    async def _reconnect(self):
+        """Reconnect to the broker until it succeeds and send the spooled messages."""
+        delay = self.reconnect_delay
+        while True:
+            await self._close_connections()
+            await asyncio.sleep(delay)
+            try:
+                await self._connect_broker(self.broker)
+                await self._drain_spool()
+            except Exception as e:
+                self.logger.warning("Failed to reconnect to broker '%s': %s. Retrying in %.1f seconds.",
+                                    self.broker, e, min(delay * 2, self.reconnect_max_delay))
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+            break
+
+        self.reconnect_task = None
+        self.logger.info("Reconnected to broker '%s'.", self.broker)
+
+    async def _close_connections(self):
+        """Close all protocols and transports. A shared connection is only closed once."""
+        connections = [
+            ("command", self.command_protocol, self.command_transport),
+            ("response", self.response_protocol, self.response_transport),
+            ("event", self.event_protocol, self.event_transport),
+        ]
+        closed_protocols = []
+        for name, protocol, transport in connections:
+            if protocol is None or protocol in closed_protocols:
+                continue
+
+            try:
+                await protocol.close()
+            except Exception as e:
+                # the connection may be lost already.
+                self.logger.debug("Failed to close %s protocol: %s", name, e)
+            transport.close()
+            closed_protocols.append(protocol)
+            self.logger.debug("Closed %s protocol and transport layer.", name)
+
+    async def _setup_commands(self, broker):
+        """Setup the command channel and queue and start consuming the commands.
+
+        :param str broker: the broker the service is connected to.
         """
-        # setup connection to the command channel and queue.
-        self.command_transport, self.command_protocol = await aioamqp.connect(broker)
         self.command_channel = await self.command_protocol.channel()
 
-        await self.command_channel.exchange_declare(self.rpc_exchange_name, type_name="direct", durable=True)
-        await self.command_channel.queue_declare(self.command_queue_name, durable=True)
-        await self.command_channel.queue_bind(self.command_queue_name, exchange_name=self.rpc_exchange_name, routing_key=self.command_queue_name)
-        await self.command_channel.basic_consume(self._on_command, queue_name=self.command_queue_name, no_ack=True)
+        await self.declarations.exchange_declare(broker, self.command_channel, self.rpc_exchange_name, "direct")
+        arguments = {"x-max-priority": self.max_priority} if self.max_priority is not None else None
+        await self.declarations.queue_declare(broker, self.command_channel, self.command_queue_name, arguments)
+        await self.declarations.queue_bind(broker, self.command_channel, self.command_queue_name,
+                                           self.rpc_exchange_name, [self.command_queue_name])
+        self.command_acker = self._create_acker(self.command_channel, self.command_routes)
+        if self.prefetch_count:
+            await self.command_channel.basic_qos(prefetch_count=self.prefetch_count)
+        await self.command_channel.basic_consume(self._on_command, queue_name=self.command_queue_name, no_ack=self.command_acker is None)
 
         self.logger.debug("Connected to command channel and created queue %s.", self.command_queue_name)
 
-        # setup connection to the response channel and queue.
-        self.response_transport, self.response_protocol = await aioamqp.connect(broker)
+    async def _setup_responses(self, broker):
+        """Setup the response channel and queue and start consuming the responses.
+
+        :param str broker: the broker the service is connected to.
+        """
         self.response_channel = await self.response_protocol.channel()
 
-        await self.response_channel.exchange_declare(self.rpc_exchange_name, type_name="direct", durable=True)
-        # await self.response_channel.queue_declare(self.response_queue_name, durable=True, exclusive=True)
-        await self.response_channel.queue_declare(self.response_queue_name, exclusive=True)
-        await self.response_channel.queue_bind(self.response_queue_name, exchange_name=self.rpc_exchange_name, routing_key=self.response_queue_name)
-        await self.response_channel.basic_consume(self._on_response, queue_name=self.response_queue_name, no_ack=True)
+        if self.direct_reply_to:
+            # the pseudo-queue must neither be declared nor bound.
+            await self.response_channel.basic_consume(self._on_response, queue_name=self.response_queue_name, no_ack=True)
+        else:
+            await self.declarations.exchange_declare(broker, self.response_channel, self.rpc_exchange_name, "direct")
+            # the exclusive response queue is gone with its connection, thus it is declared on every connect.
+            await self.response_channel.queue_declare(self.response_queue_name, exclusive=True)
+            await self.response_channel.queue_bind(self.response_queue_name, exchange_name=self.rpc_exchange_name, routing_key=self.response_queue_name)
+            await self.response_channel.basic_consume(self._on_response, queue_name=self.response_queue_name, no_ack=True)
 
         self.logger.debug("Connected to response channel and created queue %s.", self.response_queue_name)
 
-        # setup connection to the commands channel and queue.
-        self.event_transport, self.event_protocol = await aioamqp.connect(broker)
+    async def _setup_events(self, broker):
+        """Setup the event channel and queue, subscribe to all event routes and start consuming the events.
+
+        :param str broker: the broker the service is connected to.
+        """
         self.event_channel = await self.event_protocol.channel()
 
-        await self.event_channel.exchange_declare(self.event_exchange_name, type_name="topic", durable=True)
-        await self.event_channel.queue_declare(self.event_queue_name, durable=True)
-        await self.event_channel.basic_consume(self._on_event, queue_name=self.event_queue_name, no_ack=True)
+        await self.declarations.exchange_declare(broker, self.event_channel, self.event_exchange_name, "topic")
+        await self.declarations.queue_declare(broker, self.event_channel, self.event_queue_name)
+        self.event_acker = self._create_acker(self.event_channel, self.event_routes)
+        if self.prefetch_count:
+            await self.event_channel.basic_qos(prefetch_count=self.prefetch_count)
+        await self.event_channel.basic_consume(self._on_event, queue_name=self.event_queue_name, no_ack=self.event_acker is None)
 
         self.logger.debug("Connected to event channel and created queue %s.", self.event_queue_name)
 
-        # subscribe to all registered event routes.
-        for route in self.event_routes:
-            routing_key = path_to_routing_key(route)
-            await self.event_channel.queue_bind(self.event_queue_name, exchange_name=self.event_exchange_name, routing_key=routing_key)
-            self.logger.debug("Subscribed to event %s on event channel %s.", routing_key, self.event_channel)
+        # setup the buffered event publisher on its own channel in confirm mode.
+        if self.publish_batch_size:
+            self.event_publisher = BatchPublisher(
+                await self.event_protocol.channel(), self.loop, self.event_exchange_name,
+                self.publish_batch_size, self.publish_batch_delay, self.publish_window)
+            await self.event_publisher.open()
+            self.logger.debug("Opened buffered event publisher.")
+
+        # subscribe to all registered event routes in one batch.
+        routing_keys = [path_to_routing_key(route) for route in self.event_routes]
+        await self.declarations.queue_bind(broker, self.event_channel, self.event_queue_name,
+                                           self.event_exchange_name, routing_keys)
+        self.logger.debug("Subscribed to %d events on event channel %s.", len(routing_keys), self.event_channel)
+
+    def _create_acker(self, channel, routes):
+        """Create the acknowledger for a consumer.
+
+        :param channel: the channel of the consumer.
+        :param routes: the router with all routes of the consumer.
+
+        :returns: the acknowledger or ``None`` if neither the service nor a route acknowledges messages.
+        :rtype: Acknowledger
+        """
+        ack_modes = {route.ack or self.ack_mode for route in routes.routes.values()}
+        ack_modes.add(self.ack_mode)
+        if ack_modes == {"auto"}:
+            return None
+
+        batch_size = self.ack_batch_size
+        if self.prefetch_count:
+            # the batch must not fill the window of unacknowledged messages.
+            batch_size = max(1, min(batch_size, self.prefetch_count // 2))
+        return Acknowledger(channel, self.loop, batch_size, self.ack_interval)
+
+    def _encode(self, model, codec, properties, compressor=None, route=None):
+        """Serialize a model to an AMQP payload.
+
+        The content type and the size of a separately serialized
+        envelope are set in the given AMQP properties.
+        A body larger than the blob threshold is offloaded to the blob store
+        and only its reference is sent as AMQP header.
+        A payload larger than the compression threshold is compressed
+        and its encoding is set as AMQP content encoding.
+
+        :param ProtocolModel model: the model to serialize.
+        :param Codec codec: the codec to serialize the model with.
+        :param dict properties: the AMQP properties of the message to send.
+        :param Compressor compressor: the compressor to compress the payload with or ``None``.
+        :param Route route: the route which answers with the model or ``None``.
+
+        :returns: the AMQP payload
+        :rtype: bytes
+        """
+        properties["content_type"] = codec.content_type
+        started = time.perf_counter() if self.metrics is not None else None
+        if not self.lazy_body and self.blob_store is None:
+            payload = model.dumps(codec)
+        else:
+            payload, envelope_size = model.dumps_split(codec)
+            headers = properties.setdefault("headers", {})
+            headers[ENVELOPE_SIZE_HEADER] = envelope_size
+            if self.blob_store is not None and len(payload) - envelope_size > self.blob_threshold:
+                headers[BLOB_HEADER] = self.blob_store.put(memoryview(payload)[envelope_size:])
+                payload = payload[:envelope_size]
+
+        if started is not None:
+            self.metrics.observe_codec("encode", type(model).__name__, time.perf_counter() - started)
+
+        if compressor is not None and len(payload) > self.compression_threshold:
+            payload = self._compress(model, route, payload, compressor, properties)
+        return payload
+
+    def _compress(self, model, route, payload, compressor, properties):
+        """Compress an AMQP payload unless it does not get smaller.
+
+        :param ProtocolModel model: the serialized model.
+        :param Route route: the route which answers with the model or ``None``.
+        :param bytes payload: the payload to compress.
+        :param Compressor compressor: the compressor to compress the payload with.
+        :param dict properties: the AMQP properties of the message to send.
+
+        :returns: the compressed or the given payload.
+        :rtype: bytes
+        """
+        started = time.thread_time() if self.metrics is not None else None
+        compressed = compressor.compress(payload)
+        if started is not None:
+            self.metrics.observe_compression("compress", type(model).__name__.lower(), route.path if route else "",
+                                             len(payload), len(compressed), time.thread_time() - started)
+
+        if len(compressed) >= len(payload):
+            return payload
+        properties["content_encoding"] = compressor.encoding
+        return compressed
+
+    def _decode(self, model_cls, payload, properties, routes=None):
+        """Deserialize a received AMQP payload to a model.
+
+        A compressed payload is decompressed with the compressor matching its content encoding.
+        A payload with a content encoding without a registered compressor, like a charset
+        set by another AMQP client, is not compressed.
+
+        :param type model_cls: the model class to deserialize.
+        :param bytes payload: the received AMQP payload.
+        :param properties: the AMQP properties of the message which was received.
+        :param CommandRouter routes: the routes of the received commands to label the metrics with or ``None``.
+
+        :returns: the model and the codec it was deserialized with.
+        :rtype: tuple
+
+        :raises ServiceError: if the decompressed payload exceeds the maximum size.
+        """
+        codec = get_codec(properties.content_type)
+        compressor = COMPRESSORS.get(properties.content_encoding) if properties.content_encoding else None
+        if compressor is not None:
+            compressed_size = len(payload)
+            started = time.thread_time()
+            payload = compressor.decompress(payload, self.max_decompressed_size)
+            cpu_time = time.thread_time() - started
+        elif properties.content_encoding:
+            self.logger.debug("Received payload with unknown content encoding '%s' as is.", properties.content_encoding)
+
+        headers = properties.headers or {}
+        envelope_size = headers.get(ENVELOPE_SIZE_HEADER)
+        body_loader = None
+        if BLOB_HEADER in headers:
+            # a response has a single receiver, thus its blob is deleted once it is read.
+            body_loader = functools.partial(self._load_blob, headers[BLOB_HEADER], delete=model_cls is Response)
+        if self.metrics is None:
+            return model_cls.loads(payload, codec, envelope_size, body_loader), codec
+
+        started = time.perf_counter()
+        model = model_cls.loads(payload, codec, envelope_size, body_loader)
+        self.metrics.observe_codec("decode", model_cls.__name__, time.perf_counter() - started)
+        if compressor is not None:
+            # the paths are unbounded, thus the compressions are recorded by the route template.
+            match = routes.match(model.path) if routes is not None else None
+            self.metrics.observe_compression("decompress", model_cls.__name__.lower(), match[0].path if match else "",
+                                             len(payload), compressed_size, cpu_time)
+        return model, codec
+
+    def _load_blob(self, reference, delete=False):
+        """Read an offloaded body from the blob store.
+
+        :param str reference: the reference to the blob.
+        :param bool delete: flag if the blob is deleted after it was read.
+
+        :returns: the serialized body.
+
+        :raises ServiceError: if no blob store is configured or the blob does not exist.
+        """
+        if self.blob_store is None:
+            raise ServiceError("Received offloaded body '{0}' but no blob store is configured.".format(reference))
+
+        data = self.blob_store.get(reference)
+        if delete:
+            self.blob_store.delete(reference)
+        return data
+
+    def _release_blob(self, properties, acker=None, envelope=None):
+        """Delete the offloaded body of a handled command once it is acknowledged.
+
+        The broker redelivers a command whose acknowledgement was not sent,
+        thus its body is kept until the acknowledgement is sent.
+
+        :param properties: the AMQP properties of the message which was received.
+        :param Acknowledger acker: the acknowledger of the consumer or ``None``.
+        :param envelope: the metadata about the message which was received or ``None``.
+        """
+        reference = (properties.headers or {}).get(BLOB_HEADER)
+        if reference is None or self.blob_store is None:
+            return
+
+        if acker is not None:
+            acker.after_ack(envelope.delivery_tag, functools.partial(self.blob_store.delete, reference))
+        else:
+            self.blob_store.delete(reference)
 
     async def _on_command(self, channel, body, envelope, properties):
         """Handle a received command.
@@ -141,23 +821,259 @@ class Service:
         :param properties: the AMQP properties of the message which was received.
         """
         self.logger.debug("Received Command '%s' in message '%s'", body, properties.message_id)
-        # create a command instance from AMQP message body.
-        command = Command.loads(body)
+        acker = self.command_acker
+        if acker is not None:
+            acker.track(envelope.delivery_tag)
+
+        # drop the command without deserializing it if the caller does not wait anymore.
+        if self._expired((properties.headers or {}).get(DEADLINE_HEADER), properties.correlation_id, "dispatch"):
+            self._release_blob(properties, acker, envelope)
+            await self._ack(acker, envelope)
+            return
 
+        # create a command instance from AMQP message body.
         try:
-            func = self.command_routes[command.path]
-        except KeyError:
+            command, codec = self._decode(Command, body, properties, self.command_routes)
+        except Exception:
+            # a message which is not decodable would never be acknowledged otherwise.
+            self.logger.exception("Dropped undecodable Command in message '%s'.", properties.message_id)
+            if self.metrics is not None:
+                self.metrics.count_undecodable("command")
+            self._release_blob(properties, acker, envelope)
+            await self._ack(acker, envelope)
+            return
+
+        match = self.command_routes.match(command.path)
+        if match is None:
             # TODO: report to caller / or just ignore?!
             self.logger.warning("No route for path '%s' defined.", command.path)
+            if self.metrics is not None:
+                self.metrics.count_unrouted("command")
+            self._release_blob(properties, acker, envelope)
+            await self._ack(acker, envelope)
             return
 
-        # call command handler and wait for response.
-        response = await func(command.path, command.query, command.headers, command.body)
+        route, parameters = match
+        priority = self._priority(route, properties.priority)
+        handler_acker = await self._ack_received([route], acker, envelope)
+        handler = self._handle_command(channel, route, parameters, command, codec, properties, priority, acker, envelope)
+        await self._dispatch([(route, handler)], handler_acker, envelope, priority)
+
+    async def _handle_command(self, channel, route, parameters, command, codec, properties, priority=0, acker=None,
+                              envelope=None):
+        """Call the command handler and send its response to the caller.
+
+        The response is serialized with the same codec as the command
+        so that the caller is able to deserialize it.
+
+        :param channel: the channel on which the command was received.
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the received command.
+        :param Codec codec: the codec the command was serialized with.
+        :param properties: the AMQP properties of the message which was received.
+        :param int priority: the priority of the command.
+        :param Acknowledger acker: the acknowledger of the consumer or ``None``.
+        :param envelope: the metadata about the message which was received or ``None``.
+        """
+        try:
+            await self._reply_command(channel, route, parameters, command, codec, properties, priority)
+        finally:
+            # the offloaded body is not needed anymore once the handled command is acknowledged.
+            self._release_blob(properties, acker, envelope)
+
+    async def _reply_command(self, channel, route, parameters, command, codec, properties, priority):
+        """Call the command handler and send its response to the caller.
+
+        :param channel: the channel on which the command was received.
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the received command.
+        :param Codec codec: the codec the command was serialized with.
+        :param properties: the AMQP properties of the message which was received.
+        :param int priority: the priority of the command.
+        """
+        headers = properties.headers or {}
+        if self.metrics is not None and SENT_AT_HEADER in headers:
+            self.metrics.observe_queue_wait(priority, time.time() - headers[SENT_AT_HEADER])
+
+        # the command may have expired while it waited for a free handler slot.
+        deadline = headers.get(DEADLINE_HEADER)
+        if self._expired(deadline, properties.correlation_id, "dispatch"):
+            return
+
+        with deadline_scope(deadline):
+            if route.streaming:
+                await self._stream_command(channel, route, parameters, command, codec, properties)
+                return
+
+            # call command handler and wait for response.
+            response = await self._call_handler(route, "command", command.path, command.query, command.headers, command.body, **parameters)
         if not properties.reply_to:
             # no response is required - just ignore the response given by the command handler.
             self.logger.debug("Do not send response for Command %s because no reply_to is given.", properties.message_id)
             return
 
+        if self._expired(deadline, properties.correlation_id, "response"):
+            return
+
+        response = self._make_response(route, command, response)
+
+        # send response to caller compressed with an encoding it accepts.
+        compressor = negotiate_compressor(self.compressor, headers.get(ACCEPT_ENCODING_HEADER))
+        response_properties = {"correlation_id": properties.correlation_id}
+        await channel.basic_publish(
+            payload=self._encode(response, codec, response_properties, compressor, route),
+            exchange_name=self._reply_exchange(properties.reply_to),
+            routing_key=properties.reply_to,
+            properties=response_properties)
+
+        self.logger.debug("Sent response '%s' for Command '%s'.", response, properties.message_id)
+
+    def _priority(self, route, priority):
+        """Get the priority of a command.
+
+        :param Route route: the route which handles the command.
+        :param int priority: the priority the command was sent with or ``None``.
+
+        :returns: the priority of the command limited to the highest priority of this service.
+        :rtype: int
+        """
+        if priority is None:
+            priority = route.priority or 0
+        if self.max_priority is not None:
+            priority = max(0, min(priority, self.max_priority))
+        return priority
+
+    def _expired(self, deadline, command_id, stage):
+        """Check if a command has expired and count it.
+
+        :param float deadline: the deadline of the command or ``None``.
+        :param str command_id: the message id or path of the command.
+        :param str stage: the stage the command is dropped in. Either ``dispatch``, ``response``
+                          or ``spool``.
+
+        :returns: if the command has expired.
+        :rtype: bool
+        """
+        if not is_expired(deadline):
+            return False
+
+        self.logger.warning("Dropped Command '%s' in %s which expired %.3f seconds ago.",
+                            command_id, stage, time.time() - deadline)
+        if self.metrics is not None:
+            self.metrics.count_expired(stage)
+        return True
+
+    def _reply_exchange(self, reply_to):
+        """Get the exchange to send a message to a response queue.
+
+        Direct reply-to responses must be sent to the default exchange.
+
+        :param str reply_to: the name of the response queue.
+
+        :rtype: str
+        """
+        if reply_to.startswith(DIRECT_REPLY_TO_QUEUE):
+            return ""
+        return self.rpc_exchange_name
+
+    async def _stream_command(self, channel, route, parameters, command, codec, properties):
+        """Stream the chunks of a command handler to the caller.
+
+        Every chunk is sent as response frame carrying the response queue
+        of this service so that the caller is able to return the credits.
+
+        :param channel: the channel on which the command was received.
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the received command.
+        :param Codec codec: the codec the command was serialized with.
+        :param properties: the AMQP properties of the message which was received.
+        """
+        if not properties.reply_to:
+            await self._run_stream(route, parameters, command, None, None)
+            return
+
+        correlation_id = properties.correlation_id
+        headers = properties.headers or {}
+        window = headers.get(STREAM_WINDOW_HEADER) or self.stream_window
+        compressor = negotiate_compressor(self.compressor, headers.get(ACCEPT_ENCODING_HEADER))
+        exchange_name = self._reply_exchange(properties.reply_to)
+        if self.direct_reply_to:
+            # messages with a direct reply-to address must be sent on the channel consuming the responses.
+            channel = self.response_channel
+
+        async def send(body, sequence, end, status_code=200):
+            """Send a response frame to the caller."""
+            headers = {STREAM_HEADER: sequence}
+            if end:
+                headers[STREAM_END_HEADER] = True
+            frame_properties = {"correlation_id": correlation_id, "reply_to": self.response_queue_name, "headers": headers}
+            await channel.basic_publish(
+                payload=self._encode(Response(command.path, body, status_code), codec, frame_properties, compressor,
+                                     route),
+                exchange_name=exchange_name,
+                routing_key=properties.reply_to,
+                properties=frame_properties)
+
+        credit = self.stream_credits[correlation_id] = StreamCredit(window)
+        try:
+            await self._run_stream(route, parameters, command, credit, send)
+        finally:
+            self.stream_credits.pop(correlation_id, None)
+
+    async def _run_stream(self, route, parameters, command, credit, send):
+        """Run a streaming command handler and send its chunks.
+
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the command to handle.
+        :param StreamCredit credit: the credits to send the frames or ``None`` if no response is expected.
+        :param send: the coroutine function to send a frame or ``None`` if no response is expected.
+        """
+        generator = route.handler(command.path, command.query, command.headers, command.body, **parameters)
+        sequence = 0
+        try:
+            async for chunk in generator:
+                if send is None:
+                    continue
+
+                try:
+                    acquired = await credit.acquire()
+                except asyncio.TimeoutError:
+                    self.logger.warning("Stream of '%s' stalled because the caller consumed no frames.",
+                                        command.path)
+                    return
+
+                if not acquired:
+                    self.logger.debug("Stream of '%s' was cancelled by the caller.", command.path)
+                    return
+
+                await send(chunk, sequence, False)
+                sequence += 1
+        except Exception as e:
+            self.logger.exception("Streaming handler for path '%s' failed.", route.path)
+            if send is not None:
+                await send(str(e), sequence, True, 500)
+            return
+        finally:
+            await generator.aclose()
+
+        if send is not None:
+            await send(None, sequence, True)
+
+    @staticmethod
+    def _make_response(route, command, response):
+        """Create the response model from the result of a command handler.
+
+        :param Route route: the route which handled the command.
+        :param Command command: the handled command.
+        :param response: the result of the command handler.
+
+        :returns: the response to send to the caller.
+        :rtype: Response
+        """
         if not isinstance(response, Response):
             if isinstance(response, tuple):
                 body, status_code, headers = response
@@ -168,27 +1084,95 @@ class Service:
 
             response = Response(command.path, body, status_code, headers)
 
-        # send response to caller
-        await channel.basic_publish(
-            payload=str(response),
-            exchange_name=self.rpc_exchange_name,
-            routing_key=properties.reply_to,
-            properties={
-                "correlation_id": properties.correlation_id
-            })
+        # mark a successful response as cacheable for the caller.
+        if route.max_age is not None and 200 <= response.status_code < 300:
+            if response.headers is None:
+                response.headers = {}
+            response.headers.setdefault(MAX_AGE_HEADER, route.max_age)
+        return response
+
+    async def _on_local_command(self, command, reply, deadline=None, priority=None):
+        """Handle a command delivered via the local transport.
+
+        :param Command command: the delivered command.
+        :param callable reply: the function to pass the response to or ``None``
+                               if no response is expected.
+        :param float deadline: the deadline of the command or ``None``.
+        :param int priority: the priority the command was sent with or ``None``.
+        """
+        self.logger.debug("Received local Command '%s'.", command)
+        sent_at = time.time()
+        match = self.command_routes.match(command.path)
+        if match is None:
+            self.logger.warning("No route for path '%s' defined.", command.path)
+            if self.metrics is not None:
+                self.metrics.count_unrouted("command")
+            return
 
-        self.logger.debug("Sent response '%s' for Command '%s'.", response, properties.message_id)
+        route, parameters = match
+        priority = self._priority(route, priority)
+        handler = self._handle_local_command(route, parameters, command, reply, deadline, priority, sent_at)
+        await self._dispatch([(route, handler)], None, None, priority)
+
+    async def _handle_local_command(self, route, parameters, command, reply, deadline=None, priority=0, sent_at=None):
+        """Call the command handler and pass its response to the local caller.
+
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the delivered command.
+        :param callable reply: the function to pass the response to or ``None``.
+        :param float deadline: the deadline of the command or ``None``.
+        :param int priority: the priority of the command.
+        :param float sent_at: the time the command was delivered or ``None``.
+        """
+        if self.metrics is not None and sent_at is not None:
+            self.metrics.observe_queue_wait(priority, time.time() - sent_at)
+
+        if self._expired(deadline, command.path, "dispatch"):
+            return
+
+        with deadline_scope(deadline):
+            if route.streaming:
+                await self._stream_local_command(route, parameters, command, reply)
+                return
+
+            response = await self._call_handler(route, "command", command.path, command.query, command.headers, command.body, **parameters)
+        if reply is not None and not self._expired(deadline, command.path, "response"):
+            reply(self._make_response(route, command, response))
+
+    async def _stream_local_command(self, route, parameters, command, reply):
+        """Stream the chunks of a command handler to a local caller.
+
+        :param Route route: the route which handles the command.
+        :param dict parameters: the path parameters extracted from the command path.
+        :param Command command: the delivered command.
+        :param callable reply: the function to pass the response stream to or ``None``.
+        """
+        if reply is None:
+            await self._run_stream(route, parameters, command, None, None)
+            return
+
+        credit = StreamCredit(self.stream_window)
+
+        async def grant(credits):
+            """Return the credits of the local caller."""
+            credit.grant(credits)
 
-        # send acknowledge for this command message.
-        # FIXME: why don't I get the response if I ack the message?!
-        # await channel.basic_client_ack(delivery_tag=envelope.delivery_tag)
+        stream = ResponseStream(command.path, self.stream_window, grant)
+        reply(stream)
+
+        async def send(body, sequence, end, status_code=200):
+            """Pass a response frame to the local caller."""
+            stream.feed(self.local_transport.copy(Response(command.path, body, status_code), self.codec), end)
+
+        await self._run_stream(route, parameters, command, credit, send)
 
     async def _on_response(self, channel, body, envelope, properties):
         """Handle a received response.
 
         All messages received on the ``response queue`` are handled
-        here. It basically sets the response data and triggers
-        an event which stops the caller to wait for the response.
+        here. It basically resolves the future of the transaction
+        the caller is waiting on with the response.
 
         :param channel: the channel on which the message was received.
         :param body: the body of the message which was received.
@@ -196,20 +1180,111 @@ class Service:
         :param properties: the AMQP properties of the message which was received.
         """
         self.logger.debug("Received Response '%s' for Command '%s'.", body, properties.correlation_id)
+        headers = properties.headers or {}
+        if STREAM_CREDIT_HEADER in headers:
+            # a caller consumed frames of a response streamed by this service.
+            credit = self.stream_credits.get(properties.correlation_id)
+            if credit is not None:
+                credit.grant(headers[STREAM_CREDIT_HEADER])
+            return
+
+        if STREAM_HEADER in headers:
+            self._on_response_frame(body, properties, STREAM_END_HEADER in headers)
+            return
+
         # check if this service is waiting for the received response.
-        try:
-            transaction = self.command_transactions[properties.correlation_id]
-        except KeyError:
+        if properties.correlation_id not in self.command_transactions:
             self.logger.warning("Received martian response for message: %s",
                 properties.correlation_id)
+            if self.metrics is not None:
+                self.metrics.count_martian()
             return
 
         # deserialiye the AMQP message body.
-        response = Response.loads(body)
+        try:
+            response, _ = self._decode(Response, body, properties)
+        except Exception:
+            # the caller times out instead of breaking the consumer of all responses.
+            self.logger.exception("Dropped undecodable Response for message '%s'.", properties.correlation_id)
+            return
 
-        # set response message and trigger event.
-        transaction.response = response
-        transaction.event.set()
+        # resolve the transaction with the response.
+        self.command_transactions.resolve(properties.correlation_id, response)
+
+    def _on_response_frame(self, body, properties, end):
+        """Handle a received frame of a streamed response.
+
+        The transaction of the call is resolved with a response stream
+        on the first frame. All frames are fed into this stream.
+
+        :param body: the body of the message which was received.
+        :param properties: the AMQP properties of the message which was received.
+        :param bool end: flag if it is the last frame.
+        """
+        correlation_id = properties.correlation_id
+        stream = self.response_streams.get(correlation_id)
+        if stream is None and correlation_id not in self.command_transactions:
+            self.logger.debug("Received frame of closed stream for message: %s", correlation_id)
+            if not end and properties.reply_to:
+                # nobody consumes the stream anymore, thus the handler is cancelled instead of waiting for credits.
+                self._cancel_stream(correlation_id, functools.partial(self._grant_stream_credits, properties.reply_to,
+                                                                      correlation_id))
+            return
+
+        try:
+            response, _ = self._decode(Response, body, properties)
+        except Exception as e:
+            self.logger.exception("Dropped undecodable Response frame for message '%s'.", correlation_id)
+            if stream is None:
+                return
+            response, end = Response(stream.path, str(e), 500), True
+
+        if stream is None:
+            grant = functools.partial(self._grant_stream_credits, properties.reply_to, correlation_id)
+            stream = ResponseStream(response.path, self.stream_window, grant)
+            # a stream which is dropped without closing it cancels its handler once it is garbage collected.
+            finalizer = weakref.finalize(stream, self._cancel_stream, correlation_id, grant)
+            finalizer.atexit = False
+
+            def finish():
+                """Forget the finished stream."""
+                finalizer.detach()
+                self.response_streams.pop(correlation_id, None)
+
+            stream.on_finish = finish
+            self.response_streams[correlation_id] = stream
+            self.command_transactions.resolve(correlation_id, stream)
+
+        stream.feed(response, end)
+
+    async def _grant_stream_credits(self, reply_to, correlation_id, credits):
+        """Return credits to a service streaming a response.
+
+        :param str reply_to: the address of the streaming service.
+        :param str correlation_id: the id of the command whose response is streamed.
+        :param int credits: the number of returned credits. Zero cancels the stream.
+        """
+        await self._publish(self.command_channel, payload=b"", exchange_name=self._reply_exchange(reply_to),
+                            routing_key=reply_to,
+                            properties={"correlation_id": correlation_id, "headers": {STREAM_CREDIT_HEADER: credits}})
+
+    def _cancel_stream(self, correlation_id, grant):
+        """Cancel the handler of a streamed response which is not consumed anymore.
+
+        :param str correlation_id: the id of the command whose response is streamed.
+        :param grant: the coroutine function to return credits to the handler.
+        """
+        if self.loop.is_closed() or self.command_channel is None:
+            return
+
+        async def cancel():
+            """Return zero credits to cancel the handler."""
+            try:
+                await grant(0)
+            except Exception as e:
+                self.logger.debug("Failed to cancel stream of message '%s': %s", correlation_id, e)
+
+        self.loop.create_task(cancel())
 
     async def _on_event(self, channel, body, envelope, properties):
         """Handle a received event.
@@ -223,21 +1298,371 @@ class Service:
         :param properties: the AMQP properties of the message which was received.
         """
         self.logger.debug("Received Event '%s'.", body)
+        if self.event_acker is not None:
+            self.event_acker.track(envelope.delivery_tag)
 
         # deserialize the AMQP message body.
-        event = Event.loads(body)
-
         try:
-            func = self.event_routes[event.path]
-        except KeyError:
+            event, _ = self._decode(Event, body, properties)
+        except Exception:
+            # a message which is not decodable would never be acknowledged otherwise.
+            self.logger.exception("Dropped undecodable Event in message '%s'.", properties.message_id)
+            if self.metrics is not None:
+                self.metrics.count_undecodable("event")
+            await self._ack(self.event_acker, envelope)
+            return
+
+        routes = self.event_routes.match(event.path)
+        if not routes:
             # TODO: report to caller / or just ignore?!
             self.logger.warning("No route for path '%s' defined.", event.path)
+            if self.metrics is not None:
+                self.metrics.count_unrouted("event")
+            await self._ack(self.event_acker, envelope)
+            return
+
+        # the body is decoded lazily, thus an expired blob or an undecodable body only fails here.
+        try:
+            event_body = event.body
+        except Exception:
+            self.logger.exception("Dropped Event '%s' with undecodable body in message '%s'.", event.path,
+                                  properties.message_id)
+            if self.metrics is not None:
+                self.metrics.count_undecodable("event")
+            await self._ack(self.event_acker, envelope)
+            return
+
+        # call all matching event handlers.
+        acker = await self._ack_received(routes, self.event_acker, envelope)
+        handlers = [(route, self._call_handler(route, "event", event.path, event.headers, event_body)) for route in routes]
+        await self._dispatch(handlers, acker, envelope)
+
+    def _call_handler(self, route, kind, *args, **kwargs):
+        """Create the coroutine running the handler of a route.
+
+        A handler with an executor is run in its pool and
+        only receives the deserialized message fields.
+
+        :param Route route: the route of the handler.
+        :param str kind: the kind of the handled message.
+
+        :returns: the handler coroutine.
+        """
+        if route.executor is None:
+            handler = route.handler(*args, **kwargs)
+        else:
+            handler = route.executor.run(self.loop, route.handler, *args, **kwargs)
+
+        if self.metrics is None:
+            return handler
+        return self._measure_handler(route, kind, handler)
+
+    async def _measure_handler(self, route, kind, handler):
+        """Run a handler coroutine and record its duration and outcome.
+
+        :param Route route: the route of the handler.
+        :param str kind: the kind of the handled message.
+        :param handler: the handler coroutine to run.
+
+        :returns: the result of the handler.
+        """
+        started = time.perf_counter()
+        try:
+            result = await handler
+        except Exception:
+            self.metrics.observe_handler(kind, route.path, "error", time.perf_counter() - started)
+            raise
+        self.metrics.observe_handler(kind, route.path, "ok", time.perf_counter() - started)
+        return result
+
+    async def _on_local_event(self, event, routes):
+        """Handle an event delivered via the local transport.
+
+        :param Event event: the delivered event.
+        :param list routes: the routes matching the event path.
+        """
+        self.logger.debug("Received local Event '%s'.", event)
+        try:
+            body = event.body
+        except Exception:
+            self.logger.exception("Dropped local Event '%s' with undecodable body.", event.path)
+            if self.metrics is not None:
+                self.metrics.count_undecodable("event")
+            return
+
+        handlers = [(route, self._call_handler(route, "event", event.path, event.headers, body)) for route in routes]
+        try:
+            await self._dispatch(handlers, None, None)
+        except Exception:
+            # the publisher does not wait for the local subscribers.
+            self.logger.exception("Handler for local Event '%s' failed.", event.path)
+
+    async def _ack_received(self, routes, acker, envelope):
+        """Acknowledge a received message before its handlers run.
+
+        The message is not acknowledged if any of its routes
+        acknowledges messages after the handler.
+
+        :param list routes: the routes of the message.
+        :param Acknowledger acker: the acknowledger of the consumer.
+        :param envelope: the metadata about the message which was received.
+
+        :returns: the acknowledger to acknowledge the message after the handlers or ``None``.
+        :rtype: Acknowledger
+        """
+        if acker is None:
+            return None
+
+        if any((route.ack or self.ack_mode) == "after" for route in routes):
+            return acker
+
+        await acker.ack(envelope.delivery_tag)
+        return None
+
+    async def _dispatch(self, handlers, acker, envelope, priority=0):
+        """Run the handler coroutines for a received message.
+
+        If neither the service nor the routes limit the concurrency
+        the handlers are awaited inline. Otherwise they are started as
+        an independent task as soon as the handler pool has a free slot.
+        Without a handler pool the task is started as soon as the routes
+        have a free slot, thus the waiting messages do not pile up as tasks.
+        Streaming handlers wait for credits received on the connections,
+        thus they always run as independent task.
+        With priority lanes the messages wait for a free slot in their
+        own task so that messages with a higher priority are able to overtake them.
+        On a shared connection the messages also wait in their own task
+        so that a full handler pool does not block the responses and events.
+        The message is acknowledged once all handlers are finished.
+
+        :param list handlers: the routes and their handler coroutines to run.
+        :param Acknowledger acker: the acknowledger to acknowledge the message with or ``None``.
+        :param envelope: the metadata about the message which was received.
+        :param int priority: the priority of the message.
+        """
+        if not self.concurrency and not any(route.concurrency or route.streaming for route, _ in handlers):
+            try:
+                for _, handler in handlers:
+                    await handler
+            finally:
+                # close the handlers which were never awaited because of an error.
+                for _, handler in handlers:
+                    handler.close()
+                await self._ack(acker, envelope)
             return
 
-        # call event handler.
-        await func(event.path, event.headers, event.body)
+        if self.handler_semaphore is None:
+            # wait for a free slot in the routes.
+            await self._acquire_routes(handlers)
+            task = self.loop.create_task(self._run_handlers(handlers, acker, envelope, routes_acquired=True))
+        elif self.max_priority is not None or self.shared_connection:
+            # the messages are acknowledged after their handlers, thus the prefetch count limits the waiting messages.
+            task = self.loop.create_task(self._run_queued(handlers, acker, envelope, priority))
+        else:
+            # wait for a free slot in the handler pool.
+            await self.handler_semaphore.acquire()
+            task = self.loop.create_task(self._run_handlers(handlers, acker, envelope))
+        self.handler_tasks.add(task)
+        task.add_done_callback(self.handler_tasks.discard)
+
+    async def _run_queued(self, handlers, acker, envelope, priority):
+        """Wait for a free slot in the handler pool and run the handlers of a message.
+
+        With priority lanes the message waits in the lane of its priority.
+
+        :param list handlers: the routes and their handler coroutines to run.
+        :param Acknowledger acker: the acknowledger to acknowledge the message with or ``None``.
+        :param envelope: the metadata about the message which was received.
+        :param int priority: the priority of the message.
+        """
+        if self.handler_semaphore is not None:
+            try:
+                if self.max_priority is not None:
+                    await self.handler_semaphore.acquire(priority)
+                else:
+                    await self.handler_semaphore.acquire()
+            except asyncio.CancelledError:
+                for _, handler in handlers:
+                    handler.close()
+                raise
+        await self._run_handlers(handlers, acker, envelope)
+
+    async def _acquire_routes(self, handlers):
+        """Wait for a free slot in every route with a concurrency limit.
+
+        :param list handlers: the routes and their handler coroutines to run.
+        """
+        acquired = []
+        try:
+            for route, _ in handlers:
+                if route.semaphore is not None:
+                    await route.semaphore.acquire()
+                    acquired.append(route)
+        except asyncio.CancelledError:
+            for route in acquired:
+                route.semaphore.release()
+            for _, handler in handlers:
+                handler.close()
+            raise
+
+    async def _run_handlers(self, handlers, acker, envelope, routes_acquired=False):
+        """Run the handler coroutines for a message as a task of the handler pool.
+
+        :param list handlers: the routes and their handler coroutines to run.
+        :param Acknowledger acker: the acknowledger to acknowledge the message with or ``None``.
+        :param envelope: the metadata about the message which was received.
+        :param bool routes_acquired: flag if the slots of the routes are already acquired.
+        """
+        try:
+            await asyncio.gather(*[self._run_handler(route, handler, routes_acquired) for route, handler in handlers])
+        finally:
+            if self.handler_semaphore is not None:
+                self.handler_semaphore.release()
+            if routes_acquired:
+                for route, _ in handlers:
+                    if route.semaphore is not None:
+                        route.semaphore.release()
+            await self._ack(acker, envelope)
+
+    async def _run_handler(self, route, handler, route_acquired=False):
+        """Run a handler coroutine within the concurrency limit of its route.
+
+        :param Route route: the route of the handler.
+        :param handler: the handler coroutine to run.
+        :param bool route_acquired: flag if the slot of the route is already acquired.
+        """
+        try:
+            if route.semaphore is not None and not route_acquired:
+                async with route.semaphore:
+                    await handler
+            else:
+                await handler
+        except Exception:
+            self.logger.exception("Handler for path '%s' failed.", route.path)
+
+    async def _ack(self, acker, envelope):
+        """Acknowledge a received message if the consumer acknowledges messages.
+
+        :param Acknowledger acker: the acknowledger of the consumer or ``None``.
+        :param envelope: the metadata about the message which was received or ``None``.
+        """
+        if acker is not None:
+            await acker.ack(envelope.delivery_tag)
+
+    async def _publish(self, channel, payload, exchange_name, routing_key, properties, pooled=True):
+        """Publish a message on a pooled publisher channel.
 
-    async def call(self, service_name, path, body, query=None, headers=None, timeout=20.0, expect_response=True):
+        If no publisher pool is configured the message
+        is published on the given channel.
+
+        :param channel: the channel to use if no publisher pool is configured.
+        :param bytes payload: the AMQP payload to publish.
+        :param str exchange_name: the name of the exchange to publish to.
+        :param str routing_key: the routing key of the message.
+        :param dict properties: the AMQP properties of the message.
+        :param bool pooled: flag if the message may be published on a pooled channel.
+        """
+        await self._publish_many(channel, exchange_name, [(routing_key, payload, properties)], pooled)
+
+    async def _publish_many(self, channel, exchange_name, messages, pooled=True):
+        """Publish a batch of messages in one pass on a single channel.
+
+        A pooled publisher channel is checked out once for the whole batch.
+        If no publisher pool is configured the messages are published on the given channel.
+        While the service reconnects the messages are spooled.
+
+        :param channel: the channel to use if no publisher pool is configured.
+        :param str exchange_name: the name of the exchange to publish to.
+        :param list messages: the messages as tuples of routing key, AMQP payload and AMQP properties.
+        :param bool pooled: flag if the messages may be published on a pooled channel.
+        """
+        if self.reconnect_task is not None:
+            if channel is self.response_channel:
+                kind = "response"
+            elif channel is self.event_channel:
+                kind = "event"
+            else:
+                kind = "command"
+            self._spool(kind, exchange_name, messages, pooled)
+            return
+
+        await self._send_many(channel, exchange_name, messages, pooled)
+
+    def _spool(self, kind, exchange_name, messages, pooled):
+        """Hold messages until the service is reconnected.
+
+        :param str kind: the kind of the channel to send the messages on.
+        :param str exchange_name: the name of the exchange to publish to.
+        :param list messages: the messages as tuples of routing key, AMQP payload and AMQP properties.
+        :param bool pooled: flag if the messages may be published on a pooled channel.
+
+        :raises ServiceError: if no spool is configured or the spool is full.
+        """
+        if self.spool is None:
+            raise ServiceError("Broker '{0}' is not reachable.".format(self.broker))
+
+        for routing_key, payload, properties in messages:
+            if not self.spool.put((kind, exchange_name, routing_key, bytes(payload), properties, pooled)):
+                self.logger.debug("Dropped message to '%s' because the spool is full.", routing_key)
+
+    async def _drain_spool(self, batch_size=256):
+        """Send all spooled messages in the order they were spooled.
+
+        Commands whose deadline passed while they were spooled are dropped.
+
+        :param int batch_size: the maximum number of messages sent in one pass.
+        """
+        if self.spool is None:
+            return
+
+        sent = 0
+        while self.spool:
+            batch = [self.spool.get()]
+            kind, exchange_name, _, _, _, pooled = batch[0]
+            while len(batch) < batch_size and self.spool:
+                message = self.spool.get()
+                if message[0] != kind or message[1] != exchange_name or message[5] != pooled:
+                    self.spool.requeue([message])
+                    break
+                batch.append(message)
+
+            messages = [(routing_key, payload, properties) for _, _, routing_key, payload, properties, _ in batch
+                        if not self._expired((properties.get("headers") or {}).get(DEADLINE_HEADER),
+                                             properties.get("correlation_id"), "spool")]
+            try:
+                await self._send_many(getattr(self, kind + "_channel"), exchange_name, messages, pooled)
+            except Exception:
+                self.spool.requeue(batch)
+                raise
+            sent += len(messages)
+
+        if sent:
+            self.logger.info("Sent %d spooled messages.", sent)
+
+    async def _send_many(self, channel, exchange_name, messages, pooled=True):
+        """Send a batch of messages on a single channel.
+
+        :param channel: the channel to use if no publisher pool is configured.
+        :param str exchange_name: the name of the exchange to publish to.
+        :param list messages: the messages as tuples of routing key, AMQP payload and AMQP properties.
+        :param bool pooled: flag if the messages may be published on a pooled channel.
+        """
+        if self.publisher_pool is None or not pooled:
+            for routing_key, payload, properties in messages:
+                await channel.basic_publish(payload=payload, exchange_name=exchange_name,
+                                            routing_key=routing_key, properties=properties)
+            return
+
+        channel = await self.publisher_pool.acquire()
+        try:
+            for routing_key, payload, properties in messages:
+                await channel.basic_publish(payload=payload, exchange_name=exchange_name,
+                                            routing_key=routing_key, properties=properties)
+        finally:
+            self.publisher_pool.release(channel)
+
+    async def call(self, service_name, path, body, query=None, headers=None, timeout=20.0, expect_response=True,
+                   priority=None):
         """Call a command on a specific type of service.
 
         :param str service_name: the name of the destination service.
@@ -245,110 +1670,479 @@ class Service:
         :param dict body: the body of the message to send.
         :param dict query: optional path query data.
         :param dict: headers: optional header data.
-        :param float timeout: the timeout to wait for a response
+        :param float timeout: the timeout to wait for a response. ``None`` waits without a limit.
         :paran bool expect_response: flag if a response is expected or not.
+        :param int priority: the priority of the command. If no priority is given
+                             the priority of the called route is used.
+
+        The timeout is shortened to the deadline of the command which is currently
+        handled and sent along with the command so that the called service
+        drops the command once nobody waits for its response.
+        If the response cache is enabled a cached response for the same
+        service name, path, query, body and headers is returned without sending the command.
+        If calls are coalesced an identical call with the same headers and
+        priority which is already in-flight is awaited instead of sending another command.
+        Streamed responses are never shared, a call joining a streamed call sends its own command.
 
         :returns: the response of the command call if expected or nothing.
         :rtype: tuple
         """
+        if not expect_response or (self.response_cache is None and not self.coalesce_calls):
+            return await self._call(service_name, path, body, query, headers, timeout, expect_response, priority=priority)
+
+        # the headers may carry the identity of the caller, thus they are part of the key.
+        key = command_key(service_name, path, query, body, headers)
+        if self.response_cache is not None:
+            response = self.response_cache.get(key)
+            if response is not None:
+                self.logger.debug("Use cached Response for Command '%s' to '%s'.", path, service_name)
+                return response
+
+        if not self.coalesce_calls:
+            return await self._call(service_name, path, body, query, headers, timeout, expect_response, key, priority)
+
+        # the headers may carry the identity of the caller, thus calls with other headers are not joined.
+        inflight_key = command_key(service_name, path, query, body, headers, priority)
+        call = self.inflight_calls.get(inflight_key)
+        if call is None:
+            # the command is sent by a task so that a cancelled caller does not affect the others.
+            call = self.loop.create_task(self._call(service_name, path, body, query, headers, timeout, expect_response, key,
+                                                    priority))
+            self.inflight_calls[inflight_key] = call
+            call.add_done_callback(lambda _: self.inflight_calls.pop(inflight_key, None))
+            return await asyncio.shield(call)
+
+        self.logger.debug("Join in-flight Command '%s' to '%s'.", path, service_name)
+        response = await asyncio.shield(call)
+        if isinstance(response, ResponseStream):
+            # a stream is consumed by the first caller only, thus a joined call is sent on its own.
+            self.logger.debug("Resend joined Command '%s' to '%s' with a streamed Response.", path, service_name)
+            return await self._call(service_name, path, body, query, headers, timeout, expect_response, key, priority)
+        return response
+
+    async def _call(self, service_name, path, body, query, headers, timeout, expect_response, cache_key=None,
+                    priority=None):
+        """Send a command and wait for its response.
+
+        :param str service_name: the name of the destination service.
+        :param str path: the path of the command.
+        :param dict body: the body of the message to send.
+        :param dict query: optional path query data.
+        :param dict: headers: optional header data.
+        :param float timeout: the timeout to wait for a response
+        :paran bool expect_response: flag if a response is expected or not.
+        :param str cache_key: the key to cache the response with or ``None``.
+        :param int priority: the priority of the command or ``None``.
+
+        :returns: the response of the command call if expected or nothing.
+        :rtype: Response
+        """
         command = Command(path, query, body, headers)
         message_id = str(uuid.uuid4())
+        if expect_response:
+            timeout = self._call_timeout(timeout, path)
+
+        if self.local_transport is not None:
+            peer = self.local_transport.get(service_name)
+            if peer is not None:
+                return await self._call_local(peer, command, message_id, timeout, expect_response, cache_key, priority)
 
-        properties={}
+        if self.command_channel is None:
+            raise ServiceError("Service '{0}' is not reachable without a broker.".format(service_name))
+
+        properties = {"headers": {SENT_AT_HEADER: time.time()}}
+        if priority is not None:
+            properties["priority"] = priority
         if expect_response:
             properties["reply_to"] = self.response_queue_name
             properties["correlation_id"] = message_id
+            properties["headers"][STREAM_WINDOW_HEADER] = self.stream_window
+            if self.compressor is not None:
+                properties["headers"][ACCEPT_ENCODING_HEADER] = self.accept_encoding
+            add_deadline(properties, timeout)
 
-            # register command/response transaction
-            transaction = CommandTransaction()
-            self.command_transactions[message_id] = transaction
-
-        # send command to the rpc exchange
-        await self.command_channel.basic_publish(
-            payload=str(command),
-            exchange_name=self.rpc_exchange_name,
-            routing_key=service_name,
-            properties=properties
-        )
+        payload = self._encode(command, self.codec, properties, self.message_compressor)
 
         # no response is expected.
         if not expect_response:
+            await self._publish(self.command_channel, payload=payload, exchange_name=self.rpc_exchange_name,
+                                routing_key=service_name, properties=properties)
             self.logger.debug("Sent Command '%s' to '%s' and do not expect Response.",
                               command, service_name)
             return
 
-        self.logger.debug("Sent Command '%s' to '%s' and wait for Response on '%s'.",
-                          command, service_name, properties["reply_to"])
+        # register command/response transaction
+        transaction = self.command_transactions.add(message_id, timeout)
+        try:
+            # send command to the rpc exchange.
+            # Direct reply-to requires to send the command on the channel consuming the responses.
+            if self.direct_reply_to:
+                await self._publish(self.response_channel, payload=payload, exchange_name=self.rpc_exchange_name,
+                                    routing_key=service_name, properties=properties, pooled=False)
+            else:
+                await self._publish(self.command_channel, payload=payload, exchange_name=self.rpc_exchange_name,
+                                    routing_key=service_name, properties=properties)
+
+            self.logger.debug("Sent Command '%s' to '%s' and wait for Response on '%s'.",
+                              command, service_name, properties["reply_to"])
 
+            response = await transaction.future
+            if cache_key is not None and self.response_cache is not None and isinstance(response, Response):
+                self.response_cache.put(cache_key, path, response)
+            return response
+        except asyncio.TimeoutError:
+            self.logger.error("No response received for message '%s' within %s seconds.",
+                message_id, timeout)
+            raise
+        finally:
+            self.command_transactions.discard(message_id)
+
+    async def _call_local(self, peer, command, message_id, timeout, expect_response, cache_key=None, priority=None):
+        """Deliver a command to a service via the local transport and wait for its response.
+
+        :param Service peer: the service instance to deliver the command to.
+        :param Command command: the command to deliver.
+        :param str message_id: the id of the command.
+        :param float timeout: the timeout to wait for a response
+        :paran bool expect_response: flag if a response is expected or not.
+        :param str cache_key: the key to cache the response with or ``None``.
+        :param int priority: the priority of the command or ``None``.
+
+        :returns: the response of the command call if expected or nothing.
+        :rtype: Response
+        """
+        command = self.local_transport.copy(command, self.codec)
+        if not expect_response:
+            self._deliver_local(peer, command, None, None, priority)
+            self.logger.debug("Delivered local Command '%s' to '%s' and do not expect Response.", command, peer.name)
+            return
+
+        def reply(response):
+            """Resolve the transaction with a copy of the response."""
+            if isinstance(response, Response):
+                response = self.local_transport.copy(response, self.codec)
+            self.command_transactions.resolve(message_id, response)
+
+        # register command/response transaction
+        transaction = self.command_transactions.add(message_id, timeout)
+        deadline = time.time() + timeout if timeout is not None else None
+        delivery = self._deliver_local(peer, command, reply, deadline, priority)
+
+        def delivered(task):
+            """Fail the transaction if the delivery itself failed."""
+            if not task.cancelled() and task.exception() is not None and not transaction.future.done():
+                transaction.future.set_exception(task.exception())
+
+        delivery.add_done_callback(delivered)
+        self.logger.debug("Delivered local Command '%s' to '%s' and wait for Response.", command, peer.name)
         try:
-            await asyncio.wait_for(transaction.event.wait(), timeout)
+            # the timer of the transaction table also bounds handlers which run inline in the delivery.
+            response = await transaction.future
+            if cache_key is not None and self.response_cache is not None and isinstance(response, Response):
+                self.response_cache.put(cache_key, command.path, response)
+            return response
         except asyncio.TimeoutError:
             self.logger.error("No response received for message '%s' within %s seconds.",
                 message_id, timeout)
+            delivery.cancel()
+            raise
+        except asyncio.CancelledError:
+            delivery.cancel()
             raise
-        else:
-            return transaction.response
         finally:
-            del self.command_transactions[message_id]
+            self.command_transactions.discard(message_id)
+
+    def _deliver_local(self, peer, command, reply, deadline, priority):
+        """Start the delivery of a command to a service via the local transport.
+
+        The delivery runs in its own task so that a handler awaited inline by
+        the peer does not block the caller beyond its timeout.
+
+        :param Service peer: the service instance to deliver the command to.
+        :param Command command: the copy of the command to deliver.
+        :param callable reply: the function to pass the response to or ``None``.
+        :param float deadline: the deadline of the command or ``None``.
+        :param int priority: the priority of the command or ``None``.
+
+        :returns: the task delivering the command.
+        :rtype: asyncio.Task
+        """
+        return self._start_local(peer, peer._on_local_command(command, reply, deadline, priority))
+
+    def _start_local(self, peer, delivery):
+        """Start a delivery via the local transport as a task of the receiving service.
 
-    def route(self, path):
+        :param Service peer: the service instance the message is delivered to.
+        :param delivery: the coroutine delivering the message.
+
+        :returns: the task running the delivery.
+        :rtype: asyncio.Task
+        """
+        task = self.loop.create_task(delivery)
+        # the peer drains the deliveries like its other running handlers on shutdown.
+        peer.handler_tasks.add(task)
+        task.add_done_callback(peer.handler_tasks.discard)
+        return task
+
+    def _call_timeout(self, timeout, path):
+        """Get the timeout of a call within the deadline of the command which is currently handled.
+
+        :param float timeout: the timeout of the call.
+        :param str path: the path of the called command.
+
+        :rtype: float
+
+        :raises asyncio.TimeoutError: if the deadline has already passed.
+        """
+        timeout = effective_timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            self.logger.error("Deadline passed before Command '%s' was sent.", path)
+            raise asyncio.TimeoutError()
+        return timeout
+
+    async def call_many(self, calls, timeout=20.0, priority=None):
+        """Call a batch of commands and wait for all responses.
+
+        All commands are serialized and registered as transactions up front
+        and then sent in one pass on a single channel. Commands to services
+        on the local transport are delivered directly.
+
+        :param list calls: the commands to call as tuples of
+                           ``(service_name, path, body[, query[, headers]])``.
+        :param float timeout: the timeout to wait for the responses. ``None`` waits without a limit.
+                              It is shortened to the deadline of the command which is currently handled.
+        :param int priority: the priority of the commands or ``None``.
+
+        :returns: the responses in the order of the calls. A failed call is
+                  reported by its exception instead of a response.
+        :rtype: list
+        """
+        timeout = self._call_timeout(timeout, "many")
+        messages = []
+        results = []
+        local_calls = []
+        transactions = []
+        try:
+            for service_name, path, body, *options in calls:
+                query, headers = (options + [None, None])[:2]
+                command = Command(path, query, body, headers)
+                message_id = str(uuid.uuid4())
+
+                peer = self.local_transport.get(service_name) if self.local_transport is not None else None
+                if peer is not None:
+                    local_calls.append(self.loop.create_task(self._call_local(peer, command, message_id, timeout, True,
+                                                                              priority=priority)))
+                    results.append(local_calls[-1])
+                    continue
+
+                properties = {"reply_to": self.response_queue_name, "correlation_id": message_id,
+                              "headers": {STREAM_WINDOW_HEADER: self.stream_window, SENT_AT_HEADER: time.time()}}
+                if priority is not None:
+                    properties["priority"] = priority
+                if self.compressor is not None:
+                    properties["headers"][ACCEPT_ENCODING_HEADER] = self.accept_encoding
+                add_deadline(properties, timeout)
+                messages.append((service_name, self._encode(command, self.codec, properties, self.message_compressor), properties))
+                results.append(None)
+
+            # register all command/response transactions at once.
+            transactions = [self.command_transactions.add(properties["correlation_id"], timeout)
+                            for _, _, properties in messages]
+            futures = iter(t.future for t in transactions)
+            results = [next(futures) if result is None else result for result in results]
+            if messages:
+                if self.command_channel is None:
+                    raise ServiceError("Services are not reachable without a broker.")
+
+                # send commands to the rpc exchange.
+                # Direct reply-to requires to send the commands on the channel consuming the responses.
+                if self.direct_reply_to:
+                    await self._publish_many(self.response_channel, self.rpc_exchange_name, messages, pooled=False)
+                else:
+                    await self._publish_many(self.command_channel, self.rpc_exchange_name, messages)
+
+                self.logger.debug("Sent %d Commands and wait for Responses on '%s'.",
+                                  len(messages), self.response_queue_name)
+
+            return await asyncio.gather(*results, return_exceptions=True)
+        except BaseException:
+            # the started local calls have no caller anymore.
+            for task in local_calls:
+                task.cancel()
+            raise
+        finally:
+            for transaction in transactions:
+                self.command_transactions.discard(transaction.message_id)
+
+    def route(self, path, concurrency=None, ack=None, max_age=None, executor=None, max_workers=None, priority=None):
         """Register to a command sent with the given path.
 
         This method should be used as a decorator.
 
+        The path may be a template with parameter segments like
+        ``/users/{id}/orders/{order_id:int}``. The converted path
+        parameters are passed to the handler as keyword arguments.
+        The available converters are ``str``, ``int`` and ``float``.
+
         :param str path: the path of the command to register to.
+        :param int concurrency: the maximum number of concurrently running
+                                handlers for this route.
+        :param str ack: the acknowledgement mode of this route.
+                        If no mode is given the mode of the service is used.
+        :param float max_age: the time in seconds callers may cache the responses of this route.
+        :param str executor: the type of the pool to run a plain function handler in.
+                             Either ``thread`` or ``process``.
+        :param int max_workers: the maximum number of workers of the pool.
+        :param int priority: the priority of the commands of this route which are sent without priority.
+
+        :raises ServiceError: if the ack mode does not limit the messages waiting for a handler.
         """
+        self._verify_queued_ack(ack, path)
+
         def decorator(func):
             """The route decorator."""
-            if path in self.command_routes:
-                raise ServiceError("Command route with path '{0}' already registered.".format(path))
-            self.command_routes[path] = func
+            self.command_routes.add(path, Route(path, func, concurrency, ack, max_age, executor, max_workers, priority))
             return func
         return decorator
 
     async def publish(self, path, body, headers=None):
         """Publish an event with a specific path, body and headers.
 
+        If events are buffered the event is sent with the next batch.
+
         :param str path: the path to publish the event.
         :param dict body: the body of the event.
         :param dict headers: optional headers of the event.
+
+        :returns: the future which is resolved once the broker confirmed the event
+                  if events are buffered or nothing. While reconnecting the event
+                  is spooled and sent without a confirm.
+        :rtype: asyncio.Future
         """
         event = Event(path, body, headers)
 
-        await self.event_channel.basic_publish(
-            payload=str(event),
+        await self._publish_local(event)
+        if self.event_channel is None:
+            return
+
+        properties = {}
+        if self.event_publisher is not None and self.reconnect_task is None:
+            return await self.event_publisher.publish(
+                path_to_routing_key(path), self._encode(event, self.codec, properties, self.message_compressor), properties)
+
+        await self._publish(
+            self.event_channel,
+            payload=self._encode(event, self.codec, properties, self.message_compressor),
             exchange_name=self.event_exchange_name,
-            routing_key=path_to_routing_key(path)
+            routing_key=path_to_routing_key(path),
+            properties=properties
         )
 
         self.logger.debug("Published event '%s' for '%s'.", event, path)
 
-    def subscribe(self, path):
+    async def publish_many(self, events):
+        """Publish a batch of events in one pass on a single channel.
+
+        :param list events: the events to publish as tuples of ``(path, body[, headers])``.
+        """
+        messages = []
+        for path, body, *options in events:
+            event = Event(path, body, options[0] if options else None)
+            await self._publish_local(event)
+            properties = {}
+            payload = self._encode(event, self.codec, properties, self.message_compressor)
+            messages.append((path_to_routing_key(path), payload, properties))
+
+        if self.event_channel is None:
+            return
+
+        if self.event_publisher is not None and self.reconnect_task is None:
+            for routing_key, payload, properties in messages:
+                await self.event_publisher.publish(routing_key, payload, properties)
+            await self.event_publisher.send()
+            return
+
+        await self._publish_many(self.event_channel, self.event_exchange_name, messages)
+
+        self.logger.debug("Published %d events.", len(messages))
+
+    async def flush(self):
+        """Send all buffered events and wait until the broker confirmed them.
+
+        :raises ServiceError: if the broker rejected any of the events.
+        """
+        if self.event_publisher is not None:
+            await self.event_publisher.flush()
+
+    async def _publish_local(self, event):
+        """Deliver an event to the subscribers on the local transport which are not connected to a broker.
+
+        The event is still published via AMQP for all other subscribers.
+        The handlers run in tasks of the subscribers, thus they neither
+        block the publisher nor fail the publishing.
+
+        :param Event event: the event to deliver.
+        """
+        if self.local_transport is None:
+            return
+
+        for subscriber, routes in self.local_transport.subscribers(event.path):
+            self._start_local(subscriber, subscriber._on_local_event(self.local_transport.copy(event, self.codec), routes))
+
+    def subscribe(self, path, concurrency=None, ack=None, executor=None, max_workers=None):
         """Subscribe to an event published with the given path.
 
         This method should be used as a decorator.
 
+        The path may contain the AMQP topic wildcards ``*`` to match
+        exactly one and ``#`` to match zero or more path segments.
+
         :param str path: the path of events to subscribe to.
+        :param int concurrency: the maximum number of concurrently running
+                                handlers for this route.
+        :param str ack: the acknowledgement mode of this route.
+                        If no mode is given the mode of the service is used.
+        :param str executor: the type of the pool to run a plain function handler in.
+                             Either ``thread`` or ``process``.
+        :param int max_workers: the maximum number of workers of the pool.
+
+        :raises ServiceError: if the ack mode does not limit the messages waiting for a handler.
         """
+        self._verify_queued_ack(ack, path)
+
         def decorator(func):
             """The subscribe decorator."""
-            if path in self.event_routes:
-                raise ServiceError("Event route with path '{0}' already registered.".format(path))
-            self.event_routes[path] = func
+            self.event_routes.add(path, Route(path, func, concurrency, ack, executor=executor, max_workers=max_workers))
             return func
         return decorator
 
-    def run(self, broker="localhost"):
+    def run(self, broker="localhost", workers=None, event_loop_policy=None, metrics_port=None):
         """Run this Service in the configured event loop.
 
         This method should only be used if you want to use
         ``run_forever`` and this is the only Service which should run.
 
+        If a number of workers is given the service runs in forked
+        worker processes supervised by this process. Crashed workers
+        are restarted and ``SIGINT`` and ``SIGTERM`` gracefully shutdown all workers.
+
         :param str broker: the AMQP broker to connect to.
+        :param int workers: the number of worker processes.
+        :param event_loop_policy: the event loop policy of the worker processes
+                                  or ``uvloop`` to use uvloop if it is installed.
+        :param int metrics_port: the port to serve the metrics on the local host on.
+                                 With workers the aggregated metrics of all workers are served.
         """
+        if workers:
+            Supervisor(self, broker, workers, event_loop_policy, metrics_port).run()
+            return
+
         # connect services
         self.loop.run_until_complete(self.connect(broker))
 
+        if metrics_port is not None and self.metrics is not None:
+            self.loop.run_until_complete(self.metrics.serve(port=metrics_port))
+
         try:
             self.loop.run_forever()
         except KeyboardInterrupt:
@@ -357,22 +2151,71 @@ class Service:
             self.loop.close()
             raise
 
+    def _prepare_worker(self):
+        """Prepare this service to run in a forked worker process.
+
+        The worker gets its own event loop, handler semaphores, response queue and spool ring file.
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._handler_semaphore = None
+        for route in list(self.command_routes.routes.values()) + list(self.event_routes.routes.values()):
+            route.reset_semaphore()
+        self.command_transactions = TransactionTable(self.loop)
+        if self.response_cache is not None:
+            self.response_cache.loop = self.loop
+        if not self.direct_reply_to:
+            self.response_queue_name = "{0}-responses-{1}".format(self.name, str(uuid.uuid4()))
+        if self.spool is not None and self.spool.path:
+            # the workers must not overwrite or remove the ring file of each other.
+            self.spool.path = "{0}.{1}".format(self.spool.path, os.getpid())
+
     async def shutdown(self):
         """Shutdown all open AMQP protocols and transports.
 
         This method should be called before stopping the event loop.
+        All running handlers are awaited before the connections are closed.
+        Messages which are still spooled because the broker is not reachable are lost.
         """
-        # close command protocol and transport
-        await self.command_protocol.close()
-        self.command_transport.close()
-        self.logger.debug("Closed command protocol and transport layer.")
+        self.closing = True
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+            if self.spool:
+                self.logger.warning("Dropped %d spooled messages on shutdown.", len(self.spool))
+
+        # stop serving the metrics.
+        if self.metrics is not None:
+            await self.metrics.close()
+
+        # stop receiving messages via the local transport.
+        if self.local_transport is not None:
+            self.local_transport.unregister(self)
+
+        # wait for running handlers to finish.
+        if self.handler_tasks:
+            await asyncio.wait(list(self.handler_tasks))
+            self.logger.debug("Drained all running handlers.")
+
+        # stop the pools of the handlers with an executor.
+        for route in list(self.command_routes.routes.values()) + list(self.event_routes.routes.values()):
+            if route.executor is not None:
+                route.executor.shutdown()
+
+        # send all buffered events.
+        try:
+            await self.flush()
+        except ServiceError as e:
+            self.logger.error("Failed to publish events on shutdown: %s", e)
+
+        # send all outstanding acknowledgements.
+        for acker in (self.command_acker, self.event_acker):
+            if acker is not None:
+                await acker.flush()
 
-        # close response protocol and transport
-        await self.response_protocol.close()
-        self.response_transport.close()
-        self.logger.debug("Closed response protocol and transport layer.")
+        # close all protocols and transports.
+        await self._close_connections()
 
-        # close event protocol and transport
-        await self.event_protocol.close()
-        self.event_transport.close()
-        self.logger.debug("Closed even nrotocol and transport layer.")
+        # release the ring file of the spool.
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,101 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the propagation of command deadlines.
+
+    A call sends the absolute deadline of its command as AMQP header
+    and as relative AMQP expiration. The called service drops commands
+    whose deadline has passed and exposes the deadline to the handler so that
+    nested calls never wait longer than the original caller.
+    The deadlines are wall clock times, thus the clocks of the hosts should be synchronized.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import time
+import contextlib
+import contextvars
+
+
+#: Holds the name of the AMQP header which contains the absolute deadline of a command.
+DEADLINE_HEADER = "x-confluo-deadline"
+
+#: Holds the deadline of the command which is currently handled.
+_current_deadline = contextvars.ContextVar("confluo_deadline", default=None)
+
+
+def current_deadline():
+    """Get the deadline of the command which is currently handled.
+
+    :returns: the deadline as UNIX timestamp or ``None`` if there is no deadline.
+    :rtype: float
+    """
+    return _current_deadline.get()
+
+
+def remaining_time():
+    """Get the time left until the deadline of the command which is currently handled.
+
+    :returns: the time in seconds or ``None`` if there is no deadline.
+    :rtype: float
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def effective_timeout(timeout):
+    """Shorten the timeout of a call to the deadline of the command which is currently handled.
+
+    :param float timeout: the timeout of the call or ``None`` to wait without a limit.
+
+    :rtype: float
+    """
+    remaining = remaining_time()
+    if remaining is None or (timeout is not None and remaining > timeout):
+        return timeout
+    return remaining
+
+
+def is_expired(deadline):
+    """Check if a deadline has passed.
+
+    :param float deadline: the deadline as UNIX timestamp or ``None``.
+
+    :rtype: bool
+    """
+    return deadline is not None and deadline <= time.time()
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline):
+    """Expose the deadline of a command to its handler.
+
+    :param float deadline: the deadline as UNIX timestamp or ``None``.
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def add_deadline(properties, timeout):
+    """Add the deadline of a call to the AMQP properties of its command.
+
+    :param dict properties: the AMQP properties of the command.
+    :param float timeout: the timeout of the call or ``None`` if the call waits without a limit.
+
+    :returns: the deadline as UNIX timestamp or ``None`` if there is no deadline.
+    :rtype: float
+    """
+    if timeout is None:
+        return None
+
+    deadline = time.time() + timeout
+    properties.setdefault("headers", {})[DEADLINE_HEADER] = deadline
+    # let the broker discard the command once nobody waits for its response.
+    properties["expiration"] = str(max(1, int(timeout * 1000)))
+    return deadline
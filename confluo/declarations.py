@@ -0,0 +1,84 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the cache of the exchanges, queues and bindings declared by this process.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+
+class DeclarationCache:
+    """Remembers the durable exchanges, queues and bindings declared on a broker.
+
+    Durable declarations survive reconnects and broker restarts,
+    thus they are only declared once per process and broker.
+    Exclusive and auto-deleted queues must not be declared through this cache.
+    """
+    def __init__(self):
+        #: Holds the keys of all declared exchanges, queues and bindings.
+        self.declared = set()
+
+    async def exchange_declare(self, broker, channel, exchange_name, type_name):
+        """Declare a durable exchange unless it is already declared.
+
+        :param str broker: the broker the channel is connected to.
+        :param channel: the channel to declare the exchange on.
+        :param str exchange_name: the name of the exchange.
+        :param str type_name: the type of the exchange.
+        """
+        key = (broker, "exchange", exchange_name, type_name)
+        if key in self.declared:
+            return
+
+        await channel.exchange_declare(exchange_name, type_name=type_name, durable=True)
+        self.declared.add(key)
+
+    async def queue_declare(self, broker, channel, queue_name, arguments=None):
+        """Declare a durable queue unless it is already declared.
+
+        :param str broker: the broker the channel is connected to.
+        :param channel: the channel to declare the queue on.
+        :param str queue_name: the name of the queue.
+        :param dict arguments: the optional arguments of the queue.
+        """
+        key = (broker, "queue", queue_name, tuple(sorted((arguments or {}).items())))
+        if key in self.declared:
+            return
+
+        await channel.queue_declare(queue_name, durable=True, arguments=arguments)
+        self.declared.add(key)
+
+    async def queue_bind(self, broker, channel, queue_name, exchange_name, routing_keys):
+        """Bind a durable queue to an exchange with all routing keys which are not bound yet.
+
+        All bindings but the last are sent without waiting for the broker.
+        The broker handles the methods of a channel in order, thus the
+        confirmation of the last binding confirms all of them.
+
+        :param str broker: the broker the channel is connected to.
+        :param channel: the channel to bind the queue on.
+        :param str queue_name: the name of the queue.
+        :param str exchange_name: the name of the exchange.
+        :param list routing_keys: the routing keys to bind the queue with.
+        """
+        keys = [(broker, "binding", queue_name, exchange_name, routing_key) for routing_key in routing_keys]
+        pending = [key for key in dict.fromkeys(keys) if key not in self.declared]
+        if not pending:
+            return
+
+        for index, key in enumerate(pending):
+            await channel.queue_bind(queue_name, exchange_name=exchange_name, routing_key=key[4],
+                                     no_wait=index < len(pending) - 1)
+        self.declared.update(pending)
+
+    def forget(self, broker):
+        """Forget all declarations on a broker.
+
+        :param str broker: the broker whose declarations may be gone.
+        """
+        self.declared = {key for key in self.declared if key[0] != broker}
+
+
+#: Holds the declarations of this process.
+declarations = DeclarationCache()
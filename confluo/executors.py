@@ -0,0 +1,73 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the executors which run synchronous handlers outside of the event loop.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .errors import ServiceError
+
+
+#: Holds all available executor types by their name.
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+
+def verify_executor(executor):
+    """Verify that the given executor type is valid.
+
+    :param str executor: the executor type to verify.
+
+    :raises ServiceError: if the executor type is unknown.
+    """
+    if executor is not None and executor not in EXECUTORS:
+        raise ServiceError("Unknown executor '{0}'. Use one of {1}.".format(executor, ", ".join(sorted(EXECUTORS))))
+
+
+class HandlerExecutor:
+    """Runs a synchronous handler in a managed thread or process pool.
+
+    The pool is created on the first call so that no worker
+    processes are started for routes which never receive a message.
+    Only the handler arguments and its result cross the process boundary,
+    thus a process handler must be a module-level function.
+
+    :param str executor: the executor type. Either ``thread`` or ``process``.
+    :param int max_workers: the maximum number of workers of the pool.
+    """
+    def __init__(self, executor, max_workers=None):
+        verify_executor(executor)
+
+        #: Holds the executor type.
+        self.executor = executor
+
+        #: Holds the maximum number of workers.
+        self.max_workers = max_workers
+
+        #: Holds the pool running the handlers.
+        self.pool = None
+
+    async def run(self, loop, handler, *args, **kwargs):
+        """Run the handler in the pool and wait for its result.
+
+        :param asyncio.BaseEventLoop loop: the event loop to wait in.
+        :param callable handler: the synchronous handler to run.
+
+        :returns: the result of the handler.
+        """
+        if self.pool is None:
+            self.pool = EXECUTORS[self.executor](max_workers=self.max_workers)
+        return await loop.run_in_executor(self.pool, functools.partial(handler, *args, **kwargs))
+
+    def shutdown(self):
+        """Shutdown the pool once all submitted handlers are finished."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
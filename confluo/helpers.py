@@ -7,14 +7,39 @@
     :license: MIT, see LICENSE for details
 """
 
+import json
+import functools
+
+
+@functools.lru_cache(maxsize=4096)
 def path_to_routing_key(path):
     """Convert a path to a AMQP valid routing key.
 
     It replaces all slashes (/) with dots (.)
     and removes the first slash.
+    The routing keys are cached because the same
+    paths are converted for every published message.
 
     :param str path: the path to convert to a routing key.
     """
     if path.startswith("/"):
         path = path[1:]
     return path.replace("/", ".")
+
+
+def command_key(service_name, path, query, body, *variants):
+    """Create a stable key for a command call.
+
+    Calls with the same service name, path, query, body and variants
+    result in the same key regardless of the order of dictionary keys.
+
+    :param str service_name: the name of the destination service.
+    :param str path: the path of the command.
+    :param dict query: the query data of the command.
+    :param dict body: the body of the command.
+    :param variants: further values the key depends on, e.g. the headers of the command.
+
+    :rtype: str
+    """
+    return json.dumps([service_name, path, query, body, *variants], sort_keys=True, separators=(",", ":"),
+                      default=repr)
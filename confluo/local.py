@@ -0,0 +1,113 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the in-process transport for co-located services.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import uuid
+
+
+class LocalTransport:
+    """Represents a registry of services which run on the same event loop.
+
+    Commands to a registered service are delivered directly without a broker round-trip.
+    Events are only delivered directly to the subscribers which are not connected to a broker
+    because all instances of a service connected to a broker share its event queue.
+    Services which are not registered are still reached via AMQP.
+
+    :param bool zero_copy: flag if the messages are delivered without serialization.
+                           The receivers then share the objects with the sender.
+    """
+    def __init__(self, zero_copy=False):
+        #: Holds the id of this transport.
+        self.id = str(uuid.uuid4())
+
+        #: Holds the flag if the messages are delivered without serialization.
+        self.zero_copy = zero_copy
+
+        #: Holds the registered service instances by their name.
+        self.services = {}
+
+    def register(self, service):
+        """Register a service to receive messages on this transport.
+
+        :param Service service: the service to register.
+        """
+        self.services.setdefault(service.name, []).append(service)
+
+    def unregister(self, service):
+        """Remove a registered service from this transport.
+
+        :param Service service: the service to remove.
+        """
+        instances = self.services.get(service.name, [])
+        if service in instances:
+            instances.remove(service)
+        if not instances:
+            self.services.pop(service.name, None)
+
+    def get(self, name):
+        """Get a registered instance of the service with the given name.
+
+        Multiple instances of a service are used in turn.
+
+        :param str name: the name of the service.
+
+        :returns: the service instance or ``None`` if no instance is registered.
+        :rtype: Service
+        """
+        instances = self.services.get(name)
+        if not instances:
+            return None
+
+        if len(instances) > 1:
+            instances.append(instances.pop(0))
+            return instances[-1]
+        return instances[0]
+
+    def subscribers(self, path):
+        """Get an instance of every registered service subscribed to the given event path
+        which does not receive the events from the broker.
+
+        Multiple instances of a service are used in turn.
+
+        :param str path: the path of the event.
+
+        :returns: the subscribed service instances and their matching routes.
+        :rtype: list
+        """
+        subscribers = []
+        for instances in self.services.values():
+            # an instance connected to a broker receives the event from the event queue of its service.
+            service = next((instance for instance in instances if instance.broker is None), None)
+            if service is None:
+                continue
+
+            routes = service.event_routes.match(path)
+            if routes:
+                instances.remove(service)
+                instances.append(service)
+                subscribers.append((service, routes))
+        return subscribers
+
+    def copy(self, model, codec):
+        """Copy a model for delivery to another service.
+
+        The model is serialized and deserialized with the given codec
+        unless this transport delivers zero-copy.
+
+        :param ProtocolModel model: the model to copy.
+        :param Codec codec: the codec to serialize the model with.
+
+        :returns: the copied model.
+        :rtype: ProtocolModel
+        """
+        if self.zero_copy:
+            return model
+        return type(model).loads(model.dumps(codec), codec)
+
+    def __contains__(self, name):
+        return name in self.services
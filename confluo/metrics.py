@@ -0,0 +1,361 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the metrics of a service and their export in the Prometheus text format.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+import bisect
+
+
+#: Holds the default upper bounds in seconds of the histogram buckets.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Holds the content type of the Prometheus text format.
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Represents a histogram of observed durations.
+
+    :param tuple buckets: the sorted upper bounds of the buckets.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        #: Holds the upper bounds of the buckets.
+        self.buckets = buckets
+
+        #: Holds the number of observations by bucket. The last bucket holds the observations above all bounds.
+        self.counts = [0] * (len(buckets) + 1)
+
+        #: Holds the sum of all observations.
+        self.sum = 0.0
+
+        #: Holds the number of observations.
+        self.count = 0
+
+    def observe(self, value):
+        """Add an observation to the histogram.
+
+        :param float value: the observed value.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    """Format the labels of a sample.
+
+    :param tuple labels: the labels as tuples of name and value.
+
+    :rtype: str
+    """
+    if not labels:
+        return ""
+
+    formatted = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        formatted.append("{0}=\"{1}\"".format(name, value))
+    return "{" + ",".join(formatted) + "}"
+
+
+def render_families(families):
+    """Render metric families in the Prometheus text format.
+
+    :param list families: the metric families as returned by ``Metrics.families``.
+
+    :rtype: str
+    """
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        lines.append("# HELP {0} {1}".format(name, help_text))
+        lines.append("# TYPE {0} {1}".format(name, metric_type))
+        for sample_name, labels, value in samples:
+            lines.append("{0}{1} {2}".format(sample_name, _format_labels(labels), value))
+    return "\n".join(lines) + "\n"
+
+
+def label_gauges(families, name, value):
+    """Add a label to the gauge samples of metric families.
+
+    :param list families: the metric families as returned by ``Metrics.families``.
+    :param str name: the name of the label.
+    :param value: the value of the label.
+
+    :returns: the metric families with the labelled gauges.
+    :rtype: list
+    """
+    label = (name, str(value))
+    return [(family_name, metric_type, help_text,
+             [(sample_name, labels + (label,), sample_value) for sample_name, labels, sample_value in samples]
+             if metric_type == "gauge" else samples)
+            for family_name, metric_type, help_text, samples in families]
+
+
+def merge_families(families_list):
+    """Merge the metric families of multiple processes.
+
+    The values of samples with the same name and labels are summed up.
+    Gauges which are a state of every process, like the age of the oldest
+    in-flight call, must be told apart by a label with ``label_gauges``.
+
+    :param list families_list: the metric families of every process.
+
+    :returns: the merged metric families.
+    :rtype: list
+    """
+    merged = {}
+    for families in families_list:
+        for name, metric_type, help_text, samples in families:
+            _, _, _, values = merged.setdefault(name, (name, metric_type, help_text, {}))
+            for sample_name, labels, value in samples:
+                key = (sample_name, labels)
+                values[key] = values.get(key, 0) + value
+
+    return [(name, metric_type, help_text, [(sample_name, labels, value) for (sample_name, labels), value in values.items()])
+            for name, metric_type, help_text, values in merged.values()]
+
+
+class Metrics:
+    """Holds the metrics of a service.
+
+    Recording only updates counters and histogram buckets in place.
+    All values are formatted on export.
+
+    :param dict labels: the labels added to every exported sample.
+    :param tuple buckets: the upper bounds in seconds of the histogram buckets.
+    """
+    def __init__(self, labels=None, buckets=DEFAULT_BUCKETS):
+        #: Holds the labels added to every exported sample.
+        self.labels = tuple(sorted((labels or {}).items()))
+
+        #: Holds the upper bounds of the histogram buckets.
+        self.buckets = tuple(buckets)
+
+        #: Holds the handler duration histograms by message kind and route path.
+        self.handler_durations = {}
+
+        #: Holds the number of handler calls by message kind, route path and outcome.
+        self.handler_calls = {}
+
+        #: Holds the serialization duration histograms by operation and model name.
+        self.codec_durations = {}
+
+        #: Holds the number of received messages without a route by message kind.
+        self.unrouted = {}
+
+        #: Holds the number of dropped messages which were not decodable by message kind.
+        self.undecodable = {}
+
+        #: Holds the number of received responses without an in-flight call.
+        self.martians = 0
+
+        #: Holds the number of dropped expired commands by stage.
+        self.expired = {}
+
+        #: Holds the queue wait histograms of the commands by priority.
+        self.queue_waits = {}
+
+        #: Holds the raw bytes, compressed bytes and CPU time of the compressions by operation, message kind and route.
+        self.compressions = {}
+
+        #: Holds the metrics collected on export as tuples of name, type, help and function.
+        self.collectors = []
+
+        #: Holds the server of the metrics endpoint.
+        self.server = None
+
+    def observe_handler(self, kind, path, outcome, duration):
+        """Record a finished handler call.
+
+        :param str kind: the kind of the handled message.
+        :param str path: the path of the route.
+        :param str outcome: the outcome of the call. Either ``ok`` or ``error``.
+        :param float duration: the duration of the call in seconds.
+        """
+        key = (kind, path)
+        histogram = self.handler_durations.get(key)
+        if histogram is None:
+            histogram = self.handler_durations[key] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+        key = (kind, path, outcome)
+        self.handler_calls[key] = self.handler_calls.get(key, 0) + 1
+
+    def observe_codec(self, operation, model, duration):
+        """Record the serialization or deserialization of a message.
+
+        :param str operation: either ``encode`` or ``decode``.
+        :param str model: the name of the model.
+        :param float duration: the duration in seconds.
+        """
+        key = (operation, model)
+        histogram = self.codec_durations.get(key)
+        if histogram is None:
+            histogram = self.codec_durations[key] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+    def observe_queue_wait(self, priority, duration):
+        """Record the time a command waited until its handler started.
+
+        :param int priority: the priority of the command.
+        :param float duration: the waiting time in seconds.
+        """
+        histogram = self.queue_waits.get(priority)
+        if histogram is None:
+            histogram = self.queue_waits[priority] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+    def observe_compression(self, operation, kind, path, raw_size, compressed_size, cpu_time):
+        """Record the compression or decompression of a payload.
+
+        :param str operation: either ``compress`` or ``decompress``.
+        :param str kind: the kind of the message.
+        :param str path: the path of the route which handles or answers the message.
+                         An empty path if no route of this service handles the message.
+        :param int raw_size: the size of the uncompressed payload in bytes.
+        :param int compressed_size: the size of the compressed payload in bytes.
+        :param float cpu_time: the CPU time in seconds.
+        """
+        key = (operation, kind, path)
+        totals = self.compressions.get(key)
+        if totals is None:
+            totals = self.compressions[key] = [0, 0, 0.0]
+        totals[0] += raw_size
+        totals[1] += compressed_size
+        totals[2] += cpu_time
+
+    def count_unrouted(self, kind):
+        """Record a received message without a route.
+
+        :param str kind: the kind of the message.
+        """
+        self.unrouted[kind] = self.unrouted.get(kind, 0) + 1
+
+    def count_undecodable(self, kind):
+        """Record a dropped message which was not decodable.
+
+        :param str kind: the kind of the message.
+        """
+        self.undecodable[kind] = self.undecodable.get(kind, 0) + 1
+
+    def count_martian(self):
+        """Record a received response without an in-flight call."""
+        self.martians += 1
+
+    def count_expired(self, stage):
+        """Record a dropped command whose deadline has passed.
+
+        :param str stage: the stage the command was dropped in.
+        """
+        self.expired[stage] = self.expired.get(stage, 0) + 1
+
+    def collect(self, name, metric_type, help_text, func):
+        """Register a metric whose value is collected on export.
+
+        :param str name: the name of the metric.
+        :param str metric_type: the Prometheus type. Either ``counter`` or ``gauge``.
+        :param str help_text: the description of the metric.
+        :param callable func: the function returning the current value.
+        """
+        self.collectors.append((name, metric_type, help_text, func))
+
+    def families(self):
+        """Get the current values of all metrics.
+
+        :returns: the metric families as tuples of name, type, help
+                  and samples. The samples are tuples of sample name, labels and value.
+        :rtype: list
+        """
+        families = []
+
+        def add(name, metric_type, help_text, samples):
+            families.append((name, metric_type, help_text,
+                             [(name, self.labels + labels, value) for labels, value in samples]))
+
+        def add_histograms(name, help_text, histograms, label_names):
+            samples = []
+            for key, histogram in sorted(histograms.items()):
+                labels = self.labels + tuple(zip(label_names, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    samples.append((name + "_bucket", labels + (("le", bound),), cumulative))
+                samples.append((name + "_sum", labels, histogram.sum))
+                samples.append((name + "_count", labels, histogram.count))
+            families.append((name, "histogram", help_text, samples))
+
+        add_histograms("confluo_handler_duration_seconds", "Duration of the message handlers.",
+                       self.handler_durations, ("kind", "route"))
+        add("confluo_handler_calls_total", "counter", "Number of handler calls by outcome.",
+            [(tuple(zip(("kind", "route", "outcome"), key)), count) for key, count in sorted(self.handler_calls.items())])
+        add_histograms("confluo_serialization_duration_seconds", "Duration of the message serialization.",
+                       self.codec_durations, ("operation", "model"))
+        add_histograms("confluo_queue_wait_seconds", "Time the commands waited until their handler started.",
+                       {(priority,): histogram for priority, histogram in self.queue_waits.items()}, ("priority",))
+        add("confluo_unrouted_messages_total", "counter", "Number of received messages without a route.",
+            [((("kind", kind),), count) for kind, count in sorted(self.unrouted.items())])
+        add("confluo_undecodable_messages_total", "counter", "Number of dropped messages which were not decodable.",
+            [((("kind", kind),), count) for kind, count in sorted(self.undecodable.items())])
+        add("confluo_martian_responses_total", "counter", "Number of received responses without an in-flight call.",
+            [((), self.martians)])
+        add("confluo_expired_commands_total", "counter", "Number of dropped commands whose deadline has passed.",
+            [((("stage", stage),), count) for stage, count in sorted(self.expired.items())])
+        compressions = sorted(self.compressions.items())
+        add("confluo_compression_raw_bytes_total", "counter", "Number of uncompressed payload bytes.",
+            [(tuple(zip(("operation", "kind", "route"), key)), totals[0]) for key, totals in compressions])
+        add("confluo_compression_compressed_bytes_total", "counter",
+            "Number of compressed payload bytes. The compression ratio is the quotient of the compressed and raw bytes.",
+            [(tuple(zip(("operation", "kind", "route"), key)), totals[1]) for key, totals in compressions])
+        add("confluo_compression_cpu_seconds_total", "counter", "CPU time spent compressing and decompressing payloads.",
+            [(tuple(zip(("operation", "kind", "route"), key)), totals[2]) for key, totals in compressions])
+        for name, metric_type, help_text, func in self.collectors:
+            add(name, metric_type, help_text, [((), func())])
+        return families
+
+    def render(self):
+        """Render all metrics in the Prometheus text format.
+
+        :rtype: str
+        """
+        return render_families(self.families())
+
+    async def serve(self, host="127.0.0.1", port=9100):
+        """Serve the metrics on a local HTTP endpoint.
+
+        Every request is answered with the rendered metrics.
+
+        :param str host: the host to listen on.
+        :param int port: the port to listen on.
+        """
+        self.server = await asyncio.start_server(self._handle_request, host, port)
+
+    async def _handle_request(self, reader, writer):
+        """Answer a HTTP request with the rendered metrics."""
+        try:
+            # skip the request line and headers.
+            while True:
+                line = await reader.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+
+            body = self.render().encode("utf-8")
+            writer.write("HTTP/1.0 200 OK\r\nContent-Type: {0}\r\nContent-Length: {1}\r\n\r\n".format(
+                PROMETHEUS_CONTENT_TYPE, len(body)).encode("ascii"))
+            writer.write(body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def close(self):
+        """Stop serving the metrics endpoint."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -6,6 +6,7 @@
         - Command
         - Response
         - Event
+        - Route
 
     :copyright: (c) by Timo Furrer
     :license: MIT, see LICENSE for details
@@ -13,63 +14,142 @@
 
 import json
 import asyncio
+import inspect
 
 from .errors import ServiceError
+from .codecs import get_codec
+from .acks import verify_ack_mode
+from .executors import HandlerExecutor
+
+
+#: Holds the name of the AMQP header which contains the size of a separately serialized envelope.
+ENVELOPE_SIZE_HEADER = "x-confluo-envelope-size"
+
+#: Marks a body which is not yet deserialized.
+_UNDECODED = object()
 
 
 class ProtocolModel:
     """Base class for all models which are used
     in a AMQP message.
+
+    The fields of a model are stored in slots.
+    The body can be deserialized lazily on first access
+    if it was serialized separately from the envelope
+    or offloaded to a blob store.
     """
-    def __init__(self, **kwargs):
-        #: Holds all fields for this model
-        self.values = kwargs
+    __slots__ = ("_body", "_raw_body", "_codec")
 
-    @classmethod
-    def loads(cls, payload):
-        """Load a command from an AMQP message payload.
+    #: Holds the names of all fields in the order of the constructor arguments.
+    FIELDS = ()
 
-        :param str payload: a received message payload.
+    #: Holds the names of all fields except the body.
+    ENVELOPE_FIELDS = ()
 
-        :returns: a Command instance
-        :rtype: Command
+    @classmethod
+    def loads(cls, payload, codec=None, envelope_size=None, body_loader=None):
+        """Load a model from an AMQP message payload.
+
+        If an envelope size is given the payload is expected to
+        contain the separately serialized envelope followed by the body.
+        In this case only the envelope is deserialized and the body
+        is deserialized on first access.
+
+        :param bytes payload: a received message payload.
+        :param Codec codec: the codec to deserialize the payload with.
+                            If no codec is given the default JSON codec is used.
+        :param int envelope_size: the size of the envelope in the payload.
+        :param callable body_loader: the function returning the serialized body if it is
+                                     not part of the payload. It is called on first access of the body.
+
+        :returns: a model instance
+        :rtype: ProtocolModel
         """
-        payload_data = json.loads(payload.decode("utf-8"))
+        codec = codec or get_codec()
+        if envelope_size is None:
+            # raises exception if data is invalid.
+            return cls(*cls.verify_data(codec.loads(payload)))
+
+        payload = memoryview(payload)
+        envelope = codec.loads(payload[:envelope_size])
 
         # raises exception if data is invalid.
-        field_values = cls.verify_data(payload_data)
+        field_values = cls.verify_data(envelope, cls.ENVELOPE_FIELDS)
 
-        # create command instance.
-        return cls(**field_values)
+        model = cls.__new__(cls)
+        for field, value in zip(cls.ENVELOPE_FIELDS, field_values):
+            setattr(model, field, value)
+        model._body = _UNDECODED
+        model._raw_body = body_loader if body_loader is not None else payload[envelope_size:]
+        model._codec = codec
+        return model
 
     @classmethod
-    def verify_data(cls, payload_data):
+    def verify_data(cls, payload_data, fields=None):
         """Verify if a received AMQP message payload contains the
-        minimum required attributes for a Command.
+        minimum required attributes for a model.
 
         :param dict payload_data: the recevied payload data.
+        :param tuple fields: the fields to verify. Defaults to all fields of the model.
+
+        :returns: the field values in the order of the fields.
+        :rtype: list
 
         :raises ServiceError: if given payload data is invalid.
         """
-        field_values = {}
         try:
-            for field in cls.FIELDS:
-                field_values[field] = payload_data[field]
+            return [payload_data[field] for field in fields or cls.FIELDS]
         except KeyError as e:
             raise ServiceError("Missing '{0}' field in message.".format(e))
-        else:
-            return field_values
 
-    def __str__(self):
-        """Return the command as an AMQP payload."""
-        return json.dumps(self.values)
+    @property
+    def body(self):
+        """Holds the body of the model."""
+        if self._body is _UNDECODED:
+            raw_body = self._raw_body
+            if callable(raw_body):
+                raw_body = raw_body()
+            self._body = self._codec.loads(raw_body)
+            self._raw_body = None
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+
+    @property
+    def values(self):
+        """Holds all fields of the model as dictionary."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def dumps(self, codec=None):
+        """Return the model as an AMQP payload.
+
+        :param Codec codec: the codec to serialize the model with.
+                            If no codec is given the default JSON codec is used.
+
+        :rtype: bytes
+        """
+        return (codec or get_codec()).dumps(self.values)
 
-    def __getattr__(self, attr):
-        """Get a specific value from the model.
+    def dumps_split(self, codec=None):
+        """Return the model as an AMQP payload with a separately serialized envelope.
 
-        :param str attr: the name of the field.
+        The payload can be loaded with ``loads`` by passing the returned envelope size.
+
+        :param Codec codec: the codec to serialize the model with.
+                            If no codec is given the default JSON codec is used.
+
+        :returns: the AMQP payload and the size of the envelope in it.
+        :rtype: tuple
         """
-        return self.values[attr]
+        codec = codec or get_codec()
+        envelope = codec.dumps({field: getattr(self, field) for field in self.ENVELOPE_FIELDS})
+        return envelope + codec.dumps(self.body), len(envelope)
+
+    def __str__(self):
+        """Return the model as a JSON string."""
+        return json.dumps(self.values)
 
 
 class Command(ProtocolModel):
@@ -80,10 +160,16 @@ class Command(ProtocolModel):
     :param dict body: the body for this command.
     :param dict headers: the headers for this command.
     """
-    FIELDS = ["path", "query", "body", "headers"]
+    __slots__ = ("path", "query", "headers")
+
+    FIELDS = ("path", "query", "body", "headers")
+    ENVELOPE_FIELDS = ("path", "query", "headers")
 
     def __init__(self, path, query, body, headers=None):
-        super().__init__(path=path, query=query, body=body, headers=headers)
+        self.path = path
+        self.query = query
+        self._body = body
+        self.headers = headers
 
 
 class Response(ProtocolModel):
@@ -93,10 +179,16 @@ class Response(ProtocolModel):
     :param dict body: the body for this response.
     :param dict headers: the headers for this response.
     """
-    FIELDS = ["path", "body", "status_code", "headers"]
+    __slots__ = ("path", "status_code", "headers")
+
+    FIELDS = ("path", "body", "status_code", "headers")
+    ENVELOPE_FIELDS = ("path", "status_code", "headers")
 
     def __init__(self, path, body, status_code=200, headers=None):
-        super().__init__(path=path, body=body, status_code=status_code, headers=headers)
+        self.path = path
+        self._body = body
+        self.status_code = status_code
+        self.headers = headers
 
 
 class Event(ProtocolModel):
@@ -106,21 +198,112 @@ class Event(ProtocolModel):
     :param dict body: the body for this event.
     :param dict headers: the headers for this event.
     """
-    FIELDS = ["path", "body", "headers"]
+    __slots__ = ("path", "headers")
+
+    FIELDS = ("path", "body", "headers")
+    ENVELOPE_FIELDS = ("path", "headers")
 
     def __init__(self, path, body, headers=None):
-        super().__init__(path=path, body=body, headers=headers)
+        self.path = path
+        self._body = body
+        self.headers = headers
 
 
 class CommandTransaction:
     """Represents a Command transaction.
 
-    It contains the received Response and
-    an Event object.
+    It contains the future which is resolved
+    with the received Response.
+
+    :param str message_id: the id of the sent command message.
+    :param asyncio.Future future: the future to resolve with the response.
+    :param float started: the loop time at which the command was sent.
+    :param float deadline: the loop time at which the transaction times out or ``None``.
+    """
+    __slots__ = ("message_id", "future", "started", "deadline")
+
+    def __init__(self, message_id, future, started, deadline):
+        #: Holds the id of the sent command message.
+        self.message_id = message_id
+
+        #: Holds the future resolved with the received Response.
+        self.future = future
+
+        #: Holds the loop time at which the command was sent.
+        self.started = started
+
+        #: Holds the loop time at which the transaction times out.
+        self.deadline = deadline
+
+
+class Route:
+    """Represents a registered command or event handler.
+
+    :param str path: the path the handler is registered for.
+    :param callable handler: the coroutine function to call for a message,
+                             an async generator function to stream the response of a command or
+                             a plain function if the route has an executor.
+    :param int concurrency: the maximum number of concurrently running
+                            handlers for this route. ``None`` means unlimited.
+    :param str ack: the acknowledgement mode for this route.
+                    ``None`` means the mode of the service is used.
+    :param float max_age: the time in seconds callers may cache the responses of this route.
+                          ``None`` means the responses are not marked as cacheable.
+    :param str executor: the type of the pool to run the handler in. Either ``thread`` or ``process``.
+                         ``None`` means the handler is a coroutine function running on the event loop.
+    :param int max_workers: the maximum number of workers of the pool.
+    :param int priority: the priority of the commands which are sent without priority.
+
+    :raises ServiceError: if a coroutine or async generator function should run in an executor.
     """
-    def __init__(self):
-        #: Holds the event object
-        self.event = asyncio.Event()
+    def __init__(self, path, handler, concurrency=None, ack=None, max_age=None, executor=None, max_workers=None,
+                 priority=None):
+        verify_ack_mode(ack)
+        if executor and (inspect.iscoroutinefunction(handler) or inspect.isasyncgenfunction(handler)):
+            raise ServiceError("The handler for path '{0}' must be a plain function to run in an executor.".format(path))
+
+        #: Holds the path of this route.
+        self.path = path
+
+        #: Holds the handler coroutine function.
+        self.handler = handler
+
+        #: Holds the maximum number of concurrently running handlers.
+        self.concurrency = concurrency
+
+        #: Holds the semaphore limiting the concurrently running handlers once it is created.
+        self._semaphore = None
+
+        #: Holds the acknowledgement mode.
+        self.ack = ack
+
+        #: Holds the time callers may cache the responses.
+        self.max_age = max_age
+
+        #: Holds the flag if the handler streams its response.
+        self.streaming = inspect.isasyncgenfunction(handler)
+
+        #: Holds the executor running a synchronous handler.
+        self.executor = HandlerExecutor(executor, max_workers) if executor else None
+
+        #: Holds the priority of the commands which are sent without priority.
+        self.priority = priority
+
+    @property
+    def semaphore(self):
+        """Get the semaphore limiting the concurrently running handlers.
+
+        The semaphore is created on first use, thus it belongs to the event
+        loop running the handlers and not to the loop of a supervisor which
+        forks the workers.
+
+        :returns: the semaphore or ``None`` if the concurrency is unlimited.
+        :rtype: asyncio.Semaphore
+        """
+        if self._semaphore is None and self.concurrency:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
 
-        #: Holds the received Response for the Command.
-        self.response = None
+    def reset_semaphore(self):
+        """Discard the semaphore so that it is created again in another event loop."""
+        self._semaphore = None
@@ -0,0 +1,60 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the pool of AMQP channels used to publish messages.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+
+class ChannelPool:
+    """Represents a pool of AMQP channels to publish messages.
+
+    Concurrent publishers check out a channel from the pool
+    instead of serializing on a single shared channel.
+
+    :param int size: the number of channels in the pool.
+    """
+    def __init__(self, size):
+        #: Holds the number of channels in the pool.
+        self.size = size
+
+        #: Holds all channels of the pool.
+        self.channels = []
+
+        #: Holds the channels which are currently not checked out.
+        self.free_channels = asyncio.Queue()
+
+    async def open(self, protocol):
+        """Open all channels of the pool on the given protocol.
+
+        Channels of a previously opened pool are discarded.
+
+        :param protocol: the AMQP protocol to open the channels on.
+        """
+        self.channels = []
+        self.free_channels = asyncio.Queue()
+        for _ in range(self.size):
+            channel = await protocol.channel()
+            self.channels.append(channel)
+            self.free_channels.put_nowait(channel)
+
+    async def acquire(self):
+        """Check out a channel from the pool.
+
+        Waits until a channel is released if all channels are checked out.
+
+        :returns: the checked out channel
+        """
+        return await self.free_channels.get()
+
+    def release(self, channel):
+        """Return a checked out channel to the pool.
+
+        :param channel: the channel to return.
+        """
+        if channel in self.channels:
+            self.free_channels.put_nowait(channel)
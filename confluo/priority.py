@@ -0,0 +1,101 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the priority lanes of the handler pool.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+import collections
+
+
+#: Holds the name of the AMQP header which contains the time a command was sent.
+SENT_AT_HEADER = "x-confluo-sent-at"
+
+
+class PrioritySemaphore:
+    """Represents a semaphore whose waiters are served by priority with weighted fairness.
+
+    Every priority is a lane of waiters served in FIFO order. The lanes
+    are served by stride scheduling with a weight of ``priority + 1``,
+    thus a lane of priority 9 gets ten times the free slots of a lane
+    of priority 0 while both are waiting, but no lane starves.
+
+    :param int value: the number of available slots.
+    """
+    def __init__(self, value):
+        #: Holds the number of available slots.
+        self.value = value
+
+        #: Holds the futures of the waiters by priority.
+        self.lanes = {}
+
+        #: Holds the virtual time of the next slot of every waiting lane.
+        self.passes = {}
+
+        #: Holds the virtual time of the last served slot.
+        self.virtual_time = 0.0
+
+    def locked(self):
+        """Check if no slot is available.
+
+        :rtype: bool
+        """
+        return self.value == 0
+
+    @property
+    def waiting(self):
+        """Get the number of waiters by priority.
+
+        :rtype: dict
+        """
+        return {priority: sum(1 for future in lane if not future.done()) for priority, lane in self.lanes.items()}
+
+    async def acquire(self, priority=0):
+        """Wait for a free slot.
+
+        :param int priority: the priority of the waiter.
+
+        :returns: ``True`` once a slot is acquired.
+        :rtype: bool
+        """
+        if self.value > 0:
+            self.value -= 1
+            return True
+
+        lane = self.lanes.get(priority)
+        if lane is None:
+            lane = self.lanes[priority] = collections.deque()
+            # an idle lane does not save up slots for later.
+            self.passes[priority] = max(self.passes.get(priority, 0.0), self.virtual_time)
+
+        future = asyncio.get_running_loop().create_future()
+        lane.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # the slot was passed to this waiter before it was cancelled.
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        """Pass a slot to the next waiter or make it available."""
+        while self.lanes:
+            priority = min(self.lanes, key=lambda p: (self.passes[p], -p))
+            lane = self.lanes[priority]
+            future = lane.popleft()
+            if not lane:
+                del self.lanes[priority]
+            if future.done():
+                continue
+
+            self.virtual_time = self.passes[priority]
+            self.passes[priority] += 1.0 / (priority + 1)
+            future.set_result(None)
+            return
+
+        self.value += 1
@@ -0,0 +1,232 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the buffered publisher which sends messages in batches with publisher confirms.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from .errors import ServiceError
+
+
+class BatchPublisher:
+    """Publishes messages in batches on a channel in confirm mode.
+
+    The messages are buffered until the batch size is reached or
+    the delay has passed and are then sent at once. The broker confirms
+    are tracked by delivery tag and a single confirm with the ``multiple``
+    flag confirms all messages up to its delivery tag. Publishing waits
+    if the window of unconfirmed messages is full.
+
+    :param channel: the channel to publish the messages on.
+    :param asyncio.BaseEventLoop loop: the event loop to schedule the sending in.
+    :param str exchange_name: the name of the exchange to publish to.
+    :param int batch_size: the number of buffered messages which triggers sending.
+    :param float delay: the maximum time in seconds a message is buffered.
+    :param int window: the maximum number of unconfirmed messages.
+    """
+    def __init__(self, channel, loop, exchange_name, batch_size=100, delay=0.005, window=1000):
+        #: Holds the channel to publish the messages on.
+        self.channel = channel
+
+        #: Holds the asyncio loop
+        self.loop = loop
+
+        #: Holds the name of the exchange to publish to.
+        self.exchange_name = exchange_name
+
+        #: Holds the number of buffered messages which triggers sending.
+        self.batch_size = batch_size
+
+        #: Holds the maximum time a message is buffered.
+        self.delay = delay
+
+        #: Holds the semaphore limiting the unconfirmed messages.
+        self.window = asyncio.Semaphore(window)
+
+        #: Holds the buffered messages as tuples of routing key, payload, properties and confirm future.
+        self.buffer = []
+
+        #: Holds the confirm futures of the sent messages by delivery tag in sending order.
+        self.unconfirmed = {}
+
+        #: Holds the delivery tag of the last sent message.
+        self.delivery_tag = 0
+
+        #: Holds the lock serializing the sending of batches.
+        self.send_lock = asyncio.Lock()
+
+        #: Holds the timer to send the buffered messages.
+        self.timer = None
+
+        #: Holds the number of messages rejected by the broker.
+        self.rejected = 0
+
+    async def open(self):
+        """Put the channel in confirm mode and track the confirms."""
+        await self.channel.confirm_select()
+        # aioamqp resolves every confirm on its own, thus the confirms are handled here.
+        self.channel.basic_server_ack = self._on_ack
+        self.channel.basic_server_nack = self._on_nack
+
+    async def publish(self, routing_key, payload, properties):
+        """Buffer a message to publish.
+
+        Waits if the window of unconfirmed messages is full.
+
+        :param str routing_key: the routing key of the message.
+        :param bytes payload: the AMQP payload.
+        :param dict properties: the AMQP properties of the message.
+
+        :returns: the future which is resolved once the broker confirmed the message.
+        :rtype: asyncio.Future
+        """
+        await self.window.acquire()
+        future = self.loop.create_future()
+        # do not report rejections as unretrieved if nobody waits for the confirm.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.buffer.append((routing_key, payload, properties, future))
+
+        if len(self.buffer) >= self.batch_size:
+            await self.send()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(self.delay, self._on_timer)
+        return future
+
+    def _on_timer(self):
+        """Send the buffered messages after the delay has passed."""
+        self.timer = None
+        task = self.loop.create_task(self.send())
+        # a failed send is reported by the confirm futures of its messages.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def send(self):
+        """Send all buffered messages at once.
+
+        If sending a message fails the confirm futures of it and of all
+        messages of the batch which were not sent yet fail with the error.
+
+        :raises Exception: the error of the failed publish.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        async with self.send_lock:
+            messages, self.buffer = self.buffer, []
+            for index, (routing_key, payload, properties, future) in enumerate(messages):
+                self.delivery_tag += 1
+                self.unconfirmed[self.delivery_tag] = future
+                try:
+                    await self.channel.basic_publish(payload=payload, exchange_name=self.exchange_name,
+                                                     routing_key=routing_key, properties=properties)
+                except BaseException as error:
+                    self._fail_unsent(self.delivery_tag, messages[index + 1:], error)
+                    raise
+
+    def _fail_unsent(self, delivery_tag, messages, error):
+        """Fail the confirm futures of the messages which were not sent.
+
+        :param int delivery_tag: the delivery tag of the message whose publish failed.
+        :param list messages: the buffered messages after it which were not sent.
+        :param BaseException error: the error of the failed publish.
+        """
+        futures = [_future for _, _, _, _future in messages]
+        future = self.unconfirmed.pop(delivery_tag, None)
+        if future is not None:
+            futures.insert(0, future)
+
+        if not isinstance(error, Exception):
+            error = ServiceError("Publishing the message was interrupted.")
+        for future in futures:
+            self.window.release()
+            if not future.done():
+                future.set_exception(error)
+
+    async def flush(self):
+        """Send all buffered messages and wait until the broker confirmed them.
+
+        :raises ServiceError: if the broker rejected any of the messages waiting for a confirm.
+                              Rejections received before the flush are only
+                              reported by the future of the message.
+        """
+        await self.send()
+        futures = list(self.unconfirmed.values())
+        if not futures:
+            return
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        rejected = sum(1 for result in results if isinstance(result, Exception))
+        if rejected:
+            raise ServiceError("{0} of {1} messages were rejected by the broker.".format(rejected, len(results)))
+
+    def abort(self, error):
+        """Stop publishing because the channel is lost.
+
+        The messages waiting for a confirm fail with the given error
+        since it is unknown if the broker received them. The confirm futures
+        of the buffered messages are resolved with ``None``.
+
+        :param Exception error: the error to fail the unconfirmed messages with.
+
+        :returns: the buffered messages which were not sent as tuples of routing key, payload and properties.
+        :rtype: list
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        unconfirmed, self.unconfirmed = self.unconfirmed, {}
+        for future in unconfirmed.values():
+            self.window.release()
+            if not future.done():
+                future.set_exception(error)
+
+        messages, self.buffer = self.buffer, []
+        for _, _, _, future in messages:
+            self.window.release()
+            if not future.done():
+                future.set_result(None)
+        return [(routing_key, payload, properties) for routing_key, payload, properties, _ in messages]
+
+    def _confirm(self, delivery_tag, multiple, error=None):
+        """Resolve the confirm futures of the given delivery tag.
+
+        :param int delivery_tag: the confirmed delivery tag.
+        :param bool multiple: flag if all messages up to the delivery tag are confirmed.
+        :param Exception error: the error to set if the messages were rejected.
+        """
+        if multiple:
+            delivery_tags = []
+            for tag in self.unconfirmed:
+                if tag > delivery_tag:
+                    break
+                delivery_tags.append(tag)
+        else:
+            delivery_tags = [delivery_tag]
+
+        for tag in delivery_tags:
+            future = self.unconfirmed.pop(tag, None)
+            if future is None:
+                continue
+
+            self.window.release()
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(True)
+            else:
+                self.rejected += 1
+                future.set_exception(error)
+
+    async def _on_ack(self, frame):
+        """Handle a broker confirm."""
+        self._confirm(frame.delivery_tag, frame.multiple)
+
+    async def _on_nack(self, frame, delivery_tag=None):
+        """Handle a broker rejection."""
+        self._confirm(frame.delivery_tag, frame.multiple,
+                      ServiceError("Message {0} was rejected by the broker.".format(frame.delivery_tag)))
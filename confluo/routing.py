@@ -0,0 +1,339 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the routers which map message paths to routes.
+    The routers in this module are:
+        - TopicRouter
+        - CommandRouter
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import re
+
+from .errors import ServiceError
+from .helpers import path_to_routing_key
+
+
+class _TopicNode:
+    """Represents a node in the trie of a ``TopicRouter``."""
+    __slots__ = ("children", "routes", "is_wildcard")
+
+    def __init__(self, is_wildcard=False):
+        #: Holds the child nodes by their word.
+        self.children = {}
+
+        #: Holds the routes of the patterns ending in this node.
+        self.routes = []
+
+        #: Holds the flag if this node is a ``#`` node matching multiple words.
+        self.is_wildcard = is_wildcard
+
+
+class TopicRouter:
+    """Router for event paths supporting AMQP topic wildcards.
+
+    The paths are converted to routing keys and split into words.
+    In a pattern ``*`` matches exactly one word and ``#`` matches
+    zero or more words. All patterns are compiled into a trie which
+    is traversed word by word, thus the matching time is proportional
+    to the depth of the matched path.
+    """
+    def __init__(self):
+        #: Holds the root node of the trie.
+        self.root = _TopicNode()
+
+        #: Holds all registered routes by their pattern.
+        self.routes = {}
+
+    def add(self, pattern, route):
+        """Add a route for the given pattern.
+
+        :param str pattern: the path pattern of the route.
+        :param Route route: the route to add.
+
+        :raises ServiceError: if a route for the pattern is already registered.
+        """
+        if pattern in self.routes:
+            raise ServiceError("Event route with path '{0}' already registered.".format(pattern))
+
+        node = self.root
+        for word in path_to_routing_key(pattern).split("."):
+            child = node.children.get(word)
+            if child is None:
+                child = node.children[word] = _TopicNode(is_wildcard=word == "#")
+            node = child
+        node.routes.append(route)
+        self.routes[pattern] = route
+
+    def match(self, path):
+        """Get all routes with a pattern matching the given path.
+
+        :param str path: the path to match.
+
+        :returns: the matching routes.
+        :rtype: list
+        """
+        nodes = self._expand([self.root])
+        for word in path_to_routing_key(path).split("."):
+            next_nodes = []
+            for node in nodes:
+                if node.is_wildcard:
+                    next_nodes.append(node)
+                child = node.children.get(word)
+                if child is not None:
+                    next_nodes.append(child)
+                child = node.children.get("*")
+                if child is not None:
+                    next_nodes.append(child)
+            if not next_nodes:
+                return []
+            nodes = self._expand(next_nodes)
+
+        return [route for node in nodes for route in node.routes]
+
+    @staticmethod
+    def _expand(nodes):
+        """Add all ``#`` nodes reachable by matching zero words.
+
+        :param list nodes: the nodes to expand.
+
+        :returns: the expanded nodes without duplicates.
+        :rtype: list
+        """
+        expanded = []
+        seen = set()
+        while nodes:
+            node = nodes.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            expanded.append(node)
+            child = node.children.get("#")
+            if child is not None:
+                nodes.append(child)
+        return expanded
+
+    def __contains__(self, pattern):
+        return pattern in self.routes
+
+    def __iter__(self):
+        return iter(self.routes)
+
+    def __len__(self):
+        return len(self.routes)
+
+
+#: Holds the regular expression matching the path segment of an ``int`` parameter.
+_INT_REGEX = re.compile(r"-?[0-9]+")
+
+#: Holds the regular expression matching the path segment of a ``float`` parameter.
+_FLOAT_REGEX = re.compile(r"-?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?")
+
+
+def _convert_str(segment):
+    """Convert a non-empty path segment to a ``str`` parameter.
+
+    :param str segment: the path segment.
+
+    :rtype: str
+
+    :raises ValueError: if the segment is empty.
+    """
+    if not segment:
+        raise ValueError("Empty path segment.")
+    return segment
+
+
+def _convert_int(segment):
+    """Convert a path segment of decimal digits with an optional leading ``-`` to an ``int`` parameter.
+
+    :param str segment: the path segment.
+
+    :rtype: int
+
+    :raises ValueError: if the segment is not an integer.
+    """
+    if _INT_REGEX.fullmatch(segment) is None:
+        raise ValueError("Invalid integer path segment '{0}'.".format(segment))
+    return int(segment)
+
+
+def _convert_float(segment):
+    """Convert a path segment of a decimal number to a ``float`` parameter.
+
+    :param str segment: the path segment.
+
+    :rtype: float
+
+    :raises ValueError: if the segment is not a decimal number.
+    """
+    if _FLOAT_REGEX.fullmatch(segment) is None:
+        raise ValueError("Invalid float path segment '{0}'.".format(segment))
+    return float(segment)
+
+
+#: Holds the converters which can be used in path templates by their name.
+#: The converters are strict, thus the path of a parameter is unambiguous.
+CONVERTERS = {
+    "str": _convert_str,
+    "int": _convert_int,
+    "float": _convert_float,
+}
+
+#: Holds the regular expression matching a parameter segment in a path template.
+PARAMETER_REGEX = re.compile(r"^\{(\w+)(?::(\w+))?\}$")
+
+#: Holds the parameter names which clash with the positional arguments of the command handlers.
+RESERVED_PARAMETERS = frozenset(["path", "query", "headers", "body"])
+
+
+class _PathNode:
+    """Represents a node in the tree of a ``CommandRouter``."""
+    __slots__ = ("children", "parameter", "route")
+
+    def __init__(self):
+        #: Holds the static child nodes by their path segment.
+        self.children = {}
+
+        #: Holds the parameter child node as tuple of name, converter name, converter and node or ``None``.
+        self.parameter = None
+
+        #: Holds the route of the template ending in this node.
+        self.route = None
+
+
+class CommandRouter:
+    """Router for command paths supporting parameterized path templates.
+
+    A path template like ``/users/{id}/orders/{order_id:int}`` contains
+    parameter segments with an optional converter. The templates are
+    compiled into a tree of path segments, thus the matching time is
+    proportional to the length of the path and not to the number of routes.
+    Static segments take precedence over parameter segments. All templates
+    must use the same parameter name and converter at the same position.
+    """
+    def __init__(self):
+        #: Holds the root node of the tree.
+        self.root = _PathNode()
+
+        #: Holds all registered routes by their path template.
+        self.routes = {}
+
+        #: Holds the routes of templates without parameters by their path.
+        self.static_routes = {}
+
+    def add(self, template, route):
+        """Add a route for the given path template.
+
+        :param str template: the path template of the route.
+        :param Route route: the route to add.
+
+        :raises ServiceError: if a route for the template is already registered,
+                              the template uses an unknown converter, a reserved parameter
+                              name or a parameter conflicts with a parameter of another template.
+        """
+        if template in self.routes:
+            raise ServiceError("Command route with path '{0}' already registered.".format(template))
+
+        node = self.root
+        has_parameters = False
+        for segment in template.split("/"):
+            match = PARAMETER_REGEX.match(segment)
+            if match is None:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _PathNode()
+                node = child
+                continue
+
+            has_parameters = True
+            name, converter_name = match.group(1), match.group(2) or "str"
+            if name in RESERVED_PARAMETERS:
+                # the parameters are passed as keyword arguments next to the positional handler arguments.
+                raise ServiceError("Parameter '{{{0}}}' in path '{1}' uses a reserved name.".format(name, template))
+
+            try:
+                converter = CONVERTERS[converter_name]
+            except KeyError:
+                raise ServiceError("Unknown converter '{0}' in path '{1}'.".format(converter_name, template))
+
+            if node.parameter is None:
+                node.parameter = (name, converter_name, converter, _PathNode())
+            elif node.parameter[:2] != (name, converter_name):
+                # the route of the second parameter would never be matched.
+                raise ServiceError("Parameter '{{{0}:{1}}}' in path '{2}' conflicts with parameter '{{{3}:{4}}}' "
+                                   "of another route.".format(name, converter_name, template, *node.parameter[:2]))
+            node = node.parameter[3]
+
+        if node.route is not None:
+            raise ServiceError("Command route with path '{0}' conflicts with '{1}'.".format(
+                template, node.route.path))
+
+        node.route = route
+        self.routes[template] = route
+        if not has_parameters:
+            self.static_routes[template] = route
+
+    def match(self, path):
+        """Get the route matching the given path and the converted path parameters.
+
+        :param str path: the path to match.
+
+        :returns: the matching route and the path parameters or ``None`` if no route matches.
+        :rtype: tuple
+        """
+        route = self.static_routes.get(path)
+        if route is not None:
+            return route, {}
+
+        parameters = {}
+        route = self._match(self.root, path.split("/"), 0, parameters)
+        if route is None:
+            return None
+        return route, parameters
+
+    def _match(self, node, segments, index, parameters):
+        """Match the remaining path segments starting at the given node.
+
+        :param _PathNode node: the node to start matching from.
+        :param list segments: all segments of the path.
+        :param int index: the index of the next segment to match.
+        :param dict parameters: the dictionary to store the converted path parameters in.
+
+        :returns: the matching route or ``None``.
+        :rtype: Route
+        """
+        if index == len(segments):
+            return node.route
+
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            route = self._match(child, segments, index + 1, parameters)
+            if route is not None:
+                return route
+
+        if node.parameter is None:
+            return None
+
+        name, _, converter, child = node.parameter
+        try:
+            value = converter(segment)
+        except ValueError:
+            return None
+
+        route = self._match(child, segments, index + 1, parameters)
+        if route is not None:
+            parameters[name] = value
+        return route
+
+    def __contains__(self, template):
+        return template in self.routes
+
+    def __iter__(self):
+        return iter(self.routes)
+
+    def __len__(self):
+        return len(self.routes)
@@ -0,0 +1,266 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the spool of the outbound messages sent while the broker is not reachable.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import mmap
+import struct
+import pickle
+import collections
+
+from .errors import ServiceError
+
+
+#: Holds the available policies if the spool is full.
+SPOOL_POLICIES = ("drop-oldest", "drop-newest", "error")
+
+#: Holds the struct of the length prefix of a record in the ring file.
+_RECORD_HEADER = struct.Struct("!I")
+
+#: Holds the length prefix which marks the unused end of the ring file.
+_WRAP_MARKER = 0xFFFFFFFF
+
+
+def verify_spool_policy(policy):
+    """Verify that the given spool policy is valid.
+
+    :param str policy: the spool policy to verify.
+
+    :raises ServiceError: if the spool policy is unknown.
+    """
+    if policy not in SPOOL_POLICIES:
+        raise ServiceError("Unknown spool policy '{0}'. Use one of {1}.".format(policy, ", ".join(SPOOL_POLICIES)))
+
+
+class DiskRing:
+    """Represents a ring buffer of records in a memory-mapped file.
+
+    The file only holds the overflow of a running process and is
+    truncated when the ring is opened.
+
+    :param str path: the path of the ring file.
+    :param int capacity: the size of the ring file in bytes.
+    """
+    def __init__(self, path, capacity):
+        #: Holds the path of the ring file.
+        self.path = path
+
+        #: Holds the size of the ring file in bytes.
+        self.capacity = capacity
+
+        #: Holds the offset of the oldest record.
+        self.head = 0
+
+        #: Holds the offset to write the next record to.
+        self.tail = 0
+
+        #: Holds the number of used bytes including the unused end of a wrapped ring.
+        self.used = 0
+
+        #: Holds the number of records in the ring.
+        self.count = 0
+
+        with open(path, "w+b") as ring_file:
+            ring_file.truncate(capacity)
+            #: Holds the memory map of the ring file.
+            self.map = mmap.mmap(ring_file.fileno(), capacity)
+
+    def put(self, data):
+        """Append a record to the ring.
+
+        :param bytes data: the record to append.
+
+        :returns: if the record fit into the ring.
+        :rtype: bool
+        """
+        size = _RECORD_HEADER.size + len(data)
+        if self.tail + size > self.capacity:
+            # the record does not fit at the end, thus the ring wraps to the start.
+            waste = self.capacity - self.tail
+            if self.used + waste + size > self.capacity:
+                return False
+            if waste >= _RECORD_HEADER.size:
+                _RECORD_HEADER.pack_into(self.map, self.tail, _WRAP_MARKER)
+            self.used += waste
+            self.tail = 0
+        elif self.used + size > self.capacity:
+            return False
+
+        _RECORD_HEADER.pack_into(self.map, self.tail, len(data))
+        self.map[self.tail + _RECORD_HEADER.size:self.tail + size] = data
+        self.tail += size
+        self.used += size
+        self.count += 1
+        return True
+
+    def get(self):
+        """Remove the oldest record from the ring.
+
+        :returns: the oldest record or ``None`` if the ring is empty.
+        :rtype: bytes
+        """
+        if not self.count:
+            return None
+
+        remaining = self.capacity - self.head
+        if remaining < _RECORD_HEADER.size or _RECORD_HEADER.unpack_from(self.map, self.head)[0] == _WRAP_MARKER:
+            self.used -= remaining
+            self.head = 0
+
+        length, = _RECORD_HEADER.unpack_from(self.map, self.head)
+        start = self.head + _RECORD_HEADER.size
+        data = bytes(self.map[start:start + length])
+        self.head = start + length
+        self.used -= _RECORD_HEADER.size + length
+        self.count -= 1
+        if not self.count:
+            self.head = self.tail = self.used = 0
+        return data
+
+    def close(self):
+        """Close and remove the ring file."""
+        self.map.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return self.count
+
+
+class Spool:
+    """Holds the outbound messages in the order they were sent while the broker is not reachable.
+
+    The messages are held in memory. If a ring file is configured the messages
+    which do not fit into memory overflow to the ring file. Once a message
+    overflowed the following messages are also written to the ring file
+    until it is drained so that the messages stay in order.
+    The ring file is only created once the spool is opened, thus every
+    process opens its own ring file.
+
+    :param int maxsize: the maximum number of messages held in memory.
+    :param str policy: the policy if the spool is full. Either ``drop-oldest``,
+                       ``drop-newest`` or ``error``.
+    :param str path: the path of the ring file to overflow to or ``None``.
+    :param int file_size: the size of the ring file in bytes.
+    """
+    def __init__(self, maxsize, policy="drop-oldest", path=None, file_size=64 * 1024 * 1024):
+        verify_spool_policy(policy)
+
+        #: Holds the maximum number of messages held in memory.
+        self.maxsize = maxsize
+
+        #: Holds the policy if the spool is full.
+        self.policy = policy
+
+        #: Holds the messages held in memory.
+        self.messages = collections.deque()
+
+        #: Holds the path of the ring file to overflow to.
+        self.path = path
+
+        #: Holds the size of the ring file in bytes.
+        self.file_size = file_size
+
+        #: Holds the ring file the messages overflow to once the spool is opened.
+        self.ring = None
+
+        #: Holds the number of dropped messages.
+        self.dropped = 0
+
+    def put(self, message):
+        """Add a message to the spool.
+
+        A message which has to overflow to the ring file but is larger
+        than the ring file is dropped without dropping other messages.
+
+        :param tuple message: the message to spool. It must be picklable if a ring file is configured.
+
+        :returns: if the message was spooled. ``False`` if it was dropped.
+        :rtype: bool
+
+        :raises ServiceError: if the spool is full and the policy is ``error``.
+        """
+        data = None
+        if self.ring is not None and (self.ring or len(self.messages) >= self.maxsize):
+            # the message has to overflow to the ring file.
+            data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+            if _RECORD_HEADER.size + len(data) > self.ring.capacity:
+                self.dropped += 1
+                return False
+
+        while not self._put(message, data):
+            if self.policy == "error":
+                raise ServiceError("The spool of outbound messages is full.")
+            if self.policy == "drop-newest" or not self:
+                self.dropped += 1
+                return False
+
+            self.dropped += 1
+            if not self.messages:
+                # the memory is drained first, thus the oldest message may be in the ring file.
+                self.ring.get()
+                continue
+
+            self.messages.popleft()
+            # keep the memory filled with the oldest messages.
+            if self.ring is not None and self.ring:
+                self.messages.append(pickle.loads(self.ring.get()))
+        return True
+
+    def _put(self, message, data=None):
+        """Add a message to the memory or the ring file if there is space left.
+
+        :param tuple message: the message to add.
+        :param bytes data: the pickled message if it is already pickled.
+
+        :rtype: bool
+        """
+        if len(self.messages) < self.maxsize and (self.ring is None or not self.ring):
+            self.messages.append(message)
+            return True
+        if self.ring is not None:
+            return self.ring.put(data if data is not None else pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+        return False
+
+    def get(self):
+        """Remove the oldest message from the spool.
+
+        :returns: the oldest message or ``None`` if the spool is empty.
+        :rtype: tuple
+        """
+        if self.messages:
+            return self.messages.popleft()
+        if self.ring is not None and self.ring:
+            return pickle.loads(self.ring.get())
+        return None
+
+    def requeue(self, messages):
+        """Put messages which failed to send back in front of the spool.
+
+        :param list messages: the messages in the order they were taken from the spool.
+        """
+        self.messages.extendleft(reversed(messages))
+
+    def open(self):
+        """Create the ring file if one is configured and it is not open yet."""
+        if self.path and self.ring is None:
+            self.ring = DiskRing(self.path, self.file_size)
+
+    def close(self):
+        """Close and remove the ring file.
+
+        The messages which are spooled afterwards are only held in memory.
+        """
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __len__(self):
+        return len(self.messages) + (len(self.ring) if self.ring is not None else 0)
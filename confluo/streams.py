@@ -0,0 +1,163 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the flow controlled streaming of command responses.
+
+    A streaming command handler is an async generator. Every yielded chunk
+    is sent as a response frame under the correlation id of the command
+    followed by an end frame. The caller grants the handler a window of frames
+    and returns credits as it consumes the frames, thus a slow consumer is not flooded.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from .errors import ServiceError
+
+
+#: Holds the name of the AMQP header which contains the sequence number of a response frame.
+STREAM_HEADER = "x-confluo-stream"
+
+#: Holds the name of the AMQP header which marks the last response frame.
+STREAM_END_HEADER = "x-confluo-stream-end"
+
+#: Holds the name of the AMQP header which contains the window of frames a caller accepts.
+STREAM_WINDOW_HEADER = "x-confluo-stream-window"
+
+#: Holds the name of the AMQP header which contains the credits returned by a caller.
+#: Zero credits cancel the stream.
+STREAM_CREDIT_HEADER = "x-confluo-stream-credit"
+
+#: Holds the time in seconds a stream waits for the next frame or credit before it is aborted.
+STREAM_IDLE_TIMEOUT = 60.0
+
+
+class StreamCredit:
+    """Holds the credits of a streaming handler to send frames.
+
+    :param int window: the number of frames the handler may send initially.
+    """
+    def __init__(self, window):
+        #: Holds the number of frames the handler may send.
+        self.available = window
+
+        #: Holds the flag if the caller cancelled the stream.
+        self.cancelled = False
+
+        #: Holds the event which is set when credits are granted.
+        self.granted = asyncio.Event()
+
+    async def acquire(self, timeout=STREAM_IDLE_TIMEOUT):
+        """Wait for the credit to send a frame.
+
+        :param float timeout: the time in seconds to wait for a credit.
+
+        :returns: if the frame may be sent. ``False`` if the stream was cancelled.
+        :rtype: bool
+
+        :raises asyncio.TimeoutError: if no credit was granted in time.
+        """
+        while self.available <= 0 and not self.cancelled:
+            self.granted.clear()
+            await asyncio.wait_for(self.granted.wait(), timeout)
+
+        if self.cancelled:
+            return False
+        self.available -= 1
+        return True
+
+    def grant(self, credits):
+        """Grant credits returned by the caller.
+
+        :param int credits: the number of returned credits. Zero cancels the stream.
+        """
+        if credits <= 0:
+            self.cancelled = True
+        else:
+            self.available += credits
+        self.granted.set()
+
+
+class ResponseStream:
+    """Represents a streamed response as async iterator over the chunks.
+
+    :param str path: the path of the command.
+    :param int window: the number of frames granted to the handler.
+    :param grant: the coroutine function to return credits to the handler.
+    :param float timeout: the time in seconds to wait for the next frame.
+    """
+    def __init__(self, path, window, grant, timeout=STREAM_IDLE_TIMEOUT):
+        #: Holds the path of the command.
+        self.path = path
+
+        #: Holds the number of frames granted to the handler.
+        self.window = window
+
+        #: Holds the coroutine function to return credits.
+        self.grant = grant
+
+        #: Holds the time to wait for the next frame.
+        self.timeout = timeout
+
+        #: Holds the received frames as tuples of response and end flag.
+        self.frames = asyncio.Queue()
+
+        #: Holds the number of consumed frames whose credits are not returned yet.
+        self.consumed = 0
+
+        #: Holds the flag if the stream is finished.
+        self.finished = False
+
+        #: Holds the function which is called once the stream is finished.
+        self.on_finish = None
+
+    def feed(self, response, end=False):
+        """Add a received frame to the stream.
+
+        :param Response response: the received response frame.
+        :param bool end: flag if it is the last frame.
+        """
+        self.frames.put_nowait((response, end))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.finished:
+            raise StopAsyncIteration
+
+        try:
+            response, end = await asyncio.wait_for(self.frames.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self._finish()
+            # the handler may still be alive, thus it is cancelled instead of stalling on credits.
+            await self.grant(0)
+            raise
+
+        if end:
+            self._finish()
+            if response.status_code >= 400:
+                raise ServiceError("Stream of '{0}' failed with status {1}: {2}".format(
+                    self.path, response.status_code, response.body))
+            raise StopAsyncIteration
+
+        # return the credits in batches of half the window.
+        self.consumed += 1
+        if self.consumed >= max(1, self.window // 2):
+            credits, self.consumed = self.consumed, 0
+            await self.grant(credits)
+        return response.body
+
+    async def aclose(self):
+        """Stop consuming the stream and cancel the handler."""
+        if not self.finished:
+            self._finish()
+            await self.grant(0)
+
+    def _finish(self):
+        """Mark the stream as finished."""
+        self.finished = True
+        if self.on_finish is not None:
+            self.on_finish()
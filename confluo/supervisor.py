@@ -0,0 +1,349 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the supervisor which runs a service in multiple worker processes.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import time
+import pickle
+import signal
+import socket
+import struct
+import asyncio
+import selectors
+
+from .errors import ServiceError
+from .metrics import PROMETHEUS_CONTENT_TYPE, label_gauges, merge_families, render_families
+
+
+#: Holds the struct of the length prefix of a metrics report.
+_REPORT_HEADER = struct.Struct("!I")
+
+
+def install_event_loop_policy(policy, logger):
+    """Install the event loop policy of a worker process.
+
+    :param policy: the event loop policy or ``uvloop`` to use uvloop if it is installed.
+    :param logging.Logger logger: the logger to report a missing uvloop to.
+    """
+    if policy is None:
+        return
+
+    if policy == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop is not installed. Using the default event loop policy.")
+            return
+        policy = uvloop.EventLoopPolicy()
+
+    asyncio.set_event_loop_policy(policy)
+
+
+class Supervisor:
+    """Runs a service in multiple forked worker processes.
+
+    All workers consume the same durable command and event queues.
+    Crashed workers are restarted. ``SIGINT`` and ``SIGTERM`` are
+    forwarded to the workers which drain their handlers before they exit.
+    If the service records metrics the workers report them to the supervisor
+    which serves the aggregated metrics.
+
+    :param Service service: the service to run.
+    :param str broker: the AMQP broker to connect to.
+    :param int workers: the number of worker processes.
+    :param event_loop_policy: the event loop policy of the workers or ``uvloop``.
+    :param int metrics_port: the port to serve the aggregated metrics on the local host on.
+    :param float report_interval: the interval in seconds in which the workers report their metrics.
+    :param float restart_delay: the minimum time in seconds between two starts of the same worker.
+    """
+    def __init__(self, service, broker, workers, event_loop_policy=None, metrics_port=None,
+                 report_interval=1.0, restart_delay=1.0):
+        if workers < 1:
+            raise ServiceError("At least one worker is required.")
+
+        #: Holds the service to run.
+        self.service = service
+
+        #: Holds the AMQP broker to connect to.
+        self.broker = broker
+
+        #: Holds the number of worker processes.
+        self.workers = workers
+
+        #: Holds the event loop policy of the workers.
+        self.event_loop_policy = event_loop_policy
+
+        #: Holds the port to serve the aggregated metrics on.
+        self.metrics_port = metrics_port
+
+        #: Holds the interval in which the workers report their metrics.
+        self.report_interval = report_interval
+
+        #: Holds the minimum time between two starts of the same worker.
+        self.restart_delay = restart_delay
+
+        #: Holds the running workers as tuples of index and metrics pipe by their process id.
+        self.processes = {}
+
+        #: Holds the time of the last start by worker index.
+        self.started = {}
+
+        #: Holds the latest metrics report by worker index.
+        self.reports = {}
+
+        #: Holds the summed up counters and histograms of all exited workers.
+        self.retired_report = []
+
+        #: Holds the received bytes of incomplete metrics reports by pipe.
+        self.buffers = {}
+
+        #: Holds the selector to wait for metrics reports and requests.
+        self.selector = None
+
+        #: Holds the server socket of the metrics endpoint.
+        self.server = None
+
+        #: Holds the flag if the workers are shutting down.
+        self.stopping = False
+
+    @property
+    def logger(self):
+        """Get the logger of the supervised service."""
+        return self.service.logger
+
+    def run(self):
+        """Start the workers and supervise them until all of them exited."""
+        self.selector = selectors.DefaultSelector()
+        if self.metrics_port is not None and self.service.metrics is not None:
+            self.server = socket.create_server(("127.0.0.1", self.metrics_port))
+            self.server.setblocking(False)
+            self.selector.register(self.server, selectors.EVENT_READ, self._serve_metrics)
+
+        previous_handlers = {signum: signal.signal(signum, self._on_signal) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+
+            forwarded = False
+            while self.processes:
+                if self.stopping and not forwarded:
+                    self.logger.info("Stopping %d workers.", len(self.processes))
+                    for pid in self.processes:
+                        self._kill(pid, signal.SIGTERM)
+                    forwarded = True
+
+                for key, _ in self.selector.select(timeout=0.2):
+                    key.data(key.fileobj)
+                self._reap()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            if self.server is not None:
+                self.server.close()
+                self.server = None
+            self.selector.close()
+
+    def _on_signal(self, signum, frame):
+        """Start the graceful shutdown of all workers."""
+        self.stopping = True
+
+    @staticmethod
+    def _kill(pid, signum):
+        """Send a signal to a worker which may have exited already."""
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn(self, index):
+        """Fork a worker process.
+
+        :param int index: the index of the worker.
+        """
+        delay = self.started.get(index, 0) + self.restart_delay - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            exit_code = 1
+            try:
+                exit_code = self._run_worker(index, write_fd)
+            except BaseException:
+                self.logger.exception("Worker %d failed.", index)
+            finally:
+                # never return into the code of the supervisor.
+                os._exit(exit_code)
+
+        os.close(write_fd)
+        self.started[index] = time.monotonic()
+        self.processes[pid] = (index, read_fd)
+        self.selector.register(read_fd, selectors.EVENT_READ, self._read_report)
+        self.logger.info("Started worker %d with pid %d.", index, pid)
+
+    def _reap(self):
+        """Collect exited workers and restart crashed ones."""
+        while self.processes:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            if pid not in self.processes:
+                continue
+
+            # read the final report of the worker.
+            index, read_fd = self.processes[pid]
+            while self._read_report(read_fd):
+                pass
+            del self.processes[pid]
+            self.selector.unregister(read_fd)
+            os.close(read_fd)
+            self.buffers.pop(read_fd, None)
+
+            # the counters of an exited worker still count but its gauges are gone.
+            report = self.reports.pop(index, None)
+            if report is not None:
+                self.retired_report = merge_families(
+                    [self.retired_report, [family for family in report if family[1] != "gauge"]])
+
+            exit_code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                self.logger.info("Worker %d with pid %d exited with %d.", index, pid, exit_code)
+            else:
+                self.logger.error("Worker %d with pid %d exited with %d. Restarting it.", index, pid, exit_code)
+                self._spawn(index)
+
+    def _read_report(self, read_fd):
+        """Read the metrics reports sent by a worker.
+
+        :param int read_fd: the pipe of the worker.
+
+        :returns: if any data was read.
+        :rtype: bool
+        """
+        index = next((i for i, fd in self.processes.values() if fd == read_fd), None)
+        try:
+            data = os.read(read_fd, 65536)
+        except OSError:
+            return False
+
+        buffer = self.buffers.get(read_fd, b"") + data
+        while len(buffer) >= _REPORT_HEADER.size:
+            size, = _REPORT_HEADER.unpack_from(buffer)
+            if len(buffer) < _REPORT_HEADER.size + size:
+                break
+            report = buffer[_REPORT_HEADER.size:_REPORT_HEADER.size + size]
+            buffer = buffer[_REPORT_HEADER.size + size:]
+            if index is not None:
+                self.reports[index] = pickle.loads(report)
+        self.buffers[read_fd] = buffer
+        return bool(data)
+
+    def _serve_metrics(self, server):
+        """Answer a HTTP request with the aggregated metrics of all workers."""
+        try:
+            connection, _ = server.accept()
+        except BlockingIOError:
+            return
+
+        with connection:
+            connection.settimeout(1.0)
+            try:
+                request = b""
+                while b"\r\n\r\n" not in request and b"\n\n" not in request:
+                    data = connection.recv(4096)
+                    if not data:
+                        break
+                    request += data
+
+                body = render_families(self._merge_reports()).encode("utf-8")
+                connection.sendall("HTTP/1.0 200 OK\r\nContent-Type: {0}\r\nContent-Length: {1}\r\n\r\n".format(
+                    PROMETHEUS_CONTENT_TYPE, len(body)).encode("ascii") + body)
+            except OSError:
+                self.logger.warning("Failed to serve the metrics.")
+
+    def _merge_reports(self):
+        """Merge the metrics reports of all workers.
+
+        Counters and histograms are summed up over the running and exited workers.
+        The gauges of every running worker are reported with a ``worker`` label.
+
+        :returns: the merged metric families.
+        :rtype: list
+        """
+        reports = [label_gauges(report, "worker", index) for index, report in sorted(self.reports.items())]
+        return merge_families([self.retired_report] + reports)
+
+    def _run_worker(self, index, write_fd):
+        """Run the service in a worker process until it is stopped.
+
+        :param int index: the index of the worker.
+        :param int write_fd: the pipe to report the metrics to.
+
+        :returns: the exit code of the worker.
+        :rtype: int
+        """
+        # release the resources of the supervisor inherited by the fork.
+        self.selector.close()
+        if self.server is not None:
+            self.server.close()
+        for _, read_fd in self.processes.values():
+            os.close(read_fd)
+
+        install_event_loop_policy(self.event_loop_policy, self.logger)
+
+        service = self.service
+        service._prepare_worker()
+        loop = service.loop
+
+        stopped = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+
+        loop.run_until_complete(service.connect(self.broker))
+        self.logger.debug("Worker %d connected.", index)
+
+        reporter = None
+        if service.metrics is not None:
+            reporter = loop.create_task(self._report_metrics(write_fd))
+
+        loop.run_until_complete(stopped.wait())
+        self.logger.debug("Worker %d drains its handlers.", index)
+        if reporter is not None:
+            reporter.cancel()
+        loop.run_until_complete(service.shutdown())
+        if service.metrics is not None:
+            self._send_report(write_fd)
+        return 0
+
+    async def _report_metrics(self, write_fd):
+        """Report the metrics of a worker periodically.
+
+        :param int write_fd: the pipe to report the metrics to.
+        """
+        while True:
+            self._send_report(write_fd)
+            await asyncio.sleep(self.report_interval)
+
+    def _send_report(self, write_fd):
+        """Send the current metrics of a worker to the supervisor.
+
+        :param int write_fd: the pipe to report the metrics to.
+        """
+        report = pickle.dumps(self.service.metrics.families())
+        data = memoryview(_REPORT_HEADER.pack(len(report)) + report)
+        try:
+            while data:
+                data = data[os.write(write_fd, data):]
+        except OSError:
+            pass
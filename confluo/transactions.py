@@ -0,0 +1,170 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the table of in-flight command transactions.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import math
+import heapq
+import asyncio
+
+from .models import CommandTransaction
+
+
+class TransactionTable:
+    """Holds all in-flight command transactions of a service.
+
+    Every transaction is a plain future which is resolved with the
+    received response. The timeouts of all transactions are driven
+    by a single timer on a heap of deadlines. The timer is rounded up
+    to the given resolution so that transactions with nearby deadlines
+    are expired in one batch.
+
+    :param asyncio.BaseEventLoop loop: the event loop to create the futures and the timer in.
+    :param float resolution: the granularity in seconds in which transactions are expired.
+    """
+    def __init__(self, loop, resolution=0.05):
+        #: Holds the asyncio loop
+        self.loop = loop
+
+        #: Holds the granularity in which transactions are expired.
+        self.resolution = resolution
+
+        #: Holds all in-flight transactions by their message id.
+        self.transactions = {}
+
+        #: Holds the heap of deadlines and message ids.
+        self.deadlines = []
+
+        #: Holds the timer to expire the next batch of transactions.
+        self.timer = None
+
+        #: Holds the loop time at which the timer fires.
+        self.timer_when = None
+
+        #: Holds the number of expired transactions.
+        self.expired = 0
+
+    def add(self, message_id, timeout):
+        """Add a transaction for a sent command.
+
+        :param str message_id: the id of the sent command message.
+        :param float timeout: the timeout in seconds to wait for the response.
+                              ``None`` waits without a limit.
+
+        :returns: the added transaction
+        :rtype: CommandTransaction
+        """
+        now = self.loop.time()
+        deadline = now + timeout if timeout is not None else None
+        transaction = CommandTransaction(message_id, self.loop.create_future(), now, deadline)
+        self.transactions[message_id] = transaction
+        if deadline is None:
+            return transaction
+
+        heapq.heappush(self.deadlines, (deadline, message_id))
+
+        # drop the deadlines of finished transactions if they pile up.
+        if len(self.deadlines) > 2 * len(self.transactions) + 64:
+            self.deadlines = [(t.deadline, t.message_id) for t in self.transactions.values() if t.deadline is not None]
+            heapq.heapify(self.deadlines)
+
+        self._schedule()
+        return transaction
+
+    def resolve(self, message_id, response):
+        """Resolve the transaction of the given message with a response.
+
+        :param str message_id: the id of the command message.
+        :param Response response: the received response.
+
+        :returns: if a transaction for the message was in-flight.
+        :rtype: bool
+        """
+        transaction = self.transactions.pop(message_id, None)
+        if transaction is None:
+            return False
+
+        if not transaction.future.done():
+            transaction.future.set_result(response)
+        return True
+
+    def discard(self, message_id):
+        """Remove the transaction of the given message without resolving it.
+
+        :param str message_id: the id of the command message.
+        """
+        self.transactions.pop(message_id, None)
+
+    def fail(self, error):
+        """Fail all in-flight transactions.
+
+        :param Exception error: the error to raise in the callers.
+        """
+        transactions, self.transactions = self.transactions, {}
+        for transaction in transactions.values():
+            if not transaction.future.done():
+                transaction.future.set_exception(error)
+
+    def oldest_age(self):
+        """Get the age of the oldest in-flight transaction.
+
+        :returns: the age in seconds or ``None`` if no transaction is in-flight.
+        :rtype: float
+        """
+        # the transactions are inserted in the order they are started.
+        for transaction in self.transactions.values():
+            return self.loop.time() - transaction.started
+        return None
+
+    def ages(self):
+        """Get the ages of all in-flight transactions.
+
+        :returns: the age in seconds by message id.
+        :rtype: dict
+        """
+        now = self.loop.time()
+        return {message_id: now - t.started for message_id, t in self.transactions.items()}
+
+    def _schedule(self):
+        """Schedule the timer for the earliest deadline."""
+        if not self.deadlines:
+            return
+
+        when = math.ceil(self.deadlines[0][0] / self.resolution) * self.resolution
+        if self.timer is not None:
+            if self.timer_when <= when:
+                return
+            self.timer.cancel()
+
+        self.timer = self.loop.call_at(when, self._expire)
+        self.timer_when = when
+
+    def _expire(self):
+        """Expire all transactions with a passed deadline."""
+        # the loop may fire the timer slightly before its scheduled time.
+        now = max(self.loop.time(), self.timer_when)
+        self.timer = None
+        self.timer_when = None
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, message_id = heapq.heappop(self.deadlines)
+            transaction = self.transactions.get(message_id)
+            if transaction is None or transaction.deadline != deadline:
+                continue
+
+            del self.transactions[message_id]
+            self.expired += 1
+            if not transaction.future.done():
+                transaction.future.set_exception(asyncio.TimeoutError())
+
+        self._schedule()
+
+    def __contains__(self, message_id):
+        return message_id in self.transactions
+
+    def __len__(self):
+        return len(self.transactions)
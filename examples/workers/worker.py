@@ -16,7 +16,7 @@ __BROKER_HOST__ = "172.17.0.2"
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
 
-    worker = Service("Worker", loop=loop)
+    worker = Service("Worker", loop=loop, concurrency=10)
 
     # logging.basicConfig(level=logging.DEBUG)
 
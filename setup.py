@@ -31,10 +31,18 @@ setup(
 
     url="https://github.com/timofurrer/confluo",
 
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "tests"]),
     include_package_data=True,
 
+    python_requires=">=3.9",
     install_requires=["aioamqp"],
+    extras_require={
+        "orjson": ["orjson"],
+        "msgpack": ["msgpack"],
+        "uvloop": ["uvloop"],
+        "lz4": ["lz4"],
+        "zstd": ["zstandard"],
+    },
 
     keywords=[
         "confluo", "service",
@@ -46,7 +54,9 @@ setup(
     classifiers=[
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "Operating System :: OS Independent",
         "Environment :: Console",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,30 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the fixtures shared by the tests.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import aioamqp
+import pytest
+
+from benchmarks import memamqp
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    """Connect the services to an in-memory broker."""
+    monkeypatch.setattr(aioamqp, "connect", aioamqp.connect)
+    return memamqp.install()
+
+
+@pytest.fixture
+def loop():
+    """Create an event loop for the services."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
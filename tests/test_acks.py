@@ -0,0 +1,120 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the acknowledgement of received messages.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from confluo import Service
+from confluo.acks import Acknowledger
+
+
+class RecordingChannel:
+    """Records the acknowledgements sent on a channel."""
+    def __init__(self):
+        self.acks = []
+
+    async def basic_client_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+def properties(**values):
+    """Create the AMQP properties of a received message."""
+    defaults = {"content_type": "application/json", "content_encoding": None, "headers": None,
+                "message_id": "1", "correlation_id": None, "reply_to": None, "priority": None}
+    defaults.update(values)
+    return SimpleNamespace(**defaults)
+
+
+async def receive_undecodable(method, acker_attribute, **values):
+    """Receive an undecodable message and return the acknowledger of its consumer."""
+    service = Service("A", prefetch_count=4)
+    channel = RecordingChannel()
+    acker = Acknowledger(channel, asyncio.get_event_loop(), 1, 0.01)
+    setattr(service, acker_attribute, acker)
+    await getattr(service, method)(channel, b"{}", SimpleNamespace(delivery_tag=7), properties(**values))
+    await acker.flush()
+    return acker, channel
+
+
+def test_undecodable_command_is_acknowledged():
+    for values in [{"content_encoding": "deflate"}, {"content_type": "application/unknown"}, {}]:
+        acker, channel = asyncio.run(receive_undecodable("_on_command", "command_acker", **values))
+        assert not acker.unacked
+        assert channel.acks == [(7, True)]
+
+
+def test_undecodable_event_is_acknowledged():
+    acker, channel = asyncio.run(receive_undecodable("_on_event", "event_acker", content_encoding="deflate"))
+    assert not acker.unacked
+    assert channel.acks == [(7, True)]
+
+
+def test_callback_runs_once_the_ack_is_sent():
+    async def ack():
+        channel = RecordingChannel()
+        acker = Acknowledger(channel, asyncio.get_running_loop(), 10, 60.0)
+        sent = []
+        acker.track(1)
+        acker.after_ack(1, lambda: sent.append(list(channel.acks)))
+        await acker.ack(1)
+        before_flush = list(sent)
+        await acker.flush()
+        acker.after_ack(1, lambda: sent.append("acked"))
+        return before_flush, sent
+
+    assert asyncio.run(ack()) == ([], [[(1, True)], "acked"])
+
+
+def test_callback_is_dropped_with_the_discarded_messages():
+    async def discard():
+        acker = Acknowledger(RecordingChannel(), asyncio.get_running_loop(), 10, 60.0)
+        called = []
+        acker.track(1)
+        acker.after_ack(1, lambda: called.append(1))
+        await acker.ack(1)
+        acker.discard()
+        acker.after_ack(2, lambda: called.append(2))
+        await acker.flush()
+        return called
+
+    assert asyncio.run(discard()) == []
+
+
+def test_flushes_do_not_overlap():
+    class BlockingChannel(RecordingChannel):
+        """Blocks the first acknowledgement until it is released and yields on every acknowledgement."""
+        def __init__(self):
+            super().__init__()
+            self.released = asyncio.Event()
+
+        async def basic_client_ack(self, delivery_tag, multiple=False):
+            if not self.acks:
+                await self.released.wait()
+            await asyncio.sleep(0)
+            await super().basic_client_ack(delivery_tag, multiple)
+
+    async def flush():
+        channel = BlockingChannel()
+        acker = Acknowledger(channel, asyncio.get_running_loop(), 10, 60.0)
+        for delivery_tag in range(1, 5):
+            acker.track(delivery_tag)
+        await acker.ack(2)
+        await acker.ack(3)
+        first = asyncio.ensure_future(acker.flush())
+        await asyncio.sleep(0)
+        # the first flush is still sending the single acknowledgements of 2 and 3.
+        await acker.ack(1)
+        await acker.ack(4)
+        second = asyncio.ensure_future(acker.flush())
+        await asyncio.sleep(0)
+        channel.released.set()
+        await asyncio.gather(first, second)
+        return channel.acks
+
+    assert asyncio.run(flush()) == [(2, False), (3, False), (4, True)]
@@ -0,0 +1,198 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the offloading of large bodies to a blob store.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from confluo import Service
+from confluo.acks import Acknowledger
+from confluo.blobs import BLOB_HEADER, DirectoryBlobStore
+from confluo.errors import ServiceError
+from confluo.models import Command, Event
+
+
+class RecordingBlobStore(DirectoryBlobStore):
+    """Directory blob store recording the reads and deletes of blobs."""
+    def __init__(self, path):
+        super().__init__(path)
+        self.reads = []
+        self.deletes = []
+
+    def get(self, reference):
+        self.reads.append(reference)
+        return super().get(reference)
+
+    def delete(self, reference):
+        self.deletes.append(reference)
+        super().delete(reference)
+
+
+class RecordingChannel:
+    """Records the acknowledgements sent on a channel."""
+    def __init__(self):
+        self.acks = []
+
+    async def basic_client_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+def properties(headers):
+    """Create the AMQP properties of a received message."""
+    return SimpleNamespace(content_type="application/json", content_encoding=None, headers=headers,
+                           message_id="1", correlation_id=None, reply_to=None, priority=None)
+
+
+@pytest.mark.parametrize("body, offloaded", [("x" * 100, False), ("x" * 2000, True)])
+def test_bodies_above_the_threshold_are_offloaded(tmp_path, body, offloaded):
+    service = Service("A", loop=asyncio.new_event_loop(), blob_store=str(tmp_path), blob_threshold=1024)
+    message_properties = {}
+    payload = service._encode(Command("/upload", None, body), service.codec, message_properties)
+    service.loop.close()
+
+    assert (BLOB_HEADER in message_properties["headers"]) is offloaded
+    assert len(os.listdir(str(tmp_path))) == int(offloaded)
+    assert (len(payload) < len(body)) is offloaded
+
+
+def test_offloaded_body_is_read_on_first_access(tmp_path):
+    store = RecordingBlobStore(str(tmp_path))
+    sender = Service("A", loop=asyncio.new_event_loop(), blob_store=store, blob_threshold=0)
+    receiver = Service("B", loop=sender.loop, blob_store=store)
+    message_properties = {}
+    payload = sender._encode(Command("/upload", None, {"data": "x"}), sender.codec, message_properties)
+    sender.loop.close()
+
+    command, _ = receiver._decode(Command, payload, properties(message_properties["headers"]))
+    assert command.path == "/upload" and store.reads == []
+    assert command.body == {"data": "x"}
+    assert store.reads == [message_properties["headers"][BLOB_HEADER]]
+
+
+def test_command_and_response_blobs_are_deleted_after_a_call(broker, tmp_path):
+    store = RecordingBlobStore(str(tmp_path))
+
+    async def call():
+        caller = Service("A", blob_store=store, blob_threshold=0)
+        callee = Service("B", blob_store=store, blob_threshold=0, ack_mode="after")
+
+        @callee.route("/echo")
+        async def echo(path, query, headers, body):
+            return body
+
+        await callee.connect("memory")
+        await caller.connect("memory")
+        try:
+            response = await caller.call("B", "/echo", {"data": "x"}, timeout=1.0)
+            assert response.body == {"data": "x"}
+            # the response blob is deleted once its body is read.
+            assert store.reads[-1] in store.deletes
+            assert store.reads[-1] not in os.listdir(str(tmp_path))
+        finally:
+            await caller.shutdown()
+            await callee.shutdown()
+
+    asyncio.run(call())
+    # the command blob is deleted once its acknowledgement is sent.
+    assert os.listdir(str(tmp_path)) == []
+    assert len(store.deletes) == 2
+
+
+def test_missing_blob_is_reported(tmp_path):
+    store = DirectoryBlobStore(str(tmp_path))
+    reference = store.put(b"data")
+    assert bytes(store.get(reference)) == b"data"
+    store.delete(reference)
+    store.delete(reference)
+
+    with pytest.raises(ServiceError):
+        store.get(reference)
+    with pytest.raises(ServiceError):
+        store.get("../etc/passwd")
+
+
+def test_offloaded_body_without_blob_store_is_reported(tmp_path):
+    sender = Service("A", loop=asyncio.new_event_loop(), blob_store=str(tmp_path), blob_threshold=0)
+    receiver = Service("B", loop=sender.loop)
+    message_properties = {}
+    payload = sender._encode(Command("/upload", None, "data"), sender.codec, message_properties)
+    sender.loop.close()
+
+    command, _ = receiver._decode(Command, payload, properties(message_properties["headers"]))
+    with pytest.raises(ServiceError):
+        command.body
+
+
+def test_event_with_expired_blob_is_acknowledged(tmp_path):
+    async def receive():
+        service = Service("A", prefetch_count=4, blob_store=str(tmp_path), blob_threshold=0, metrics=True)
+        received = []
+
+        @service.subscribe("/uploaded")
+        async def uploaded(path, headers, body):
+            received.append(body)
+
+        acker = service.event_acker = Acknowledger(RecordingChannel(), asyncio.get_running_loop(), 1, 60.0)
+        message_properties = {}
+        payload = service._encode(Event("/uploaded", "data"), service.codec, message_properties)
+        service.blob_store.delete(message_properties["headers"][BLOB_HEADER])
+
+        await service._on_event(acker.channel, payload, SimpleNamespace(delivery_tag=7),
+                                properties(message_properties["headers"]))
+        await acker.flush()
+        return received, acker, service.metrics.undecodable
+
+    received, acker, undecodable = asyncio.run(receive())
+    assert received == []
+    assert not acker.unacked
+    assert acker.channel.acks == [(7, True)]
+    assert undecodable == {"event": 1}
+
+
+async def handle_offloaded_command(blob_path, flush):
+    """Handle a command with an offloaded body and return if its blob exists before and after the ack.
+
+    :param str blob_path: the directory of the blob store.
+    :param bool flush: flag if the acknowledgement is sent or the connection is lost.
+    """
+    service = Service("A", prefetch_count=4, blob_store=blob_path, blob_threshold=0)
+    received = []
+
+    @service.route("/upload")
+    async def upload(path, query, headers, body):
+        received.append(body)
+
+    acker = service.command_acker = Acknowledger(RecordingChannel(), asyncio.get_running_loop(), 10, 60.0)
+    message_properties = {}
+    payload = service._encode(Command("/upload", None, "data"), service.codec, message_properties)
+    reference = message_properties["headers"][BLOB_HEADER]
+
+    await service._on_command(acker.channel, payload, SimpleNamespace(delivery_tag=7),
+                              properties(message_properties["headers"]))
+    handled = service.blob_store.get(reference) is not None
+    if flush:
+        await acker.flush()
+    else:
+        service._connection_lost()
+    try:
+        service.blob_store.get(reference)
+        exists = True
+    except ServiceError:
+        exists = False
+    return received, handled, exists
+
+
+def test_offloaded_body_is_deleted_once_the_command_is_acknowledged(tmp_path):
+    assert asyncio.run(handle_offloaded_command(str(tmp_path), True)) == (["data"], True, False)
+
+
+def test_offloaded_body_is_kept_for_the_redelivery_of_an_unacknowledged_command(tmp_path):
+    assert asyncio.run(handle_offloaded_command(str(tmp_path), False)) == (["data"], True, True)
@@ -0,0 +1,68 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the response cache.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from confluo import Service
+
+
+async def cached_calls(users):
+    """Call a cacheable route one after another with the user in the headers.
+
+    :param list users: the user of every call.
+
+    :returns: the response bodies and the number of handled commands.
+    :rtype: tuple
+    """
+    handled = []
+    caller = Service("A", response_cache_size=16)
+    callee = Service("B")
+
+    @callee.route("/whoami", max_age=60)
+    async def whoami(path, query, headers, body):
+        handled.append(headers)
+        return headers["user"]
+
+    await callee.connect("memory")
+    await caller.connect("memory")
+    try:
+        responses = [await caller.call("B", "/whoami", None, headers={"user": user}, timeout=1.0) for user in users]
+    finally:
+        await caller.shutdown()
+        await callee.shutdown()
+    return [response.body for response in responses], len(handled)
+
+
+def test_cached_response_is_only_returned_for_the_same_headers(broker):
+    assert asyncio.run(cached_calls(["alice", "bob", "alice", "bob"])) == (["alice", "bob", "alice", "bob"], 2)
+
+
+def test_error_response_is_not_cached(broker):
+    async def call():
+        handled = []
+        caller = Service("A", response_cache_size=16)
+        callee = Service("B")
+
+        @callee.route("/flaky", max_age=60)
+        async def flaky(path, query, headers, body):
+            handled.append(body)
+            if len(handled) == 1:
+                return "failed", 500, None
+            return "ok"
+
+        await callee.connect("memory")
+        await caller.connect("memory")
+        try:
+            responses = [await caller.call("B", "/flaky", None, timeout=1.0) for _ in range(3)]
+        finally:
+            await caller.shutdown()
+            await callee.shutdown()
+        return [(response.status_code, response.body) for response in responses], len(handled), len(caller.response_cache)
+
+    assert asyncio.run(call()) == ([(500, "failed"), (200, "ok"), (200, "ok")], 2, 1)
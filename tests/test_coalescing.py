@@ -0,0 +1,88 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the coalescing of identical in-flight calls.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from confluo import Service
+
+
+async def concurrent_calls(calls):
+    """Call a service concurrently with coalescing.
+
+    :param list calls: the headers and priority of every call.
+
+    :returns: the response bodies and the number of handled commands.
+    :rtype: tuple
+    """
+    handled = []
+    caller = Service("A", coalesce_calls=True)
+    callee = Service("B")
+
+    @callee.route("/whoami")
+    async def whoami(path, query, headers, body):
+        handled.append(headers)
+        await asyncio.sleep(0.05)
+        return headers["user"]
+
+    await callee.connect("memory")
+    await caller.connect("memory")
+    try:
+        responses = await asyncio.gather(*[
+            caller.call("B", "/whoami", None, headers=headers, priority=priority) for headers, priority in calls])
+    finally:
+        await caller.shutdown()
+        await callee.shutdown()
+    return [response.body for response in responses], len(handled)
+
+
+def test_identical_calls_are_coalesced(broker):
+    calls = [({"user": "alice"}, None)] * 3
+    assert asyncio.run(concurrent_calls(calls)) == (["alice"] * 3, 1)
+
+
+def test_calls_with_other_headers_or_priority_are_not_coalesced(broker):
+    calls = [({"user": "alice"}, None), ({"user": "bob"}, None), ({"user": "alice"}, 5)]
+    assert asyncio.run(concurrent_calls(calls)) == (["alice", "bob", "alice"], 3)
+
+
+async def concurrent_streams(count):
+    """Consume a streamed response with concurrent identical calls.
+
+    :param int count: the number of concurrent calls.
+
+    :returns: the chunks received by every caller and the number of handled commands.
+    :rtype: tuple
+    """
+    handled = []
+    caller = Service("A", coalesce_calls=True)
+    callee = Service("B")
+
+    @callee.route("/numbers")
+    async def numbers(path, query, headers, body):
+        handled.append(path)
+        for number in range(10):
+            yield number
+
+    await callee.connect("memory")
+    await caller.connect("memory")
+
+    async def consume():
+        stream = await caller.call("B", "/numbers", None, timeout=1.0)
+        return [chunk async for chunk in stream]
+
+    try:
+        chunks = await asyncio.wait_for(asyncio.gather(*[consume() for _ in range(count)]), 5.0)
+        return chunks, len(handled)
+    finally:
+        await caller.shutdown()
+        await callee.shutdown()
+
+
+def test_streamed_responses_are_not_shared(broker):
+    assert asyncio.run(concurrent_streams(2)) == ([list(range(10))] * 2, 2)
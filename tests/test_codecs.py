@@ -0,0 +1,27 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the codecs.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import pytest
+
+from confluo.models import Response
+from confluo.codecs import JSONCodec, OrjsonCodec, get_codec, orjson
+
+
+@pytest.mark.parametrize("body", [{1: "a"}, 2 ** 70])
+def test_default_json_codec_serializes_like_the_standard_library(body):
+    codec = get_codec()
+    assert isinstance(codec, JSONCodec)
+    assert Response.loads(Response("/p", body).dumps(codec), codec).body == Response.loads(
+        Response("/p", body).dumps(JSONCodec()), JSONCodec()).body
+
+
+@pytest.mark.skipif(orjson is None, reason="requires orjson")
+@pytest.mark.parametrize("body", [{1: "a"}, 2 ** 70])
+def test_orjson_codec_falls_back_to_the_standard_library(body):
+    assert OrjsonCodec().dumps({"body": body}) == JSONCodec().dumps({"body": body})
@@ -0,0 +1,104 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the payload compression.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from confluo import Service
+from confluo.errors import ServiceError
+from confluo.models import Command
+from confluo.compression import Compressor, ZlibCompressor, ZstdCompressor, negotiate_compressor, zstandard
+
+
+class FastCompressor(Compressor):
+    """Stands in for an optional compressor which is not installed on every host."""
+    encoding = "fast"
+
+
+def test_commands_and_events_use_zlib_by_default(loop):
+    service = Service("A", loop=loop, compression=True)
+    assert service.message_compressor.encoding == ZlibCompressor.encoding
+
+
+def test_explicit_compressor_is_used_for_all_messages(loop):
+    compressor = FastCompressor()
+    service = Service("A", loop=loop, compression=compressor)
+    assert service.message_compressor is compressor
+    assert service.compressor is compressor
+
+
+def test_responses_use_an_accepted_encoding():
+    compressor = FastCompressor()
+    assert negotiate_compressor(compressor, "deflate,fast") is compressor
+    assert negotiate_compressor(compressor, "deflate").encoding == ZlibCompressor.encoding
+    assert negotiate_compressor(compressor, None) is None
+
+
+def test_decompression_is_limited_to_the_maximum_size():
+    compressor = ZlibCompressor()
+    payload = compressor.compress(b"x" * 4096)
+    assert compressor.decompress(payload, 4096) == b"x" * 4096
+    with pytest.raises(ServiceError):
+        compressor.decompress(payload, 4095)
+
+
+def test_truncated_payload_is_rejected():
+    compressor = ZlibCompressor()
+    payload = compressor.compress(b"x" * 4096)
+    with pytest.raises(ServiceError):
+        compressor.decompress(payload[:-4], 4096)
+
+
+@pytest.mark.skipif(zstandard is None, reason="requires zstandard")
+@pytest.mark.parametrize("content_size", [True, False])
+def test_truncated_zstd_payload_is_rejected(content_size):
+    payload = zstandard.ZstdCompressor(write_content_size=content_size).compress(b"x" * 4096 + bytes(range(256)))
+    assert ZstdCompressor().decompress(payload, 8192) == b"x" * 4096 + bytes(range(256))
+    with pytest.raises(ServiceError):
+        ZstdCompressor().decompress(payload[:-4], 8192)
+
+
+def received(service, model):
+    """Encode a model compressed with zlib as the AMQP payload and properties of a received message."""
+    properties = {}
+    payload = service._encode(model, service.codec, properties, ZlibCompressor())
+    return payload, SimpleNamespace(content_type=properties["content_type"], headers=properties.get("headers"),
+                                    content_encoding=properties.get("content_encoding"))
+
+
+def test_oversized_decompressed_payload_is_rejected(loop):
+    service = Service("A", loop=loop, compression_threshold=0, max_decompressed_size=1024)
+    payload, properties = received(service, Command("/upload", None, "x" * 4096))
+    with pytest.raises(ServiceError):
+        service._decode(Command, payload, properties)
+
+
+def test_compressions_are_recorded_by_route_template(loop):
+    service = Service("A", loop=loop, metrics=True, compression_threshold=0)
+
+    @service.route("/users/{id}")
+    async def get_user(path, query, headers, body, id):
+        return body
+
+    for user_id in range(3):
+        payload, properties = received(service, Command("/users/{0}".format(user_id), None, "x" * 64))
+        service._decode(Command, payload, properties, service.command_routes)
+
+    assert sorted(service.metrics.compressions) == [("compress", "command", ""),
+                                                    ("decompress", "command", "/users/{id}")]
+
+
+def test_unknown_content_encoding_is_not_decompressed(loop):
+    service = Service("A", loop=loop)
+    properties = {}
+    payload = service._encode(Command("/upload", None, "data"), service.codec, properties)
+    command, _ = service._decode(Command, payload, SimpleNamespace(content_type=properties["content_type"],
+                                                                   headers=None, content_encoding="utf-8"))
+    assert command.body == "data"
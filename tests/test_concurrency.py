@@ -0,0 +1,87 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the concurrent handlers.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from benchmarks import memamqp
+from confluo import Service
+
+
+async def publish_jobs(count, **options):
+    """Publish jobs to a service whose route runs at most two handlers at once.
+
+    :param int count: the number of jobs to publish.
+    :param options: the options of the subscribing service.
+
+    :returns: the handled jobs, the most running handlers and the most handler tasks.
+    :rtype: tuple
+    """
+    handled = []
+    running = []
+    peaks = {"running": 0, "tasks": 0}
+    release = asyncio.Event()
+    publisher = Service("Publisher")
+    worker = Service("Worker", **options)
+
+    @worker.subscribe("/jobs", concurrency=2)
+    async def on_job(path, headers, body):
+        running.append(body)
+        peaks["running"] = max(peaks["running"], len(running))
+        await release.wait()
+        running.remove(body)
+        handled.append(body)
+
+    await worker.connect("memory")
+    await publisher.connect("memory")
+    try:
+        for job in range(count):
+            await publisher.publish("/jobs", job)
+            await asyncio.sleep(0.01)
+            peaks["tasks"] = max(peaks["tasks"], len(worker.handler_tasks))
+        release.set()
+        for _ in range(100):
+            if len(handled) == count:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await publisher.shutdown()
+        await worker.shutdown()
+    return sorted(handled), peaks["running"], peaks["tasks"]
+
+
+def test_route_concurrency_bounds_the_handler_tasks_without_a_service_concurrency(broker):
+    assert asyncio.run(publish_jobs(8)) == (list(range(8)), 2, 2)
+
+
+def test_service_concurrency_bounds_the_handler_tasks(broker):
+    assert asyncio.run(publish_jobs(8, concurrency=4)) == (list(range(8)), 2, 4)
+
+
+@pytest.mark.parametrize("options, expected", [
+    ({}, []),
+    ({"concurrency": 4}, [4, 4]),
+    ({"concurrency": 4, "prefetch_count": 16}, [16, 16]),
+])
+def test_prefetch_count_defaults_to_the_concurrency(broker, monkeypatch, options, expected):
+    prefetch_counts = []
+
+    async def basic_qos(channel, prefetch_count=None, **kwargs):
+        prefetch_counts.append(prefetch_count)
+
+    monkeypatch.setattr(memamqp.MemoryChannel, "basic_qos", basic_qos)
+
+    async def connect():
+        service = Service("A", **options)
+        await service.connect("memory")
+        await service.shutdown()
+
+    asyncio.run(connect())
+    assert prefetch_counts == expected
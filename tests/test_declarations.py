@@ -0,0 +1,86 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the cached declarations on connect.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from benchmarks import memamqp
+from confluo import Service
+
+
+def record_declarations(monkeypatch):
+    """Record the declarations and bindings made on the in-memory broker.
+
+    :returns: the list the declarations are recorded in.
+    :rtype: list
+    """
+    declared = []
+    memory_exchange_declare = memamqp.MemoryChannel.exchange_declare
+    memory_queue_declare = memamqp.MemoryChannel.queue_declare
+    memory_queue_bind = memamqp.MemoryChannel.queue_bind
+
+    async def exchange_declare(channel, exchange_name, type_name, **kwargs):
+        declared.append(("exchange", exchange_name, kwargs.get("durable", False)))
+        return await memory_exchange_declare(channel, exchange_name, type_name, **kwargs)
+
+    async def queue_declare(channel, queue_name="", **kwargs):
+        declared.append(("queue", queue_name, kwargs.get("durable", False)))
+        return await memory_queue_declare(channel, queue_name, **kwargs)
+
+    async def queue_bind(channel, queue_name, exchange_name, routing_key, **kwargs):
+        declared.append(("binding", routing_key, kwargs.get("no_wait", False)))
+        return await memory_queue_bind(channel, queue_name, exchange_name, routing_key, **kwargs)
+
+    monkeypatch.setattr(memamqp.MemoryChannel, "exchange_declare", exchange_declare)
+    monkeypatch.setattr(memamqp.MemoryChannel, "queue_declare", queue_declare)
+    monkeypatch.setattr(memamqp.MemoryChannel, "queue_bind", queue_bind)
+    return declared
+
+
+def worker(received):
+    """Create an instance of a service subscribed to three events."""
+    service = Service("Worker")
+    for path in ("/a", "/b", "/c"):
+        @service.subscribe(path)
+        async def on_event(path, headers, body):
+            received.append(path)
+    return service
+
+
+def test_durable_declarations_are_made_once_per_process(broker, monkeypatch):
+    declared = record_declarations(monkeypatch)
+
+    async def connect_instances():
+        received = []
+        first, second = worker(received), worker(received)
+        publisher = Service("Publisher")
+        await first.connect("memory")
+        first_declarations = list(declared)
+        declared.clear()
+        await second.connect("memory")
+        second_declarations = list(declared)
+        await publisher.connect("memory")
+        try:
+            await publisher.publish("/c", None)
+            await asyncio.sleep(0.05)
+        finally:
+            for service in (publisher, first, second):
+                await service.shutdown()
+        return first_declarations, second_declarations, received
+
+    first, second, received = asyncio.run(connect_instances())
+
+    # the events are bound in one batch which only waits for the last binding.
+    assert [entry for entry in first if entry[0] == "binding" and entry[1] in ("a", "b", "c")] == [
+        ("binding", "a", True), ("binding", "b", True), ("binding", "c", False)]
+    assert ("queue", "Worker", True) in first and ("queue", "Worker-events", True) in first
+
+    # the second instance only declares its exclusive response queue.
+    assert [entry for entry in second if entry[0] != "binding" and entry[2]] == []
+    assert [entry for entry in second if entry[0] == "binding" and entry[1] in ("a", "b", "c")] == []
+    assert received == ["/c"]
@@ -0,0 +1,204 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the in-process transport.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from confluo import Service, LocalTransport
+from confluo.errors import ServiceError
+
+
+def subscriber(name, received, **options):
+    """Create a service recording the events it receives."""
+    service = Service(name, **options)
+
+    @service.subscribe("/ticks")
+    async def on_tick(path, headers, body):
+        received.append((name, body))
+
+    return service
+
+
+async def publish_ticks(count):
+    """Publish ticks to a local and a remote instance of a subscriber connected to the broker.
+
+    :param int count: the number of ticks to publish.
+
+    :returns: the received ticks.
+    """
+    transport = LocalTransport()
+    received = []
+    publisher = Service("Publisher", local_transport=transport)
+    local = subscriber("A", received, local_transport=transport)
+    remote = subscriber("A", received)
+    services = [local, remote, publisher]
+    await local.connect("memory")
+    await remote.connect("memory")
+    await publisher.connect("memory")
+    try:
+        for tick in range(count):
+            await publisher.publish("/ticks", tick)
+        await asyncio.sleep(0.05)
+    finally:
+        for service in services:
+            await service.shutdown()
+    return received
+
+
+def test_event_is_handled_once_per_service(broker):
+    received = asyncio.run(publish_ticks(4))
+    assert sorted(body for _, body in received) == [0, 1, 2, 3]
+
+
+def test_event_is_delivered_locally_without_broker(broker):
+    async def publish():
+        transport = LocalTransport()
+        received = []
+        publisher = Service("Publisher", local_transport=transport)
+        local = subscriber("A", received, local_transport=transport)
+        await local.connect(None)
+        await publisher.connect(None)
+        await publisher.publish("/ticks", 1)
+        # the local handlers are drained on shutdown.
+        await local.shutdown()
+        return received
+
+    assert asyncio.run(publish()) == [("A", 1)]
+
+
+def test_failing_local_subscriber_does_not_block_the_publishing(broker):
+    async def publish():
+        transport = LocalTransport()
+        received = []
+        publisher = Service("Publisher", local_transport=transport)
+        local = Service("A", local_transport=transport)
+        remote = subscriber("B", received)
+        started = asyncio.Event()
+
+        @local.subscribe("/ticks")
+        async def on_tick(path, headers, body):
+            started.set()
+            await asyncio.sleep(0.05)
+            raise RuntimeError("failed")
+
+        await local.connect(None)
+        await remote.connect("memory")
+        await publisher.connect("memory")
+        try:
+            await publisher.publish("/ticks", 1)
+            # the publisher does not wait for the local handler.
+            assert not started.is_set()
+            await asyncio.sleep(0.1)
+            assert started.is_set()
+        finally:
+            for service in (local, remote, publisher):
+                await service.shutdown()
+        return received
+
+    assert asyncio.run(publish()) == [("B", 1)]
+
+
+def test_failed_call_many_cancels_the_started_local_calls():
+    async def call():
+        transport = LocalTransport()
+        caller = Service("Caller", local_transport=transport)
+        local = Service("Local", local_transport=transport)
+        started = asyncio.Event()
+
+        @local.route("/slow")
+        async def slow(path, query, headers, body):
+            started.set()
+            await asyncio.sleep(10)
+
+        await local.connect(None)
+        await caller.connect(None)
+        try:
+            # the remote command fails to be sent after the local command was started.
+            with pytest.raises(ServiceError):
+                await caller.call_many([("Local", "/slow", None), ("Remote", "/any", None)], timeout=5)
+            await asyncio.sleep(0.05)
+            return started.is_set(), len(caller.command_transactions)
+        finally:
+            await local.shutdown()
+            await caller.shutdown()
+
+    assert asyncio.run(call()) == (False, 0)
+
+
+def test_local_call_times_out_while_the_handler_runs():
+    async def call():
+        transport = LocalTransport()
+        caller = Service("Caller", local_transport=transport)
+        local = Service("Local", local_transport=transport)
+        cancelled = asyncio.Event()
+
+        @local.route("/slow")
+        async def slow(path, query, headers, body):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        await local.connect(None)
+        await caller.connect(None)
+        try:
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(asyncio.TimeoutError):
+                await caller.call("Local", "/slow", None, timeout=0.1)
+            elapsed = asyncio.get_running_loop().time() - started
+            await asyncio.sleep(0)
+            return elapsed, cancelled.is_set()
+        finally:
+            await local.shutdown()
+            await caller.shutdown()
+
+    elapsed, cancelled = asyncio.run(call())
+    assert elapsed < 0.2
+    assert cancelled
+
+
+def test_call_many_returns_local_and_remote_responses_in_order(broker):
+    async def call():
+        transport = LocalTransport()
+        caller = Service("Caller", local_transport=transport)
+        local = Service("Local", local_transport=transport)
+        remote = Service("Remote")
+
+        for service in (local, remote):
+            @service.route("/echo")
+            async def echo(path, query, headers, body):
+                return body
+
+            @service.route("/slow")
+            async def slow(path, query, headers, body):
+                await asyncio.sleep(1)
+
+        await local.connect(None)
+        await remote.connect("memory")
+        await caller.connect("memory")
+        try:
+            return await caller.call_many([
+                ("Local", "/echo", 1),
+                ("Remote", "/echo", 2),
+                ("Local", "/slow", 3),
+                ("Remote", "/echo", 4),
+                ("Remote", "/slow", 5),
+                ("Local", "/echo", 6),
+            ], timeout=0.2)
+        finally:
+            await caller.shutdown()
+            await local.shutdown()
+            await remote.shutdown()
+
+    results = asyncio.run(call())
+    assert [result.body for result in results[:2] + results[3:4] + results[5:]] == [1, 2, 4, 6]
+    assert isinstance(results[2], asyncio.TimeoutError)
+    assert isinstance(results[4], asyncio.TimeoutError)
@@ -0,0 +1,67 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the metrics endpoint.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import socket
+import asyncio
+
+from confluo import Service
+from confluo.metrics import Metrics, label_gauges, merge_families
+
+
+def test_run_serves_metrics_on_the_local_host(broker):
+    loop = asyncio.new_event_loop()
+    service = Service("metrics-service", loop=loop, metrics=True)
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    responses = []
+
+    async def scrape():
+        try:
+            # the endpoint is served once the service is connected.
+            for _ in range(100):
+                if service.metrics.server is not None:
+                    break
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            responses.append(await asyncio.wait_for(reader.read(), 5))
+            writer.close()
+        finally:
+            loop.stop()
+
+    loop.call_soon(loop.create_task, scrape())
+    service.run("memory", metrics_port=port)
+
+    assert responses and responses[0].startswith(b"HTTP/1.0 200")
+    assert [sockname[0] for sockname in (s.getsockname() for s in service.metrics.server.sockets)] == ["127.0.0.1"]
+
+    loop.run_until_complete(service.shutdown())
+    loop.close()
+
+
+def test_merge_sums_counters_and_histograms_and_keeps_labelled_gauges():
+    reports = []
+    for worker, age in enumerate((3.0, 7.0)):
+        metrics = Metrics()
+        metrics.observe_handler("command", "/orders", "success", 0.01)
+        metrics.collect("confluo_oldest_inflight_call_age_seconds", "gauge", "Age of the oldest call.", lambda: age)
+        reports.append(label_gauges(metrics.families(), "worker", worker))
+
+    samples = {(sample_name, labels): value
+               for _, _, _, family_samples in merge_families(reports)
+               for sample_name, labels, value in family_samples}
+
+    assert samples[("confluo_oldest_inflight_call_age_seconds", (("worker", "0"),))] == 3.0
+    assert samples[("confluo_oldest_inflight_call_age_seconds", (("worker", "1"),))] == 7.0
+    calls = (("kind", "command"), ("route", "/orders"), ("outcome", "success"))
+    assert samples[("confluo_handler_calls_total", calls)] == 2
+    assert samples[("confluo_handler_duration_seconds_count", (("kind", "command"), ("route", "/orders")))] == 2
@@ -0,0 +1,67 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the protocol models.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from confluo import Service
+from confluo.codecs import CODECS, JSONCodec, register_codec
+
+
+class RecordingCodec(JSONCodec):
+    """JSON codec recording every deserialized value."""
+    content_type = "application/x-recording+json"
+
+    def __init__(self):
+        self.decoded = []
+
+    def loads(self, payload):
+        data = super().loads(payload)
+        self.decoded.append(data)
+        return data
+
+
+@pytest.fixture
+def codec():
+    """Register a recording codec."""
+    codec = RecordingCodec()
+    register_codec(codec)
+    yield codec
+    del CODECS[codec.content_type]
+
+
+def test_lazy_bodies_are_only_decoded_on_access(broker, codec):
+    async def call():
+        caller = Service("A", codec=codec, lazy_body=True)
+        callee = Service("B", codec=codec, lazy_body=True)
+
+        @callee.route("/echo")
+        async def echo(path, query, headers, body):
+            return body
+
+        await callee.connect("memory")
+        await caller.connect("memory")
+        try:
+            await caller.call("B", "/unrouted", {"unrouted": True}, expect_response=False)
+            response = await caller.call("B", "/echo", {"echo": True}, timeout=1.0)
+            await asyncio.sleep(0.05)
+            decoded = list(codec.decoded)
+            return response, decoded, response.body
+        finally:
+            await caller.shutdown()
+            await callee.shutdown()
+
+    response, decoded, body = asyncio.run(call())
+    # the unrouted command is dropped without decoding its body.
+    assert {"unrouted": True} not in decoded
+    # the handler gets the decoded body, the caller did not access the response body yet.
+    assert decoded.count({"echo": True}) == 1
+    assert body == {"echo": True} and codec.decoded.count({"echo": True}) == 2
+    assert response.status_code == 200 and not hasattr(response, "__dict__")
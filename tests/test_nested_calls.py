@@ -0,0 +1,53 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of command handlers calling other services.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from confluo import Service
+
+
+async def nested_call(**options):
+    """Call a handler of service A which calls a handler of service B.
+
+    :param options: the options of service A.
+
+    :returns: the body of the response of service A.
+    """
+    service_a = Service("A", **options)
+    service_b = Service("B")
+
+    @service_a.route("/agg")
+    async def aggregate(path, query, headers, body):
+        response = await service_a.call("B", "/leaf", None, timeout=1.0)
+        return response.body
+
+    @service_b.route("/leaf")
+    async def leaf(path, query, headers, body):
+        return {"leaf": True}
+
+    await service_b.connect("memory")
+    await service_a.connect("memory")
+    try:
+        response = await service_a.call("A", "/agg", None, timeout=2.0)
+    finally:
+        await service_a.shutdown()
+        await service_b.shutdown()
+    return response.body
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"direct_reply_to": True},
+    {"shared_connection": True, "concurrency": 1},
+    {"shared_connection": True, "concurrency": 4, "direct_reply_to": True},
+])
+def test_nested_call(broker, options):
+    assert asyncio.run(nested_call(**options)) == {"leaf": True}
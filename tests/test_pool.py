@@ -0,0 +1,87 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the shared connection and the publisher channel pool.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import aioamqp
+import pytest
+
+from benchmarks import memamqp
+from confluo import Service
+from confluo.errors import ServiceError
+
+
+def test_concurrent_calls_spread_over_the_publisher_channels(broker, monkeypatch):
+    publishing = set()
+    used = []
+    overlaps = []
+    memory_publish = memamqp.MemoryChannel.basic_publish
+
+    async def basic_publish(channel, payload, exchange_name, routing_key, properties=None, **kwargs):
+        publishing.add(channel)
+        used.append(channel)
+        overlaps.append(len(publishing))
+        # let the other calls publish while this channel is checked out.
+        await asyncio.sleep(0.01)
+        publishing.discard(channel)
+        await memory_publish(channel, payload, exchange_name, routing_key, properties)
+
+    monkeypatch.setattr(memamqp.MemoryChannel, "basic_publish", basic_publish)
+
+    async def call():
+        caller = Service("A", publisher_channels=3)
+        callee = Service("B")
+
+        @callee.route("/echo")
+        async def echo(path, query, headers, body):
+            return body
+
+        await callee.connect("memory")
+        await caller.connect("memory")
+        try:
+            used.clear()
+            responses = await asyncio.gather(*[caller.call("B", "/echo", index, timeout=1.0) for index in range(12)])
+            commands = [channel for channel in used if channel.protocol is caller.command_protocol]
+            return [response.body for response in responses], commands, caller.publisher_pool.channels
+        finally:
+            await caller.shutdown()
+            await callee.shutdown()
+
+    bodies, commands, channels = asyncio.run(call())
+    assert bodies == list(range(12))
+    assert len(commands) == 12
+    assert set(commands) == set(channels) and len(channels) == 3
+    assert max(overlaps) >= 3
+
+
+def test_shared_connection_without_concurrency_is_rejected():
+    with pytest.raises(ServiceError):
+        Service("A", shared_connection=True)
+
+
+def test_shared_connection_opens_a_single_connection(broker, monkeypatch):
+    protocols = []
+    memory_connect = aioamqp.connect
+
+    async def connect(*args, **kwargs):
+        transport, protocol = await memory_connect(*args, **kwargs)
+        protocols.append(protocol)
+        return transport, protocol
+
+    monkeypatch.setattr(aioamqp, "connect", connect)
+
+    async def connect_service():
+        service = Service("A", shared_connection=True, concurrency=2, publisher_channels=2)
+        await service.connect("memory")
+        try:
+            return {service.command_protocol, service.response_protocol, service.event_protocol}
+        finally:
+            await service.shutdown()
+
+    assert asyncio.run(connect_service()) == set(protocols) and len(protocols) == 1
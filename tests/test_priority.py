@@ -0,0 +1,152 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the priority lanes.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from confluo import Service
+from confluo.errors import ServiceError
+from confluo.priority import PrioritySemaphore
+
+
+@pytest.mark.parametrize("options", [{"max_priority": 9}, {"shared_connection": True}])
+@pytest.mark.parametrize("ack_mode", ["auto", "before"])
+def test_waiting_messages_require_acks_after_the_handler(loop, options, ack_mode):
+    with pytest.raises(ServiceError):
+        Service("A", loop=loop, concurrency=4, ack_mode=ack_mode, **options)
+
+    service = Service("A", loop=loop, concurrency=4, **options)
+    with pytest.raises(ServiceError):
+        service.route("/command", ack=ack_mode)
+    with pytest.raises(ServiceError):
+        service.subscribe("/event", ack=ack_mode)
+
+
+def test_priority_lanes_without_concurrency_accept_every_ack_mode(loop):
+    service = Service("A", loop=loop, max_priority=9, ack_mode="auto")
+    service.route("/command", ack="before")
+
+
+async def serve_waiters(semaphore, priorities):
+    """Queue waiters on a full semaphore and release a slot for every waiter.
+
+    :param PrioritySemaphore semaphore: the semaphore without available slots.
+    :param list priorities: the priorities of the waiters in the order they start waiting.
+
+    :returns: the indices of the waiters in the order they acquired a slot.
+    :rtype: list
+    """
+    served = []
+
+    async def wait(index, priority):
+        await semaphore.acquire(priority)
+        served.append(index)
+
+    waiters = [asyncio.ensure_future(wait(index, priority)) for index, priority in enumerate(priorities)]
+    await asyncio.sleep(0)
+    for _ in priorities:
+        semaphore.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*waiters)
+    return served
+
+
+async def full_semaphore():
+    """Create a semaphore whose only slot is acquired."""
+    semaphore = PrioritySemaphore(1)
+    await semaphore.acquire()
+    return semaphore
+
+
+def test_higher_priority_lane_is_served_first_and_lanes_are_fifo():
+    async def serve():
+        return await serve_waiters(await full_semaphore(), [0, 0, 9, 9])
+
+    # the lanes start at the same virtual time, thus priority 0 gets the slot after the first of priority 9.
+    assert asyncio.run(serve()) == [2, 0, 3, 1]
+
+
+def test_lanes_are_served_by_their_weight():
+    async def serve():
+        return await serve_waiters(await full_semaphore(), [0] * 30 + [1] * 30)
+
+    served = asyncio.run(serve())
+    # priority 1 gets twice the slots of priority 0 while both are waiting.
+    assert sum(1 for index in served[:30] if index >= 30) == 20
+    assert [index for index in served if index < 30] == list(range(30))
+
+
+def test_idle_lane_does_not_save_up_slots():
+    async def serve():
+        semaphore = await full_semaphore()
+        # priority 9 is served alone for a while.
+        await serve_waiters(semaphore, [9] * 50)
+        return await serve_waiters(semaphore, [0, 0, 9, 9, 9])
+
+    # priority 0 starts at the current virtual time instead of overtaking priority 9 twice.
+    assert asyncio.run(serve()) == [0, 2, 3, 4, 1]
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def cancel():
+        semaphore = PrioritySemaphore(1)
+        await semaphore.acquire()
+        first = asyncio.ensure_future(semaphore.acquire(5))
+        second = asyncio.ensure_future(semaphore.acquire(0))
+        await asyncio.sleep(0)
+
+        # the slot is passed to the first waiter which is cancelled before it runs.
+        semaphore.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, 1.0)
+
+        # a waiter cancelled before a slot is passed is skipped.
+        third = asyncio.ensure_future(semaphore.acquire(9))
+        fourth = asyncio.ensure_future(semaphore.acquire(0))
+        await asyncio.sleep(0)
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+        semaphore.release()
+        await asyncio.wait_for(fourth, 1.0)
+
+        semaphore.release()
+        return semaphore.value, semaphore.waiting
+
+    assert asyncio.run(cancel()) == (1, {})
+
+
+@pytest.mark.parametrize("options, semaphore_type", [
+    ({}, asyncio.Semaphore),
+    ({"max_priority": 9}, PrioritySemaphore),
+])
+def test_semaphores_are_created_in_the_loop_running_the_handlers(loop, options, semaphore_type):
+    service = Service("A", loop=loop, concurrency=4, **options)
+
+    @service.route("/command", concurrency=2)
+    async def command(path, query, headers, body):
+        return body
+
+    route = service.command_routes.routes["/command"]
+    # a supervisor forks the workers before any semaphore is created.
+    assert service._handler_semaphore is None and route._semaphore is None
+
+    async def semaphores():
+        return service.handler_semaphore, route.semaphore
+
+    handler_semaphore, route_semaphore = asyncio.run(semaphores())
+    assert isinstance(handler_semaphore, semaphore_type) and isinstance(route_semaphore, asyncio.Semaphore)
+
+    service._prepare_worker()
+    try:
+        assert service._handler_semaphore is None and route._semaphore is None
+    finally:
+        asyncio.set_event_loop(None)
+        service.loop.close()
@@ -0,0 +1,49 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the buffered publisher.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+import pytest
+
+from confluo.publisher import BatchPublisher
+
+
+class FailingChannel:
+    """Fails to publish after the given number of messages."""
+    def __init__(self, fail_after):
+        self.fail_after = fail_after
+        self.published = []
+
+    async def basic_publish(self, payload, exchange_name, routing_key, properties):
+        if len(self.published) == self.fail_after:
+            raise ConnectionError("channel closed")
+        self.published.append(routing_key)
+
+
+def test_failed_send_fails_the_unsent_messages_and_releases_the_window():
+    async def run():
+        channel = FailingChannel(fail_after=1)
+        publisher = BatchPublisher(channel, asyncio.get_running_loop(), "events", batch_size=10, window=3)
+        futures = [await publisher.publish("event.{0}".format(i), b"{}", {}) for i in range(3)]
+
+        with pytest.raises(ConnectionError):
+            await publisher.send()
+
+        assert channel.published == ["event.0"]
+        assert not futures[0].done()
+        for future in futures[1:]:
+            assert isinstance(future.exception(), ConnectionError)
+        assert list(publisher.unconfirmed) == [1]
+
+        # the permits of the failed messages are available again.
+        channel.fail_after = None
+        await asyncio.wait_for(publisher.publish("event.3", b"{}", {}), 1)
+        await asyncio.wait_for(publisher.publish("event.4", b"{}", {}), 1)
+
+    asyncio.run(run())
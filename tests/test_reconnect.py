@@ -0,0 +1,191 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the reconnection and the outbound spool.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import asyncio
+from types import SimpleNamespace
+
+import aioamqp
+import pytest
+
+from benchmarks import memamqp
+from confluo import Service
+from confluo.spool import Spool
+
+
+def test_message_larger_than_ring_file_drops_only_itself(tmp_path):
+    spool = Spool(2, "drop-oldest", str(tmp_path / "spool.ring"), 4096)
+    spool.open()
+    for index in range(10):
+        assert spool.put(("event", "events", [index]))
+
+    assert not spool.put(("event", "events", [b"x" * 10240]))
+    assert spool.dropped == 1
+    assert len(spool) == 10
+    spool.close()
+
+
+def test_drop_oldest_evicts_from_the_ring_file_once_memory_is_drained(tmp_path):
+    spool = Spool(2, "drop-oldest", str(tmp_path / "spool.ring"), 256)
+    spool.open()
+    for index in range(6):
+        spool.put(("event", "events", index, b"x" * 40))
+    # draining takes the messages from memory first.
+    assert [spool.get()[2] for _ in range(2)] == [1, 2]
+    assert not spool.messages
+
+    assert spool.put(("event", "events", 6, b"x" * 40))
+    assert [message[2] for message in iter(spool.get, None)] == [4, 5, 6]
+    assert spool.dropped == 2
+    spool.close()
+
+
+@pytest.fixture
+def connections(broker, monkeypatch):
+    """Connect to an in-memory broker whose connections report their close like aioamqp
+    and whose second connect fails."""
+    memory_connect = aioamqp.connect
+    opened = []
+
+    async def connect(host="localhost", on_error=None, **kwargs):
+        if opened:
+            raise ConnectionRefusedError("broker down")
+        transport, protocol = await memory_connect(host)
+        memory_close = protocol.close
+
+        async def close():
+            await memory_close()
+            if on_error is not None:
+                on_error(aioamqp.ChannelClosed())
+
+        protocol.close = close
+        opened.append(protocol)
+        return transport, protocol
+
+    monkeypatch.setattr(aioamqp, "connect", connect)
+    return opened
+
+
+def test_failed_first_connect_does_not_reconnect(connections):
+    async def connect():
+        service = Service("A", reconnect=True)
+        with pytest.raises(ConnectionRefusedError):
+            await service.connect("memory")
+        await asyncio.sleep(0)
+        return service.reconnect_task
+
+    assert asyncio.run(connect()) is None
+    assert len(connections) == 1
+
+
+def test_failed_setup_closes_connections(broker, monkeypatch):
+    closed = []
+    memory_close = memamqp.MemoryProtocol.close
+
+    async def close(protocol):
+        closed.append(protocol)
+        await memory_close(protocol)
+
+    async def setup_events(service, broker):
+        raise ConnectionResetError("lost")
+
+    monkeypatch.setattr(memamqp.MemoryProtocol, "close", close)
+    monkeypatch.setattr(Service, "_setup_events", setup_events)
+
+    async def connect():
+        service = Service("A", reconnect=True)
+        with pytest.raises(ConnectionResetError):
+            await service.connect("memory")
+        return service.reconnect_task
+
+    assert asyncio.run(connect()) is None
+    assert len(closed) == 3
+
+
+@pytest.fixture
+def outage(broker, monkeypatch):
+    """Connect to an in-memory broker which refuses connections while it is down."""
+    memory_connect = aioamqp.connect
+    state = SimpleNamespace(down=False, on_errors=[])
+
+    async def connect(host="localhost", on_error=None, **kwargs):
+        if state.down:
+            raise ConnectionRefusedError("broker down")
+        state.on_errors.append(on_error)
+        return await memory_connect(host)
+
+    monkeypatch.setattr(aioamqp, "connect", connect)
+    return state
+
+
+def test_events_are_spooled_during_an_outage_and_sent_after_reconnect(outage, tmp_path):
+    async def publish_during_outage():
+        received = []
+        subscriber = Service("B")
+
+        @subscriber.subscribe("/ticks")
+        async def on_tick(path, headers, body):
+            received.append(body["tick"])
+
+        publisher = Service("A", reconnect=True, reconnect_delay=0.01, spool_size=2,
+                            spool_path=str(tmp_path / "spool.ring"), spool_file_size=1024)
+        await subscriber.connect("memory")
+        await publisher.connect("memory")
+
+        outage.down = True
+        outage.on_errors[-1](ConnectionResetError("lost"))
+        reconnect_task = publisher.reconnect_task
+        for tick in range(10):
+            await publisher.publish("/ticks", {"tick": tick, "padding": "x" * 40})
+        spooled = len(publisher.spool)
+
+        outage.down = False
+        await asyncio.wait_for(reconnect_task, 1.0)
+        await asyncio.sleep(0.05)
+        await publisher.shutdown()
+        await subscriber.shutdown()
+        return received, spooled, publisher.spool.dropped
+
+    received, spooled, dropped = asyncio.run(publish_during_outage())
+    # the oldest events are dropped once the spool is full, the others are sent in order.
+    assert received == list(range(10 - spooled, 10))
+    assert dropped == 10 - spooled > 0
+
+
+def test_shutdown_releases_the_ring_file(broker, tmp_path):
+    path = str(tmp_path / "spool.ring")
+
+    async def connect_and_shutdown():
+        service = Service("A", reconnect=True, spool_size=2, spool_path=path, spool_file_size=1024)
+        await service.connect("memory")
+        ring = service.spool.ring
+        await service.shutdown()
+        return ring
+
+    ring = asyncio.run(connect_and_shutdown())
+    assert ring.map.closed
+    assert not os.path.exists(path)
+
+
+def test_every_worker_opens_its_own_ring_file(tmp_path):
+    path = str(tmp_path / "spool.ring")
+    service = Service("A", loop=asyncio.new_event_loop(), reconnect=True, spool_size=2, spool_path=path,
+                      spool_file_size=1024)
+    service.loop.close()
+    # the ring file is not created before the fork.
+    assert service.spool.ring is None and not os.path.exists(path)
+
+    service._prepare_worker()
+    service.loop.close()
+    service.spool.open()
+    try:
+        assert service.spool.ring.path == "{0}.{1}".format(path, os.getpid())
+        assert os.listdir(str(tmp_path)) == ["spool.ring.{0}".format(os.getpid())]
+    finally:
+        service.spool.close()
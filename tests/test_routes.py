@@ -0,0 +1,37 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the routes.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import pytest
+
+from confluo.errors import ServiceError
+from confluo.models import Route
+
+
+async def coroutine_handler(path, query, headers, body):
+    return body
+
+
+async def streaming_handler(path, query, headers, body):
+    yield body
+
+
+def plain_handler(path, query, headers, body):
+    return body
+
+
+@pytest.mark.parametrize("handler", [coroutine_handler, streaming_handler])
+def test_async_handler_in_executor_is_rejected(handler):
+    with pytest.raises(ServiceError):
+        Route("/path", handler, executor="thread")
+
+
+def test_plain_handler_in_executor_is_accepted():
+    route = Route("/path", plain_handler, executor="thread")
+    assert route.executor is not None
+    route.executor.shutdown()
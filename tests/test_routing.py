@@ -0,0 +1,97 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the routers.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import pytest
+
+from confluo.errors import ServiceError
+from confluo.routing import TopicRouter, CommandRouter
+
+
+def topic_router(*patterns):
+    """Create a topic router whose routes are their patterns."""
+    router = TopicRouter()
+    for pattern in patterns:
+        router.add(pattern, pattern)
+    return router
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/users/created", ["/users/created", "/users/*", "/users/#", "/#"]),
+    ("/users", ["/users/#", "/#"]),
+    ("/users/1/orders", ["/users/#", "/#", "/users/*/orders"]),
+    ("/orders/created", ["/#"]),
+])
+def test_topic_wildcards(path, expected):
+    router = topic_router("/users/created", "/users/*", "/users/#", "/#", "/users/*/orders")
+    assert sorted(router.match(path)) == sorted(expected)
+
+
+def test_topic_pattern_is_registered_once():
+    router = topic_router("/users/*")
+    with pytest.raises(ServiceError):
+        router.add("/users/*", "/users/*")
+
+
+def command_router(*templates):
+    """Create a command router whose routes are their templates."""
+    router = CommandRouter()
+    for template in templates:
+        router.add(template, template)
+    return router
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/users/me", ("/users/me", {})),
+    ("/users/alice", ("/users/{id}", {"id": "alice"})),
+    ("/users/alice/orders/-7", ("/users/{id}/orders/{order_id:int}", {"id": "alice", "order_id": -7})),
+    ("/prices/1.5", ("/prices/{price:float}", {"price": 1.5})),
+])
+def test_command_parameters_are_extracted(path, expected):
+    router = command_router("/users/me", "/users/{id}", "/users/{id}/orders/{order_id:int}", "/prices/{price:float}")
+    assert router.match(path) == expected
+
+
+@pytest.mark.parametrize("path", [
+    "/users//orders/1",
+    "/users/",
+    "/users/alice/orders/1_000",
+    "/users/alice/orders/ 7",
+    "/users/alice/orders/7\n",
+    "/users/alice/orders/1.5",
+    "/prices/nan",
+    "/prices/1e",
+])
+def test_command_converter_failures_do_not_match(path):
+    router = command_router("/users/{id}", "/users/{id}/orders/{order_id:int}", "/prices/{price:float}")
+    assert router.match(path) is None
+
+
+@pytest.mark.parametrize("template", [
+    "/users/{id}",
+    "/users/{name}",
+    "/users/{id:int}/orders",
+    "/users/{id}/{name}",
+])
+def test_command_conflicts(template):
+    router = command_router("/users/{id}", "/users/{id}/{order}")
+    with pytest.raises(ServiceError):
+        router.add(template, template)
+
+
+def test_command_unknown_converter():
+    with pytest.raises(ServiceError):
+        command_router("/users/{id:uuid}")
+
+
+@pytest.mark.parametrize("name", ["path", "query", "headers", "body"])
+def test_command_reserved_parameter_name(name):
+    router = CommandRouter()
+    with pytest.raises(ServiceError):
+        router.add("/x/{{{0}}}".format(name), "/x")
+    assert router.match("/x/1") is None
@@ -0,0 +1,99 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the streamed responses.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import gc
+import asyncio
+
+import pytest
+
+from confluo import Service
+from confluo.errors import ServiceError
+
+
+async def stream_numbers(consume, first_delay=0.0):
+    """Call a streaming handler with a window of a single frame.
+
+    :param consume: the coroutine function consuming the call of the caller.
+    :param float first_delay: the time in seconds the handler waits before its first chunk.
+
+    :returns: the number of chunks the handler produced, if it was closed and the remaining response streams.
+    :rtype: tuple
+    """
+    produced = []
+    closed = asyncio.Event()
+    caller = Service("A", stream_window=1)
+    callee = Service("B")
+
+    @callee.route("/numbers")
+    async def numbers(path, query, headers, body):
+        try:
+            await asyncio.sleep(first_delay)
+            for number in range(100):
+                produced.append(number)
+                yield number
+        finally:
+            closed.set()
+
+    await callee.connect("memory")
+    await caller.connect("memory")
+    try:
+        await consume(caller)
+        await asyncio.wait_for(closed.wait(), 1.0)
+        return len(produced), closed.is_set(), len(caller.response_streams)
+    finally:
+        await caller.shutdown()
+        await callee.shutdown()
+
+
+def test_abandoned_stream_cancels_the_handler(broker):
+    async def abandon(caller):
+        stream = await caller.call("B", "/numbers", None, timeout=1.0)
+        assert await stream.__anext__() == 0
+        del stream
+        gc.collect()
+
+    produced, closed, streams = asyncio.run(stream_numbers(abandon))
+    assert closed and streams == 0
+    assert produced < 100
+
+
+def test_stream_timing_out_before_the_first_frame_cancels_the_handler(broker):
+    async def time_out(caller):
+        with pytest.raises(asyncio.TimeoutError):
+            await caller.call("B", "/numbers", None, timeout=0.05)
+
+    produced, closed, streams = asyncio.run(stream_numbers(time_out, first_delay=0.1))
+    assert closed and streams == 0
+    assert produced < 100
+
+
+def test_handler_timing_out_ends_the_stream_with_an_error(broker):
+    async def stream():
+        caller = Service("A")
+        callee = Service("B")
+
+        @callee.route("/numbers")
+        async def numbers(path, query, headers, body):
+            yield 0
+            raise asyncio.TimeoutError()
+
+        await callee.connect("memory")
+        await caller.connect("memory")
+        try:
+            stream = await caller.call("B", "/numbers", None, timeout=5.0)
+            assert await stream.__anext__() == 0
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(ServiceError):
+                await stream.__anext__()
+            return asyncio.get_running_loop().time() - started
+        finally:
+            await caller.shutdown()
+            await callee.shutdown()
+
+    assert asyncio.run(stream()) < 1.0
@@ -0,0 +1,81 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the worker supervisor.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import os
+import time
+import signal
+import socket
+import asyncio
+import threading
+
+from confluo import Service
+from confluo.supervisor import Supervisor
+
+
+def wait_until(condition, timeout=10.0):
+    """Wait until the condition is true.
+
+    :returns: if the condition became true in time.
+    :rtype: bool
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def scrape(port):
+    """Get the metrics served on the local host."""
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as connection:
+        connection.sendall(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = b""
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                return response.decode("utf-8")
+            response += data
+
+
+def test_supervisor_restarts_crashed_workers_and_aggregates_metrics(broker):
+    service = Service("supervised", loop=asyncio.new_event_loop(), metrics=True)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    supervisor = Supervisor(service, "memory", 2, metrics_port=port, report_interval=0.05, restart_delay=0)
+    observed = {}
+
+    def drive():
+        try:
+            assert wait_until(lambda: len(supervisor.reports) == 2)
+            crashed = next(pid for pid, (index, _) in list(supervisor.processes.items()) if index == 0)
+            os.kill(crashed, signal.SIGKILL)
+            assert wait_until(lambda: supervisor.retired_report and len(supervisor.reports) == 2)
+            observed["pids"] = (crashed, set(supervisor.processes))
+            observed["metrics"] = scrape(port)
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    driver = threading.Thread(target=drive)
+    driver.start()
+    supervisor.run()
+    driver.join()
+
+    crashed, pids = observed["pids"]
+    assert crashed not in pids and len(pids) == 2
+    assert not supervisor.processes
+    assert all(metric_type != "gauge" for _, metric_type, _, _ in supervisor.retired_report)
+
+    metrics = observed["metrics"]
+    assert metrics.startswith("HTTP/1.0 200")
+    gauges = [line for line in metrics.splitlines() if line.startswith("confluo_inflight_calls")]
+    assert len(gauges) == 2
+    assert any('worker="0"' in line for line in gauges) and any('worker="1"' in line for line in gauges)
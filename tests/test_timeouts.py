@@ -0,0 +1,43 @@
+"""
+    `confluo` - Minimalist scalable microservice framework for distributed systems using AMQP/RabbitMQ
+
+    This module contains the tests of the call timeouts.
+
+    :copyright: (c) by Timo Furrer
+    :license: MIT, see LICENSE for details
+"""
+
+import asyncio
+
+from confluo import Service, LocalTransport
+
+
+async def call_without_timeout(broker=None, **options):
+    """Call a service without a timeout.
+
+    :returns: the response body and the number of transactions left.
+    """
+    caller = Service("A", **options)
+    callee = Service("B", **options)
+
+    @callee.route("/slow")
+    async def slow(path, query, headers, body):
+        await asyncio.sleep(0.1)
+        return body
+
+    await callee.connect(broker)
+    await caller.connect(broker)
+    try:
+        response = await caller.call("B", "/slow", 42, timeout=None)
+        return response.body, len(caller.command_transactions)
+    finally:
+        await caller.shutdown()
+        await callee.shutdown()
+
+
+def test_call_without_timeout(broker):
+    assert asyncio.run(call_without_timeout("memory")) == (42, 0)
+
+
+def test_local_call_without_timeout():
+    assert asyncio.run(call_without_timeout(None, local_transport=LocalTransport())) == (42, 0)